@@ -9,7 +9,8 @@ from .models import (
     Specialty, Subject, Group, Profile, Course, Assignment, Submission,
     ProblemPrediction, StudentProgress, Recommendation, ScheduleEntry,
     Grade, Student, Enrollment, Lecture, Attendance,
-    SmartLearningProfile, ExamPrediction, PersonalizedStudyPlan
+    SmartLearningProfile, ExamPrediction, PersonalizedStudyPlan, IndexingJob,
+    PopularQuery
 )
 
 # ----------------- Specialty -----------------
@@ -520,6 +521,24 @@ class LectureAdmin(admin.ModelAdmin):
     list_filter = ('course', 'created_at')
     search_fields = ('title', 'content_text', 'course__name')
     ordering = ('-created_at',)
+    list_select_related = ('course',)
+    # Сам вектор (embedding_data) менеджер Lecture не загружает — показываем только метаданные
+    readonly_fields = ('embedding_model', 'embedding_dim', 'embedding_dtype')
+
+# ----------------- IndexingJob -----------------
+@admin.register(IndexingJob)
+class IndexingJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'index_name', 'status', 'stage', 'processed', 'total', 'created_by', 'created_at', 'finished_at')
+    list_filter = ('status', 'index_name')
+    ordering = ('-created_at',)
+    readonly_fields = ('pid', 'started_at', 'finished_at', 'updated_at')
+
+# ----------------- PopularQuery -----------------
+@admin.register(PopularQuery)
+class PopularQueryAdmin(admin.ModelAdmin):
+    list_display = ('query', 'count', 'last_seen')
+    search_fields = ('query',)
+    ordering = ('-count',)
 
 # ----------------- Attendance -----------------
 @admin.register(Attendance)
@@ -0,0 +1,175 @@
+"""
+FAISS-индексы разных уровней: точный flat, IVF и HNSW.
+
+Тип выбирается опцией index_lectures --index-type или автоматически по размеру
+корпуса. Параметры поиска (nprobe, efSearch) хранятся в embeddings_info.json
+и применяются воркерами при загрузке индекса.
+"""
+import math
+import time
+from typing import Any, Dict
+
+import numpy as np
+
+INDEX_TYPES = ("flat", "ivf", "hnsw")
+
+# Границы автоматического выбора типа индекса (число векторов)
+FLAT_MAX_VECTORS = 10_000
+IVF_MAX_VECTORS = 200_000
+
+DEFAULT_NPROBE = 16
+DEFAULT_EF_SEARCH = 64
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+
+# IVF переобучается, когда корпус вырос во столько раз с момента обучения
+IVF_RETRAIN_GROWTH = 4
+IVF_TRAIN_SAMPLE = 100_000
+ADD_CHUNK = 4096
+
+# Фильтр до стольких лекций дешевле проверить точным перебором по матрице:
+# HNSW с узким id-селектором не успевает дойти до разрешённых узлов графа
+EXACT_FILTER_MAX = 20_000
+
+
+def choose_index_type(n_vectors: int) -> str:
+    if n_vectors <= FLAT_MAX_VECTORS:
+        return "flat"
+    if n_vectors <= IVF_MAX_VECTORS:
+        return "ivf"
+    return "hnsw"
+
+
+def default_params(index_type: str, n_vectors: int) -> Dict[str, Any]:
+    if index_type == "ivf":
+        # ~4·sqrt(N) списков, но не меньше 39 обучающих точек на центроид
+        nlist = max(1, min(int(4 * math.sqrt(max(n_vectors, 1))), n_vectors // 39 or 1))
+        return {"nlist": nlist, "nprobe": min(DEFAULT_NPROBE, nlist), "trained_on": n_vectors}
+    if index_type == "hnsw":
+        return {"M": HNSW_M, "ef_construction": HNSW_EF_CONSTRUCTION, "ef_search": DEFAULT_EF_SEARCH}
+    return {}
+
+
+def supports_remove(index_type: str) -> bool:
+    # HNSW не умеет удалять векторы — такой индекс пересобирается из матрицы
+    return index_type != "hnsw"
+
+
+def build_index(store, index_type: str, params: Dict[str, Any]):
+    """
+    Строит индекс с id лекций из матрицы эмбеддингов (векторы уже нормированы,
+    поэтому скалярное произведение равно косинусной близости).
+    params["quantize"] (int8/pq) хранит в индексе коды вместо float32.
+    """
+    import faiss  # type: ignore
+
+    dim = store.dim
+    quantize = params.get("quantize", "none")
+    ip = faiss.METRIC_INNER_PRODUCT
+    sq8 = faiss.ScalarQuantizer.QT_8bit
+    if index_type == "ivf":
+        quantizer = faiss.IndexFlatIP(dim)
+        if quantize == "int8":
+            index = faiss.IndexIVFScalarQuantizer(quantizer, dim, params["nlist"], sq8, ip)
+        elif quantize == "pq":
+            index = faiss.IndexIVFPQ(quantizer, dim, params["nlist"], params["pq_m"], params["pq_nbits"], ip)
+        else:
+            index = faiss.IndexIVFFlat(quantizer, dim, params["nlist"], ip)
+    elif index_type == "hnsw":
+        if quantize == "int8":
+            inner = faiss.IndexHNSWSQ(dim, sq8, params["M"], ip)
+        elif quantize == "pq":
+            inner = faiss.IndexHNSWPQ(dim, params["pq_m"], params["M"], params["pq_nbits"], ip)
+        else:
+            inner = faiss.IndexHNSWFlat(dim, params["M"], ip)
+        inner.hnsw.efConstruction = params["ef_construction"]
+        index = faiss.IndexIDMap2(inner)
+    elif quantize == "int8":
+        index = faiss.IndexIDMap2(faiss.IndexScalarQuantizer(dim, sq8, ip))
+    elif quantize == "pq":
+        index = faiss.IndexIDMap2(faiss.IndexPQ(dim, params["pq_m"], params["pq_nbits"], ip))
+    else:
+        index = faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+
+    if not index.is_trained:
+        rng = np.random.default_rng(0)
+        sample = np.sort(rng.choice(len(store), size=min(len(store), IVF_TRAIN_SAMPLE), replace=False))
+        index.train(np.ascontiguousarray(store.matrix[sample]))
+
+    for i in range(0, len(store), ADD_CHUNK):
+        index.add_with_ids(
+            np.ascontiguousarray(store.matrix[i:i + ADD_CHUNK]),
+            np.asarray(store.ids[i:i + ADD_CHUNK]),
+        )
+    apply_search_params(index, index_type, params)
+    return index
+
+
+def apply_search_params(index, index_type: str, params: Dict[str, Any]) -> None:
+    import faiss  # type: ignore
+
+    if index_type == "ivf" and params.get("nprobe"):
+        faiss.extract_index_ivf(index).nprobe = int(params["nprobe"])
+    elif index_type == "hnsw" and params.get("ef_search"):
+        inner = faiss.downcast_index(index.index) if hasattr(index, "index") else index
+        inner.hnsw.efSearch = int(params["ef_search"])
+
+
+def search_parameters(index_type: str, params: Dict[str, Any], allowed_ids):
+    """
+    Параметры поиска с id-селектором: FAISS пропускает векторы лекций,
+    которых нет в allowed_ids, прямо во время обхода индекса.
+    """
+    import faiss  # type: ignore
+
+    selector = faiss.IDSelectorBatch(np.asarray(allowed_ids, dtype=np.int64))
+    if index_type == "ivf":
+        return faiss.SearchParametersIVF(sel=selector, nprobe=int(params.get("nprobe") or DEFAULT_NPROBE))
+    if index_type == "hnsw":
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=int(params.get("ef_search") or DEFAULT_EF_SEARCH))
+    return faiss.SearchParameters(sel=selector)
+
+
+def recall_report(index, store, k: int = 10, n_queries: int = 200, rerank: int = 0) -> Dict[str, Any]:
+    """
+    Сравнивает индекс с точным поиском по матрице на выборке векторов корпуса:
+    recall@k и среднее время запроса у обоих вариантов. При rerank > 0 ещё и
+    recall после точного пересчёта top_k · rerank кандидатов (квантованный индекс).
+    """
+    n = len(store)
+    if not n:
+        return {"k": k, "n_queries": 0, "recall_at_k": None}
+    k = min(k, n)
+    rng = np.random.default_rng(0)
+    rows = np.sort(rng.choice(n, size=min(n_queries, n), replace=False))
+    queries = np.ascontiguousarray(store.matrix[rows])
+
+    started = time.perf_counter()
+    _, found = index.search(queries, k)
+    ann_ms = (time.perf_counter() - started) * 1000.0 / len(rows)
+
+    # Точный top-k блоками строк матрицы (как VectorStore.search_batch), без матрицы близостей n_queries × N
+    started = time.perf_counter()
+    exact = [{key for key, _ in hits} for hits in store.search_batch(queries, k)]
+    exact_ms = (time.perf_counter() - started) * 1000.0 / len(rows)
+
+    hits = sum(len(set(found[i].tolist()) & exact[i]) for i in range(len(rows)))
+    report = {
+        "k": k,
+        "n_queries": int(len(rows)),
+        "recall_at_k": round(hits / (k * len(rows)), 4),
+        "ann_ms_per_query": round(ann_ms, 4),
+        "exact_ms_per_query": round(exact_ms, 4),
+    }
+    if rerank > 0:
+        from .quantization import rerank_hits
+
+        _, candidates = index.search(queries, k * rerank)
+        hits = 0
+        for i in range(len(rows)):
+            found_i = [(int(key), 0.0) for key in candidates[i] if key >= 0]
+            reranked = rerank_hits(store, queries[i], found_i, k)
+            hits += len({key for key, _ in reranked} & exact[i])
+        report["recall_at_k_reranked"] = round(hits / (k * len(rows)), 4)
+    return report
+
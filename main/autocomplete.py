@@ -0,0 +1,244 @@
+"""
+Подсказки для строки поиска ИИ-помощника.
+
+Словарь подсказок — заголовки лекций, названия курсов и популярные запросы
+(PopularQuery) — собирает index_lectures в models/suggest.json. Воркер держит
+его в памяти (см. SearchEngine) в двух структурах:
+
+* отсортированный список ключей — хвостов нормализованного текста с начала
+  каждого слова; префикс ищется bisect'ом, как спуск по префиксному дереву;
+* триграммный индекс (триграмма → номера подсказок) для запросов с опечаткой
+  или с середины слова, когда префиксных совпадений не хватило.
+
+Размер словаря ограничен settings.SUGGEST_MAX_ENTRIES (оставляются самые
+весомые подсказки), длина ключей — KEY_CHARS. При повторной индексации
+заново читаются только изменённые лекции.
+
+Запросы пользователей попадают в подсказки только при пересборке и только
+если их задавали не реже settings.SUGGEST_MIN_QUERY_COUNT раз: редкий запрос
+одного пользователя другим не показывается.
+"""
+import bisect
+import json
+import math
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .indexing import atomic_write_text
+from .models import Course, Lecture, PopularQuery
+from .text_analysis import default_analyzer, normalize_query
+
+SUGGEST_FILE = "suggest.json"
+DEFAULT_MAX_ENTRIES = 50_000
+KINDS = ("lecture", "course", "query")
+KIND_WEIGHTS = {"lecture": 1.0, "course": 2.0, "query": 1.0}
+
+MIN_PREFIX = 2
+# Ключ — не длиннее KEY_CHARS символов; более длинный префикс досверяется по тексту
+KEY_CHARS = 32
+# Ключей на подсказку: хвосты с начала первых MAX_WORD_STARTS слов
+MAX_WORD_STARTS = 6
+# Сколько ключей с общим префиксом просматривать (короткий префикс «а» не обходит весь словарь)
+SCAN_LIMIT = 2000
+# Доля общих триграмм, с которой подсказка считается похожей
+TRIGRAM_MIN_SIMILARITY = 0.5
+TEXT_MAX_CHARS = 120
+POPULAR_MAX = 5000
+DEFAULT_MIN_QUERY_COUNT = 5
+
+
+def max_entries() -> int:
+    return int(getattr(settings, "SUGGEST_MAX_ENTRIES", DEFAULT_MAX_ENTRIES))
+
+
+def min_query_count() -> int:
+    return int(getattr(settings, "SUGGEST_MIN_QUERY_COUNT", DEFAULT_MIN_QUERY_COUNT))
+
+
+def _normalize(text: str) -> str:
+    return " ".join(default_analyzer().normalize(text).split())
+
+
+def _trigrams(norm: str) -> List[str]:
+    padded = f" {norm} "
+    return sorted({padded[i:i + 3] for i in range(len(padded) - 2)})
+
+
+def _word_starts(norm: str) -> List[int]:
+    starts = [0] + [i + 1 for i, ch in enumerate(norm) if ch == " "]
+    return starts[:MAX_WORD_STARTS]
+
+
+def record_query(query: str) -> None:
+    """
+    Учитывает запрос в PopularQuery (атомарный счётчик). В подсказки он
+    попадёт при следующей сборке словаря, если наберёт min_query_count().
+    """
+    query = normalize_query(query)[:200]
+    if len(query) < MIN_PREFIX:
+        return
+    if not PopularQuery.objects.filter(query=query).update(count=F("count") + 1):
+        try:
+            with transaction.atomic():
+                PopularQuery.objects.create(query=query)
+        except IntegrityError:
+            PopularQuery.objects.filter(query=query).update(count=F("count") + 1)
+
+
+# ---------- Сборка (index_lectures) ----------
+
+
+def build_entries(
+    previous: Optional[Dict[str, Any]] = None, changed_lectures: Iterable[int] = (), full: bool = True
+) -> Dict[str, list]:
+    """
+    Собирает словарь подсказок: параллельные списки text/kind/ref/weight.
+    Если передан прежний словарь и full=False, заголовки неизменённых лекций
+    берутся из него, а из БД читаются только changed_lectures (новые,
+    изменённые, удалённые). Курсы и популярные запросы — небольшие таблицы,
+    они перечитываются целиком; запросы — только набравшие min_query_count().
+    """
+    lectures: Dict[int, str] = {}
+    changed = set(changed_lectures)
+    if previous and not full:
+        for text, kind, ref in zip(previous["text"], previous["kind"], previous["ref"]):
+            if kind == "lecture" and ref not in changed:
+                lectures[ref] = text
+        fetch = Lecture.objects.filter(id__in=list(changed))
+    else:
+        fetch = Lecture.objects.all()
+    for lec_id, title in fetch.values_list("id", "title").iterator(chunk_size=5000):
+        lectures[lec_id] = title
+
+    entries: List[Tuple[float, str, str, Optional[int]]] = []
+    for lec_id, title in lectures.items():
+        if title:
+            entries.append((KIND_WEIGHTS["lecture"], title[:TEXT_MAX_CHARS], "lecture", lec_id))
+    for course_id, name in Course.objects.values_list("id", "name"):
+        if name:
+            entries.append((KIND_WEIGHTS["course"], name[:TEXT_MAX_CHARS], "course", course_id))
+    popular = PopularQuery.objects.filter(count__gte=min_query_count()).order_by("-count")
+    for query, count in popular.values_list("query", "count")[:POPULAR_MAX]:
+        entries.append((KIND_WEIGHTS["query"] + math.log1p(count), query, "query", None))
+
+    # Ограничение памяти: самые весомые подсказки, при равенстве — по тексту
+    entries.sort(key=lambda e: (-e[0], e[1]))
+    entries = entries[:max_entries()]
+    return {
+        "text": [e[1] for e in entries],
+        "kind": [e[2] for e in entries],
+        "ref": [e[3] for e in entries],
+        "weight": [round(e[0], 4) for e in entries],
+    }
+
+
+def save(base: Path, entries: Dict[str, list]) -> Dict[str, Any]:
+    atomic_write_text(Path(base) / SUGGEST_FILE, json.dumps(entries, ensure_ascii=False))
+    return {"path": SUGGEST_FILE, "entries": len(entries["text"])}
+
+
+def read_entries(base: Path) -> Optional[Dict[str, list]]:
+    path = Path(base) / SUGGEST_FILE
+    if not path.exists():
+        return None
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+# ---------- Поиск (воркер) ----------
+
+
+class Suggester:
+    def __init__(self, entries: Dict[str, list]):
+        self.texts: List[str] = entries["text"]
+        self.kinds: List[str] = entries["kind"]
+        self.refs: List[Optional[int]] = entries["ref"]
+        self.weights = np.asarray(entries["weight"], dtype=np.float32)
+        self.norms = [_normalize(text) for text in self.texts]
+
+        keyed = sorted(
+            (norm[start:start + KEY_CHARS], i)
+            for i, norm in enumerate(self.norms)
+            for start in _word_starts(norm)
+        )
+        self.keys = [key for key, _ in keyed]
+        self.key_entries = np.fromiter((i for _, i in keyed), dtype=np.int32, count=len(keyed))
+
+        postings: Dict[str, List[int]] = {}
+        for i, norm in enumerate(self.norms):
+            for gram in _trigrams(norm):
+                postings.setdefault(gram, []).append(i)
+        self.trigrams = {gram: np.asarray(ids, dtype=np.int32) for gram, ids in postings.items()}
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    @classmethod
+    def load(cls, base: Path) -> Optional["Suggester"]:
+        entries = read_entries(base)
+        return cls(entries) if entries else None
+
+    def suggest(self, prefix: str, limit: int = 8) -> List[Dict[str, Any]]:
+        q = _normalize(prefix)
+        if len(q) < MIN_PREFIX or limit <= 0:
+            return []
+
+        key = q[:KEY_CHARS]
+        lo = bisect.bisect_left(self.keys, key)
+        hi = bisect.bisect_left(self.keys, key + "\U0010ffff", lo, min(lo + SCAN_LIMIT, len(self.keys)))
+        candidates = np.unique(self.key_entries[lo:hi])
+        if len(q) > KEY_CHARS:
+            candidates = np.asarray([i for i in candidates if q in self.norms[i]], dtype=np.int32)
+        if len(candidates) > limit * 4:
+            # Дальше досматриваем только самые весомые
+            top = np.argpartition(-self.weights[candidates], limit * 4 - 1)[: limit * 4]
+            candidates = candidates[top]
+        scored: Dict[int, float] = {}
+        for i in candidates.tolist():
+            # Совпадение с начала всей подсказки выше совпадения с середины
+            scored[i] = float(self.weights[i]) + (1.0 if self.norms[i].startswith(q) else 0.0)
+
+        results = [(score, self.texts[i], self.kinds[i], self.refs[i]) for i, score in scored.items()]
+
+        if len(results) < limit and len(q) >= 3:
+            results += self._fuzzy(q, exclude=set(scored), limit=limit)
+        return self._dedupe(results, limit)
+
+    def _fuzzy(self, q: str, exclude, limit: int):
+        grams = [self.trigrams[g] for g in _trigrams(q) if g in self.trigrams]
+        n_grams = len(_trigrams(q))
+        if not grams:
+            return []
+        counts = np.bincount(np.concatenate(grams), minlength=len(self.texts))
+        candidates = np.flatnonzero(counts >= TRIGRAM_MIN_SIMILARITY * n_grams)
+        if not len(candidates):
+            return []
+        # Похожесть важнее веса; похожие подсказки идут после префиксных
+        similarity = counts[candidates] / n_grams
+        order = np.lexsort((-self.weights[candidates], -similarity))[: limit * 2]
+        return [
+            (float(similarity[j]) - 1.0, self.texts[i], self.kinds[i], self.refs[i])
+            for j, i in ((j, int(candidates[j])) for j in order)
+            if i not in exclude
+        ]
+
+    @staticmethod
+    def _dedupe(results, limit):
+        results.sort(key=lambda r: (-r[0], r[1]))
+        seen, out = set(), []
+        for score, text, kind, ref in results:
+            norm = _normalize(text)
+            if norm in seen:
+                continue
+            seen.add(norm)
+            out.append({"text": text, "kind": kind, "id": ref})
+            if len(out) >= limit:
+                break
+        return out
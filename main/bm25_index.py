@@ -0,0 +1,206 @@
+"""
+Инвертированный BM25-индекс, хранящийся на диске.
+
+Индекс строится командой index_lectures и состоит из массивов NumPy в формате
+CSR: для каждого терма — срез постингов (номер документа + частота терма).
+Запрос читает только постинги своих термов, поэтому его стоимость зависит от
+длины постингов, а не от размера всего корпуса.
+"""
+import heapq
+import json
+from array import array
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .text_analysis import Analyzer, default_analyzer
+
+META_FILE = "meta.json"
+VOCAB_FILE = "vocab.json"
+ARRAY_FILES = ("doc_ids", "doc_lens", "offsets", "postings_docs", "postings_tf", "idf")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Разбивает текст на термы анализатором по умолчанию (см. main.text_analysis).
+    """
+    return default_analyzer().analyze(text)
+
+
+class BM25Index:
+    def __init__(
+        self,
+        doc_ids: np.ndarray,
+        doc_lens: np.ndarray,
+        vocab: Dict[str, int],
+        offsets: np.ndarray,
+        postings_docs: np.ndarray,
+        postings_tf: np.ndarray,
+        idf: np.ndarray,
+        k1: float = 1.5,
+        b: float = 0.75,
+        analyzer: Optional[Analyzer] = None,
+    ):
+        self.doc_ids = doc_ids
+        self.doc_lens = doc_lens
+        self.vocab = vocab
+        self.offsets = offsets
+        self.postings_docs = postings_docs
+        self.postings_tf = postings_tf
+        self.idf = idf
+        self.k1 = k1
+        self.b = b
+        self.avgdl = float(doc_lens.mean()) if len(doc_lens) else 0.0
+        # Анализатор, которым разобраны документы; им же разбираются запросы
+        self.analyzer = analyzer or default_analyzer()
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    @property
+    def n_terms(self) -> int:
+        return len(self.vocab)
+
+    # ---------- Построение ----------
+
+    def analyze(self, text: str) -> List[str]:
+        return self.analyzer.analyze(text)
+
+    @classmethod
+    def build(
+        cls,
+        documents: Iterable[Tuple[int, List[str]]],
+        k1: float = 1.5,
+        b: float = 0.75,
+        analyzer: Optional[Analyzer] = None,
+    ) -> "BM25Index":
+        """
+        Строит индекс из потока (id документа, токены).
+        Постинги копятся в компактных array, а не в списках Python,
+        чтобы сборка укладывалась в память на сотнях тысяч лекций.
+        """
+        vocab: Dict[str, int] = {}
+        doc_ids = array("q")
+        doc_lens = array("i")
+        term_col = array("i")
+        doc_col = array("i")
+        tf_col = array("i")
+
+        for doc_idx, (doc_id, tokens) in enumerate(documents):
+            doc_ids.append(int(doc_id))
+            doc_lens.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                term_id = vocab.get(term)
+                if term_id is None:
+                    term_id = vocab[term] = len(vocab)
+                term_col.append(term_id)
+                doc_col.append(doc_idx)
+                tf_col.append(tf)
+
+        terms = np.frombuffer(term_col, dtype=np.int32)
+        # Стабильная сортировка сохраняет порядок документов внутри терма
+        order = np.argsort(terms, kind="stable")
+        postings_docs = np.frombuffer(doc_col, dtype=np.int32)[order]
+        postings_tf = np.frombuffer(tf_col, dtype=np.int32)[order].astype(np.float32)
+
+        df = np.bincount(terms, minlength=len(vocab)).astype(np.int64)
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(df, out=offsets[1:])
+
+        n_docs = len(doc_ids)
+        idf = np.log1p((n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+        return cls(
+            doc_ids=np.frombuffer(doc_ids, dtype=np.int64).copy(),
+            doc_lens=np.frombuffer(doc_lens, dtype=np.int32).copy(),
+            vocab=vocab,
+            offsets=offsets,
+            postings_docs=postings_docs,
+            postings_tf=postings_tf,
+            idf=idf,
+            k1=k1,
+            b=b,
+            analyzer=analyzer,
+        )
+
+    # ---------- Хранение ----------
+
+    def save(self, path: Path) -> None:
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        for name in ARRAY_FILES:
+            np.save(path / f"{name}.npy", getattr(self, name))
+        (path / VOCAB_FILE).write_text(json.dumps(self.vocab, ensure_ascii=False), encoding="utf-8")
+        meta = {
+            "k1": self.k1,
+            "b": self.b,
+            "n_docs": len(self),
+            "n_terms": self.n_terms,
+            "analyzer": self.analyzer.signature,
+        }
+        (path / META_FILE).write_text(json.dumps(meta, indent=2), encoding="utf-8")
+
+    @classmethod
+    def load(cls, path: Path) -> "BM25Index":
+        """
+        Загружает индекс; массивы постингов отображаются в память (mmap),
+        так что страницы читаются с диска только для термов из запросов.
+        """
+        path = Path(path)
+        meta = json.loads((path / META_FILE).read_text(encoding="utf-8"))
+        vocab = json.loads((path / VOCAB_FILE).read_text(encoding="utf-8"))
+        arrays = {name: np.load(path / f"{name}.npy", mmap_mode="r") for name in ARRAY_FILES}
+        analyzer = Analyzer.from_signature(meta.get("analyzer"))
+        return cls(vocab=vocab, k1=meta["k1"], b=meta["b"], analyzer=analyzer, **arrays)
+
+    # ---------- Поиск ----------
+
+    def search(self, tokens: List[str], top_k: int, allowed=None) -> List[Tuple[int, float]]:
+        """
+        Возвращает top_k пар (id документа, BM25-score) для токенов запроса.
+        allowed — необязательный набор id документов: постинги остальных
+        отбрасываются до подсчёта суммарных score.
+        """
+        if not len(self) or top_k <= 0:
+            return []
+
+        doc_parts = []
+        score_parts = []
+        for term, qtf in Counter(tokens).items():
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            start, end = int(self.offsets[term_id]), int(self.offsets[term_id + 1])
+            docs = self.postings_docs[start:end]
+            tf = self.postings_tf[start:end]
+            norm = self.k1 * (1.0 - self.b + self.b * self.doc_lens[docs] / (self.avgdl or 1.0))
+            doc_parts.append(docs)
+            score_parts.append(qtf * self.idf[term_id] * tf * (self.k1 + 1.0) / (tf + norm))
+
+        if not doc_parts:
+            return []
+
+        docs = np.concatenate(doc_parts)
+        scores = np.concatenate(score_parts)
+        if allowed is not None:
+            keep = np.isin(self.doc_ids[docs], np.asarray(allowed, dtype=np.int64))
+            docs, scores = docs[keep], scores[keep]
+            if not len(docs):
+                return []
+
+        docs, inverse = np.unique(docs, return_inverse=True)
+        totals = np.bincount(inverse, weights=scores)
+
+        best = heapq.nlargest(top_k, zip(totals.tolist(), docs.tolist()))
+        return [(int(self.doc_ids[doc]), float(score)) for score, doc in best]
+
+
+def load_index(path: Optional[Path]) -> Optional[BM25Index]:
+    if path is None or not (Path(path) / META_FILE).exists():
+        return None
+    try:
+        return BM25Index.load(path)
+    except Exception:
+        return None
@@ -0,0 +1,261 @@
+"""
+Признаки записей на курс для прогноза итоговой оценки.
+
+Расчёт признаков (посещаемость, средний балл за домашние, midterm,
+предыдущий GPA) и итоговой оценки живёт здесь в одном месте и выполняется
+постоянным числом запросов для любого набора записей. Результат хранится
+в таблице EnrollmentFeatures: train_grade_model читает из неё выборку,
+api_predict_grade — одну строку.
+
+Таблица обновляется инкрементально: сигналы Grade/Attendance/Enrollment
+(см. main/signals.py) помечают затронутые записи, а пересчёт выполняется
+один раз после коммита транзакции. Изменения в обход сигналов (bulk_update,
+queryset.update, смена Student.user) подхватывает полная пересборка —
+команда rebuild_grade_features или обучение модели.
+"""
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.db import transaction
+from django.db.models import Avg, Count, F, Max, OuterRef, Q, Subquery, Value
+
+from .models import Attendance, Course, Enrollment, EnrollmentFeatures, Grade
+
+FEATURE_NAMES = [
+    "attendance_rate",
+    "avg_homework",
+    "midterm_score",
+    "previous_gpa",
+]
+
+WRITE_CHUNK = 1000
+
+
+def _latest_values(grades) -> Dict[int, object]:
+    # {id записи на курс: значение самой поздней оценки} — один запрос
+    latest = {}
+    for enr_id, value in grades.order_by("enrollment", "-date").values_list("enrollment", "value"):
+        latest.setdefault(enr_id, value)
+    return latest
+
+
+def _userless_previous_avg(courses) -> Dict[int, Optional[float]]:
+    # {id курса: средняя оценка без студента по другим курсам} — один запрос
+    return dict(
+        courses.order_by().annotate(
+            previous_avg=Subquery(
+                Grade.objects.filter(student__isnull=True).exclude(course=OuterRef("pk")).order_by()
+                .values("student").annotate(avg=Avg("value")).values("avg")
+            )
+        ).values_list("id", "previous_avg")
+    )
+
+
+def compute(enrollment_ids: Optional[Iterable[int]] = None) -> Dict[int, Tuple[List[float], Optional[float]]]:
+    """
+    Признаки и итоговая оценка записей на курс (все, если enrollment_ids не
+    задан): {id записи: (признаки в порядке FEATURE_NAMES, итоговая оценка)}.
+    Итоговая оценка — последний «Финальный», иначе максимальная оценка; у
+    записи без оценок она None. Порядок — как у Enrollment (новые первыми).
+    """
+    enrollments = Enrollment.objects.all()
+    grades = Grade.objects.filter(enrollment__isnull=False).order_by()
+    attendances = Attendance.objects.order_by()
+    if enrollment_ids is not None:
+        enrollment_ids = list(enrollment_ids)
+        enrollments = enrollments.filter(id__in=enrollment_ids)
+        grades = grades.filter(enrollment_id__in=enrollment_ids)
+        attendances = attendances.filter(enrollment_id__in=enrollment_ids)
+
+    stats = {
+        row["enrollment"]: row
+        for row in grades.values("enrollment").annotate(
+            max_value=Max("value"),
+            hw_avg=Avg("value", filter=Q(assignment_name__icontains="Домашнее")),
+            other_avg=Avg("value", filter=~Q(assignment_name__icontains="Финал")),
+        )
+    }
+    final_values = _latest_values(grades.filter(assignment_name__icontains="Финальный"))
+    midterm_values = _latest_values(grades.filter(assignment_name__icontains="Midterm"))
+    attendance = {
+        row["enrollment"]: (row["total"], row["present"])
+        for row in attendances.values("enrollment").annotate(
+            total=Count("id"), present=Count("id", filter=Q(present=True))
+        )
+    }
+
+    # Предыдущий GPA: средняя оценка студента по другим курсам. Если у
+    # студента нет пользователя, берутся оценки без студента (как и раньше) —
+    # такое среднее зависит только от курса и считается один раз на курс.
+    previous_avg = Subquery(
+        Grade.objects.filter(student=OuterRef("student__user")).exclude(course=OuterRef("course")).order_by()
+        .values("student").annotate(avg=Avg("value")).values("avg")
+    )
+    userless_avg = _userless_previous_avg(Course.objects.filter(id__in=enrollments.values("course_id")))
+
+    result = {}
+    rows = enrollments.annotate(previous_avg=previous_avg).values_list(
+        "id", "course_id", "student__user_id", "previous_avg"
+    )
+    for enr_id, course_id, user_id, previous in rows:
+        if user_id is None:
+            previous = userless_avg.get(course_id)
+        row = stats.get(enr_id, {})
+
+        # Признак: посещаемость
+        attendance_rate = 1.0
+        total, present = attendance.get(enr_id, (0, 0))
+        if total:
+            attendance_rate = present / total
+
+        # Признак: средний балл за домашние задания
+        hw_avg = row.get("hw_avg")
+        if hw_avg is None:
+            hw_avg = row.get("other_avg") or 0
+
+        # Признак: midterm
+        midterm = midterm_values.get(enr_id)
+        midterm_score = float(midterm) if midterm is not None else float(hw_avg)
+
+        # Признак: предыдущий GPA (средняя оценка по другим курсам)
+        previous_gpa = float(previous) if previous is not None else float(hw_avg)
+
+        final_value = final_values.get(enr_id, row.get("max_value"))
+        result[enr_id] = (
+            [float(attendance_rate * 100.0), float(hw_avg), float(midterm_score), float(previous_gpa)],
+            float(final_value) if final_value is not None else None,
+        )
+    return result
+
+
+def rebuild(enrollment_ids: Optional[Iterable[int]] = None) -> int:
+    """
+    Пересчитывает и сохраняет признаки перечисленных записей (все — если
+    enrollment_ids не задан). Возвращает число сохранённых строк.
+    """
+    if enrollment_ids is None:
+        chunks = [None]
+    else:
+        ids = sorted(set(enrollment_ids))
+        chunks = [ids[i:i + WRITE_CHUNK] for i in range(0, len(ids), WRITE_CHUNK)]
+
+    saved = 0
+    with transaction.atomic():
+        for chunk in chunks:
+            rows = compute(chunk)
+            stored = EnrollmentFeatures.objects.all()
+            if chunk is not None:
+                stored = stored.filter(enrollment_id__in=chunk)
+            stored.delete()
+            EnrollmentFeatures.objects.bulk_create(
+                [
+                    EnrollmentFeatures(
+                        enrollment_id=enr_id, **dict(zip(FEATURE_NAMES, features)), final_grade=final
+                    )
+                    for enr_id, (features, final) in rows.items()
+                ],
+                batch_size=WRITE_CHUNK,
+            )
+            saved += len(rows)
+    return saved
+
+
+def refresh_userless_previous_gpa() -> int:
+    """
+    Обновляет только previous_gpa записей студентов без пользователя. Он
+    зависит лишь от курса записи (средняя оценка без студента по другим
+    курсам), так что хватает одного запроса средних и одного UPDATE на курс —
+    остальные признаки этих записей от оценок без студента не зависят.
+    """
+    rows = EnrollmentFeatures.objects.filter(enrollment__student__user__isnull=True)
+    averages = _userless_previous_avg(Course.objects.filter(id__in=rows.values("enrollment__course_id")))
+    updated = 0
+    with transaction.atomic():
+        for course_id, avg in averages.items():
+            # Без оценок по другим курсам — как в compute(): средний балл за домашние
+            updated += rows.filter(enrollment__course_id=course_id).update(
+                previous_gpa=Value(float(avg)) if avg is not None else F("avg_homework")
+            )
+    return updated
+
+
+def training_set() -> Tuple[List[List[float]], List[float]]:
+    """
+    Выборка для обучения из таблицы признаков: записи с итоговой оценкой,
+    новые первыми.
+    """
+    rows = (
+        EnrollmentFeatures.objects.filter(final_grade__isnull=False)
+        .order_by("-enrollment__enrolled_at")
+        .values_list(*FEATURE_NAMES, "final_grade")
+    )
+    X, y = [], []
+    for *features, final in rows.iterator(chunk_size=5000):
+        X.append(features)
+        y.append(final)
+    return X, y
+
+
+def features_for(student_id, course_id) -> Optional[List[float]]:
+    """
+    Признаки записи студента на курс — одна строка по индексу. Если строки
+    ещё нет (запись создана в обход сигналов), она рассчитывается и
+    сохраняется. None — если такой записи на курс нет.
+    """
+    stored = (
+        EnrollmentFeatures.objects.filter(enrollment__student_id=student_id, enrollment__course_id=course_id)
+        .values_list(*FEATURE_NAMES)
+        .first()
+    )
+    if stored is not None:
+        return list(stored)
+    enr_id = Enrollment.objects.filter(student_id=student_id, course_id=course_id).values_list("id", flat=True).first()
+    if enr_id is None:
+        return None
+    rebuild([enr_id])
+    return list(EnrollmentFeatures.objects.filter(enrollment_id=enr_id).values_list(*FEATURE_NAMES).get())
+
+
+# ---------- Инкрементальное обновление (сигналы) ----------
+
+_pending = threading.local()
+
+
+def _pending_state():
+    if not hasattr(_pending, "enrollments"):
+        _pending.enrollments = set()
+        _pending.users = set()
+        _pending.userless = False
+    return _pending
+
+
+def mark_dirty(enrollment_ids: Iterable[Optional[int]] = (), users: Iterable[Optional[int]] = (), userless: bool = False) -> None:
+    """
+    Помечает записи на курс для пересчёта после коммита текущей транзакции.
+    users — пользователи, у которых изменился предыдущий GPA (все их записи);
+    userless — изменились оценки без студента: у записей студентов без
+    пользователя обновляется только previous_gpa (refresh_userless_previous_gpa).
+    Несколько изменений в одной транзакции пересчитываются одним проходом.
+    """
+    state = _pending_state()
+    state.enrollments.update(i for i in enrollment_ids if i is not None)
+    state.users.update(u for u in users if u is not None)
+    state.userless = state.userless or userless
+    transaction.on_commit(flush_pending)
+
+
+def flush_pending() -> int:
+    state = _pending_state()
+    if not (state.enrollments or state.users or state.userless):
+        return 0
+    ids, users, userless = set(state.enrollments), set(state.users), state.userless
+    state.enrollments.clear()
+    state.users.clear()
+    state.userless = False
+
+    if users:
+        ids.update(Enrollment.objects.filter(student__user_id__in=users).values_list("id", flat=True))
+    saved = rebuild(ids) if ids else 0
+    if userless:
+        saved += refresh_userless_previous_gpa()
+    return saved
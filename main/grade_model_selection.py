@@ -0,0 +1,142 @@
+"""
+Выбор модели прогноза оценок k-кратной кросс-валидацией.
+
+Каждая пара (кандидат, фолд) — отдельная задача пула процессов, так что
+фолды и кандидаты считаются параллельно на всех ядрах. Отбор ограничен по
+времени: по истечении бюджета пул останавливается, а кандидаты, не
+успевшие пройти все фолды, в выборе не участвуют. Модуль не зависит от
+Django — задачи выполняются в дочерних процессах без настройки проекта.
+"""
+import multiprocessing
+import os
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+CANDIDATES = ("linear", "ridge", "gbr", "rf")
+DEFAULT_FOLDS = 5
+DEFAULT_TIME_BUDGET = 300.0
+RANDOM_STATE = 42
+
+
+def make_model(name: str):
+    """
+    Новая (необученная) модель кандидата. Признаки перед обучением
+    масштабирует StandardScaler, как в train_grade_model.
+    """
+    from sklearn.ensemble import GradientBoostingRegressor, RandomForestRegressor
+    from sklearn.linear_model import LinearRegression, Ridge
+
+    if name == "linear":
+        return LinearRegression()
+    if name == "ridge":
+        return Ridge(alpha=1.0)
+    if name == "gbr":
+        return GradientBoostingRegressor(random_state=RANDOM_STATE)
+    if name == "rf":
+        # Параллельность — на уровне задач пула, внутри модели один поток
+        return RandomForestRegressor(n_estimators=200, random_state=RANDOM_STATE, n_jobs=1)
+    raise ValueError(f"Неизвестная модель: {name}")
+
+
+def rmse(preds, y) -> float:
+    return float(np.sqrt(np.mean((preds - y) ** 2)))
+
+
+def r2(preds, y) -> float:
+    return float(1 - np.sum((y - preds) ** 2) / np.sum((y - np.mean(y)) ** 2))
+
+
+def fit_fold(name: str, X: np.ndarray, y: np.ndarray, train_idx: np.ndarray, test_idx: np.ndarray):
+    """
+    Обучает кандидата на одном фолде: (rmse, r2, секунды обучения).
+    """
+    from sklearn.preprocessing import StandardScaler
+
+    started = time.perf_counter()
+    scaler = StandardScaler().fit(X[train_idx])
+    model = make_model(name).fit(scaler.transform(X[train_idx]), y[train_idx])
+    fit_seconds = time.perf_counter() - started
+    preds = model.predict(scaler.transform(X[test_idx]))
+    return rmse(preds, y[test_idx]), r2(preds, y[test_idx]), fit_seconds
+
+
+def select(
+    X: np.ndarray,
+    y: np.ndarray,
+    candidates: Sequence[str] = CANDIDATES,
+    folds: int = DEFAULT_FOLDS,
+    jobs: Optional[int] = None,
+    time_budget: float = DEFAULT_TIME_BUDGET,
+) -> Dict[str, Any]:
+    """
+    Кросс-валидация кандидатов в пуле из jobs процессов (по умолчанию — все
+    ядра) в пределах time_budget секунд. Возвращает сводку для metrics.json:
+    best — кандидат с наименьшим средним RMSE среди прошедших все фолды
+    (None, если таких нет), candidates — метрики и время каждого.
+    """
+    from sklearn.model_selection import KFold
+
+    for name in candidates:
+        make_model(name)  # неизвестное имя — ошибка до запуска пула
+    started = time.perf_counter()
+    deadline = time.monotonic() + time_budget
+    folds = max(2, min(folds, len(X)))
+    jobs = jobs or os.cpu_count() or 1
+    splits = list(KFold(n_splits=folds, shuffle=True, random_state=RANDOM_STATE).split(X))
+
+    results: Dict[str, List[tuple]] = {name: [] for name in candidates}
+    errors: Dict[str, str] = {}
+    pool = multiprocessing.Pool(processes=min(jobs, len(candidates) * folds))
+    try:
+        # Кандидаты по порядку: быстрые линейные успевают даже при малом бюджете
+        pending = [
+            (name, pool.apply_async(fit_fold, (name, X, y, train_idx, test_idx)))
+            for name in candidates
+            for train_idx, test_idx in splits
+        ]
+        for name, result in pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 and not result.ready():
+                continue
+            try:
+                results[name].append(result.get(timeout=max(remaining, 0)))
+            except multiprocessing.TimeoutError:
+                continue
+            except Exception as exc:  # noqa: BLE001 - ошибка одного кандидата не останавливает отбор
+                errors[name] = str(exc)
+    finally:
+        # Незавершённые задачи прерываются вместе с процессами
+        pool.terminate()
+        pool.join()
+
+    report: Dict[str, Dict[str, Any]] = {}
+    for name in candidates:
+        done = results[name]
+        entry: Dict[str, Any] = {
+            "status": "error" if name in errors else ("ok" if len(done) == folds else "timeout"),
+            "folds_done": len(done),
+            "fit_seconds": round(sum(r[2] for r in done), 4),
+        }
+        if done:
+            rmses = np.array([r[0] for r in done])
+            entry.update(
+                cv_rmse=float(rmses.mean()),
+                cv_rmse_std=float(rmses.std()),
+                cv_r2=float(np.mean([r[1] for r in done])),
+            )
+        if name in errors:
+            entry["error"] = errors[name]
+        report[name] = entry
+
+    complete = [name for name in candidates if report[name]["status"] == "ok"]
+    best = min(complete, key=lambda name: report[name]["cv_rmse"]) if complete else None
+    return {
+        "best": best,
+        "folds": folds,
+        "jobs": jobs,
+        "time_budget": time_budget,
+        "seconds": round(time.perf_counter() - started, 3),
+        "candidates": report,
+    }
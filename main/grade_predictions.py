@@ -0,0 +1,127 @@
+"""
+Пакетный прогноз итоговых оценок для курса, группы или специальности.
+
+Матрица признаков читается из таблицы EnrollmentFeatures одним запросом
+(недостающие строки досчитываются main.grade_features), модель из реестра
+(main.model_registry) вызывается один раз на всю матрицу, вклады признаков
+считаются так же, как в api_predict_grade. Прогнозы можно сохранить в
+GradePrediction — последний прогноз на каждую запись на курс.
+"""
+import time
+from typing import Any, Dict, Optional
+
+import numpy as np
+from django.db import transaction
+
+from . import grade_features
+from .model_registry import get_registry
+from .models import Enrollment, EnrollmentFeatures, GradePrediction
+
+WRITE_CHUNK = 1000
+
+
+class ModelNotTrained(Exception):
+    pass
+
+
+def enrollments_for(course=None, group=None, specialty=None):
+    """
+    Записи на курс по фильтрам (объекты или id). Специальность — как в поиске:
+    через предмет курса.
+    """
+    qs = Enrollment.objects.all()
+    if course is not None:
+        qs = qs.filter(course=course)
+    if group is not None:
+        qs = qs.filter(student__group=group)
+    if specialty is not None:
+        qs = qs.filter(course__subject__specialty=specialty)
+    return qs
+
+
+def _feature_rows(enrollments):
+    rows = EnrollmentFeatures.objects.filter(enrollment__in=enrollments).values_list(
+        "enrollment_id", "enrollment__student_id", "enrollment__course_id", *grade_features.FEATURE_NAMES
+    )
+    return list(rows.order_by("enrollment_id").iterator(chunk_size=5000))
+
+
+def predict(enrollments, store: bool = False) -> Dict[str, Any]:
+    """
+    Прогноз для всех записей queryset enrollments одним вызовом модели.
+    store=True — сохранить прогнозы в GradePrediction. Возвращает сводку
+    (число записей, время, время на 1000 записей) и сами прогнозы.
+    """
+    started = time.perf_counter()
+    registry = get_registry()
+    loaded = registry.current()
+    if loaded is None:
+        raise ModelNotTrained("Модель ещё не обучена. Запустите train_grade_model.")
+
+    rows = _feature_rows(enrollments)
+    missing = set(enrollments.values_list("id", flat=True)) - {row[0] for row in rows}
+    if missing:
+        # Записи, созданные в обход сигналов: досчитываем и перечитываем
+        grade_features.rebuild(missing)
+        rows = _feature_rows(enrollments)
+
+    n = len(rows)
+    X = np.asarray([row[3:] for row in rows], dtype=float).reshape(n, len(grade_features.FEATURE_NAMES))
+    features_seconds = time.perf_counter() - started
+
+    preds, loaded = registry.predict(X) if n else (np.empty(0), loaded)
+    contributions, confidence = loaded.explain(X)
+
+    predictions = []
+    for i, (enr_id, student_id, course_id, *_) in enumerate(rows):
+        predictions.append(
+            {
+                "enrollment_id": enr_id,
+                "student_id": student_id,
+                "course_id": course_id,
+                "predicted_final_grade": float(preds[i]),
+                "feature_contributions": (
+                    {name: float(v) for name, v in zip(loaded.feature_names, contributions[i])}
+                    if contributions is not None
+                    else {}
+                ),
+            }
+        )
+
+    if store:
+        save(predictions, confidence, loaded.version)
+
+    seconds = time.perf_counter() - started
+    return {
+        "count": n,
+        "model_version": loaded.version,
+        "model_confidence": confidence,
+        "stored": store,
+        "features_seconds": round(features_seconds, 4),
+        "seconds": round(seconds, 4),
+        "seconds_per_1000": round(seconds / n * 1000, 4) if n else None,
+        "predictions": predictions,
+    }
+
+
+def save(predictions, confidence: float, model_version: Optional[str]) -> None:
+    """
+    Заменяет сохранённые прогнозы перечисленных записей на курс.
+    """
+    with transaction.atomic():
+        for i in range(0, len(predictions), WRITE_CHUNK):
+            chunk = predictions[i:i + WRITE_CHUNK]
+            GradePrediction.objects.filter(enrollment_id__in=[p["enrollment_id"] for p in chunk]).delete()
+            GradePrediction.objects.bulk_create(
+                [
+                    GradePrediction(
+                        enrollment_id=p["enrollment_id"],
+                        predicted_grade=p["predicted_final_grade"],
+                        confidence=confidence,
+                        contributions=p["feature_contributions"],
+                        model_version=model_version or "",
+                    )
+                    for p in chunk
+                ],
+                batch_size=WRITE_CHUNK,
+            )
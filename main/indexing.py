@@ -0,0 +1,56 @@
+"""
+Общие функции для построения поисковых индексов лекций.
+"""
+import hashlib
+import os
+from pathlib import Path
+from typing import Optional, Tuple
+
+EMBEDDING_DTYPES = ("float32", "float16")
+
+
+def lecture_text(title: str, content_text: str) -> str:
+    """
+    Текст лекции, который попадает в эмбеддинги и лексический индекс.
+    """
+    return f"{title or ''}\n{content_text or ''}".strip()
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+
+def atomic_write_text(path: Path, text: str) -> None:
+    """
+    Записывает файл через временный файл и os.replace, чтобы читатели
+    видели либо старую, либо новую версию целиком.
+    """
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def pack_vector(vector, dtype: str = "float32") -> Tuple[bytes, int]:
+    """
+    Упаковывает вектор в байты (float32 или float16) для Lecture.embedding_data.
+    Возвращает (байты, размерность).
+    """
+    import numpy as np
+
+    if dtype not in EMBEDDING_DTYPES:
+        raise ValueError(f"Неподдерживаемый тип эмбеддинга: {dtype}")
+    array = np.ascontiguousarray(np.asarray(vector, dtype=np.float32).ravel(), dtype=dtype)
+    return array.tobytes(), int(array.shape[0])
+
+
+def unpack_vector(data, dim: Optional[int], dtype: str = "float32"):
+    """
+    Возвращает вектор как представление NumPy поверх байтов, без копирования
+    (массив только для чтения). None, если вектора нет.
+    """
+    import numpy as np
+
+    if data is None or not dim:
+        return None
+    return np.frombuffer(data, dtype=dtype or "float32", count=int(dim))
@@ -0,0 +1,269 @@
+"""
+Фоновые задачи переиндексации лекций.
+
+HTTP-запрос только создаёт строку IndexingJob и запускает
+`manage.py index_lectures --job-id N` отдельным процессом, поэтому воркер
+gunicorn не ждёт загрузки модели и кодирования. Команда сама пишет в задачу
+прогресс, этап и ошибки. Одновременно для индекса может быть только одна
+активная задача (частичный уникальный индекс в БД): повторный запуск
+возвращает уже идущую.
+
+Живость задачи: процесс пишет heartbeat (updated_at) раз в HEARTBEAT_INTERVAL,
+а рядом с pid хранятся хост (имя и boot_id ядра) и время запуска процесса.
+После перезапуска контейнера PID может достаться другому процессу — его
+время запуска не совпадёт. Задачу с другого хоста проверяет только heartbeat.
+"""
+import os
+import socket
+import subprocess
+import sys
+import threading
+from datetime import timedelta
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.utils import timezone
+
+from .models import IndexingJob
+
+DEFAULT_INDEX = "lectures"
+
+# Активная задача без heartbeat дольше этого считается упавшей
+STALE_AFTER = timedelta(minutes=10)
+HEARTBEAT_INTERVAL = 60  # секунд
+
+LOG_DIR = Path("models") / "jobs"
+
+
+def enqueue(user=None, options: Optional[Dict[str, Any]] = None, index_name: str = DEFAULT_INDEX) -> Tuple[IndexingJob, bool]:
+    """
+    Ставит переиндексацию в очередь и запускает процесс после коммита.
+    Возвращает (задача, создана ли новая); если задача для индекса уже
+    идёт — возвращается она.
+    """
+    _fail_stale(index_name)
+    try:
+        with transaction.atomic():
+            job = IndexingJob.objects.create(
+                index_name=index_name,
+                options=options or {},
+                created_by=user if getattr(user, "is_authenticated", False) else None,
+            )
+    except IntegrityError:
+        active = active_job(index_name)
+        if active is not None:
+            return active, False
+        raise
+    transaction.on_commit(lambda: launch(job))
+    return job, True
+
+
+def active_job(index_name: str = DEFAULT_INDEX) -> Optional[IndexingJob]:
+    return IndexingJob.objects.filter(index_name=index_name, status__in=IndexingJob.ACTIVE_STATUSES).first()
+
+
+def host_id() -> str:
+    """
+    Идентификатор хоста и текущей загрузки ядра: PID сравним только в их пределах.
+    """
+    try:
+        boot_id = Path("/proc/sys/kernel/random/boot_id").read_text().strip()
+    except OSError:
+        boot_id = ""
+    return f"{socket.gethostname()}:{boot_id}"
+
+
+def _proc_stat(pid: int) -> Optional[list]:
+    # Поля /proc/<pid>/stat после имени процесса в скобках (с 3-го); None — нет /proc
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as stat:
+            return stat.read().rsplit(b")", 1)[1].split()
+    except (OSError, IndexError):
+        return None
+
+
+def process_start_time(pid: Optional[int]) -> Optional[int]:
+    """
+    Время запуска процесса в тактах с загрузки (поле 22 /proc/<pid>/stat).
+    """
+    fields = _proc_stat(pid) if pid else None
+    try:
+        return int(fields[19]) if fields else None
+    except (IndexError, ValueError):
+        return None
+
+
+def process_alive(pid: Optional[int], started: Optional[int] = None) -> bool:
+    """
+    Жив ли процесс задачи на этом хосте. Завершившийся, но не обслуженный
+    родителем процесс (зомби) считается завершённым; если задано started —
+    процесс с тем же PID, но другим временем запуска, тоже.
+    """
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Процесс есть, но принадлежит другому пользователю
+        pass
+    except OSError:
+        return False
+    fields = _proc_stat(pid)
+    if not fields:
+        return True
+    if fields[0] == b"Z":
+        return False
+    return started is None or process_start_time(pid) == started
+
+
+def _is_dead(job: IndexingJob, stale_before, host: str) -> bool:
+    if job.updated_at < stale_before:
+        # Нет heartbeat: процесс не запустился, завис или его хост недоступен
+        return True
+    if job.pid is None or job.host != host:
+        # Процесс ещё не запущен или работает на другом хосте — ждём heartbeat
+        return False
+    return not process_alive(job.pid, job.process_started)
+
+
+def _fail_stale(index_name: str) -> None:
+    """
+    Снимает активные задачи, процесс которых уже не работает (убит, контейнер
+    перезапущен, PID занят другим процессом), и задачи без heartbeat дольше
+    STALE_AFTER.
+    """
+    stale_before = timezone.now() - STALE_AFTER
+    host = host_id()
+    dead = [
+        job.pk
+        for job in IndexingJob.objects.filter(index_name=index_name, status__in=IndexingJob.ACTIVE_STATUSES)
+        if _is_dead(job, stale_before, host)
+    ]
+    if dead:
+        IndexingJob.objects.filter(pk__in=dead, status__in=IndexingJob.ACTIVE_STATUSES).update(
+            status=IndexingJob.STATUS_FAILED,
+            finished_at=timezone.now(),
+            errors=["Процесс задачи не работает, задача снята"],
+        )
+
+
+def launch(job: IndexingJob) -> None:
+    """
+    Запускает index_lectures отдельным процессом (в своей сессии, чтобы
+    перезапуск воркера gunicorn не убивал индексацию). Вывод — в models/jobs/.
+    """
+    manage_py = Path(settings.BASE_DIR) / "manage.py"
+    args = [sys.executable, str(manage_py), "index_lectures", "--job-id", str(job.pk)]
+    for name, value in (job.options or {}).items():
+        flag = "--" + name.replace("_", "-")
+        if value is True:
+            args.append(flag)
+        elif value not in (None, False):
+            args += [flag, str(value)]
+    try:
+        LOG_DIR.mkdir(parents=True, exist_ok=True)
+        with open(LOG_DIR / f"index_job_{job.pk}.log", "ab") as log:
+            process = subprocess.Popen(
+                args,
+                cwd=settings.BASE_DIR,
+                stdout=log,
+                stderr=subprocess.STDOUT,
+                stdin=subprocess.DEVNULL,
+                start_new_session=True,
+            )
+    except OSError as exc:
+        IndexingJob.objects.filter(pk=job.pk).update(
+            status=IndexingJob.STATUS_FAILED, finished_at=timezone.now(), errors=[f"Не удалось запустить процесс: {exc}"]
+        )
+        return
+    IndexingJob.objects.filter(pk=job.pk, pid__isnull=True).update(
+        pid=process.pid, host=host_id(), process_started=process_start_time(process.pid), updated_at=timezone.now()
+    )
+
+
+def job_status(job: IndexingJob) -> Dict[str, Any]:
+    return {
+        "job_id": job.pk,
+        "index": job.index_name,
+        "status": job.status,
+        "stage": job.stage,
+        "total": job.total,
+        "processed": job.processed,
+        "encoded": job.encoded,
+        "percent": round(100.0 * job.processed / job.total, 1) if job.total else None,
+        "eta_seconds": job.eta_seconds(),
+        "errors": job.errors,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+class JobReporter:
+    """
+    Пишет состояние задачи из index_lectures: начало, прогресс, этапы,
+    предупреждения и итог. Обновления — точечные UPDATE по id задачи; пока
+    задача идёт, отдельный поток раз в HEARTBEAT_INTERVAL обновляет updated_at.
+    """
+
+    def __init__(self, job_id: int):
+        self.job_id = job_id
+        self.errors = []
+        self._stopped = threading.Event()
+        self._heartbeat = None
+
+    def _update(self, **fields) -> None:
+        fields["updated_at"] = timezone.now()
+        IndexingJob.objects.filter(pk=self.job_id).update(**fields)
+
+    def start(self, pid: int) -> None:
+        self._update(
+            status=IndexingJob.STATUS_RUNNING,
+            started_at=timezone.now(),
+            pid=pid,
+            host=host_id(),
+            process_started=process_start_time(pid),
+            stage="scan",
+        )
+        self._heartbeat = threading.Thread(target=self._beat, name=f"index-job-{self.job_id}", daemon=True)
+        self._heartbeat.start()
+
+    def _beat(self) -> None:
+        try:
+            while not self._stopped.wait(HEARTBEAT_INTERVAL):
+                try:
+                    IndexingJob.objects.filter(pk=self.job_id, status=IndexingJob.STATUS_RUNNING).update(
+                        updated_at=timezone.now()
+                    )
+                except DatabaseError:
+                    # Временная ошибка БД: следующий heartbeat попробует снова
+                    connection.close()
+        finally:
+            connection.close()
+
+    def progress(self, processed: int, total: int, encoded: int) -> None:
+        self._update(processed=processed, total=total, encoded=encoded)
+
+    def stage(self, name: str) -> None:
+        self._update(stage=name)
+
+    def warning(self, message: str) -> None:
+        self.errors.append(message)
+        self._update(errors=self.errors)
+
+    def finish(self, error: Optional[str] = None) -> None:
+        self._stopped.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+        if error:
+            self.errors.append(error)
+        self._update(
+            status=IndexingJob.STATUS_FAILED if error else IndexingJob.STATUS_SUCCEEDED,
+            stage="" if error else "done",
+            errors=self.errors,
+            finished_at=timezone.now(),
+        )
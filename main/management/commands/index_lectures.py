@@ -1,13 +1,177 @@
+import itertools
 import json
+import os
+import shutil
+import time
+import uuid
+from array import array
 from pathlib import Path
 
-from django.core.management.base import BaseCommand
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, transaction
 
+from main import ann_index, autocomplete, passages, pgvector_store, quantization, related_lectures
+from main.bm25_index import BM25Index, load_index
+from main.indexing import EMBEDDING_DTYPES, atomic_write_text, content_hash, lecture_text, pack_vector
+from main.indexing_jobs import JobReporter
 from main.models import Lecture
+from main.search_engine import FAISS_INDEX_PATH, FAISS_MAPPING_PATH, vectors_dir
+from main.text_analysis import TokenCache, default_analyzer
+from main.vector_store import IDS_FILE, MATRIX_FILE, VectorStore, load_store, normalize
+
+# Сколько строк матрицы копировать за раз при пересборке хранилища и FAISS
+COPY_CHUNK = 4096
+# Отпечатки текстов лекций, по которым построен BM25-индекс (в его каталоге)
+BM25_LECTURES_FILE = "lectures.npz"
+# Каталоги поколений, на которые ссылается embeddings_info.json
+GENERATION_PREFIXES = ("bm25-", "vectors-")
+# Векторные артефакты старого формата — прямо в models/, без каталога поколения
+LEGACY_VECTOR_FILES = (
+    FAISS_INDEX_PATH.name,
+    FAISS_MAPPING_PATH.name,
+    MATRIX_FILE,
+    IDS_FILE,
+    quantization.INT8_CODES_FILE,
+    quantization.INT8_SCALES_FILE,
+    quantization.PQ_CODES_FILE,
+    quantization.PQ_CODEBOOKS_FILE,
+)
+PROGRESS_INTERVAL = 2.0
+
+
+class EmbeddingPipeline:
+    """
+    Потоковое кодирование лекций.
+
+    Лекции приходят чанками, их фрагменты (см. main.passages) кодируются
+    батчами фиксированного размера, а вектор лекции (нормированное среднее
+    фрагментов) записывается в БД одним bulk_update на чанк. Векторы фрагментов
+    дописываются во временный файл на диске, поэтому память не растёт
+    с размером корпуса.
+    Модель загружается лениво — только когда встретилась лекция для кодирования.
+    """
+
+    def __init__(self, command, model_name, batch_size, workers, vectors_path, pgvector=False, embedding_dtype="float32"):
+        self.command = command
+        self.model_name = model_name
+        # Тип элементов вектора лекции в Lecture.embedding_data
+        self.embedding_dtype = embedding_dtype
+        self.batch_size = batch_size
+        self.workers = workers
+        self.vectors_path = vectors_path
+        # Писать ли векторы лекций в колонку pgvector (main_lecture.embedding)
+        self.pgvector = pgvector
+        self.model = None
+        self.model_failed = False
+        self.pool = None
+        self.ids = array("q")
+        self.dim = None
+        self.encoded = 0
+        self.passages = 0
+        self.encode_seconds = 0.0
+        self._fh = None
+
+    @property
+    def available(self) -> bool:
+        return self.model is not None
+
+    def _ensure_model(self) -> bool:
+        if self.model is None and not self.model_failed:
+            self.model = self.command._load_model(self.model_name)
+            self.model_failed = self.model is None
+            if self.model is not None and self.workers > 1:
+                # Кодирование в нескольких CPU-процессах
+                self.pool = self.model.start_multi_process_pool(["cpu"] * self.workers)
+        return self.model is not None
+
+    def process(self, chunk) -> None:
+        """
+        Кодирует чанк [(id, хэш, [(ключ фрагмента, текст)])] и сохраняет векторы
+        в БД и во временный файл.
+        """
+        if not chunk or not self._ensure_model():
+            return
+
+        started = time.perf_counter()
+        texts = [text for _, _, parts in chunk for _, text in parts]
+        if self.pool is not None:
+            embeddings = self.model.encode_multi_process(texts, self.pool, batch_size=self.batch_size)
+        else:
+            embeddings = self.model.encode(texts, batch_size=self.batch_size, show_progress_bar=False)
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        self.encode_seconds += time.perf_counter() - started
+
+        if self._fh is None:
+            self.dim = embeddings.shape[1]
+            self._fh = open(self.vectors_path, "wb")
+            if self.pgvector:
+                self._ensure_pgvector_column()
+        self._fh.write(embeddings.tobytes())
+        self.ids.extend(key for _, _, parts in chunk for key, _ in parts)
+
+        lecture_vectors = []
+        pos = 0
+        for _, _, parts in chunk:
+            lecture_vectors.append(normalize(embeddings[pos:pos + len(parts)].mean(axis=0))[0])
+            pos += len(parts)
+
+        # Сохраняем в БД вектор, хэш закодированного текста и модель одним запросом на чанк
+        updates = []
+        for (lec_id, digest, _), emb in zip(chunk, lecture_vectors):
+            data, dim = pack_vector(emb, self.embedding_dtype)
+            updates.append(
+                Lecture(
+                    id=lec_id,
+                    embedding_data=data,
+                    embedding_dim=dim,
+                    embedding_dtype=self.embedding_dtype,
+                    content_hash=digest,
+                    embedding_model=self.model_name,
+                )
+            )
+        Lecture.objects.bulk_update(
+            updates,
+            ["embedding_data", "embedding_dim", "embedding_dtype", "content_hash", "embedding_model"],
+        )
+        if self.pgvector:
+            pgvector_store.write([lec_id for lec_id, _, _ in chunk], lecture_vectors)
+        self.encoded += len(chunk)
+        self.passages += len(texts)
+
+    def _ensure_pgvector_column(self) -> None:
+        # Колонку создаёт миграция 0011 с размерностью SEARCH_PGVECTOR_DIM
+        if not pgvector_store.column_matches(self.dim):
+            self.pgvector = False
+            self.command.warn(
+                f"Размерность модели ({self.dim}) не совпадает с колонкой pgvector "
+                f"(SEARCH_PGVECTOR_DIM={pgvector_store.configured_dim()}). Векторы пишутся только в models/."
+            )
+
+    def close(self):
+        if self.pool is not None:
+            self.model.stop_multi_process_pool(self.pool)
+            self.pool = None
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    def new_ids(self) -> np.ndarray:
+        return np.frombuffer(self.ids, dtype=np.int64) if self.ids else np.empty(0, dtype=np.int64)
+
+    def new_vectors(self, dim) -> np.ndarray:
+        if not self.encoded:
+            return np.empty((0, dim), dtype=np.float32)
+        return np.memmap(self.vectors_path, dtype=np.float32, mode="r").reshape(-1, self.dim)
 
 
 class Command(BaseCommand):
-    help = "Строит эмбеддинги для лекций и, при возможности, индекс для поиска (pgvector/FAISS/BM25)."
+    help = (
+        "Строит эмбеддинги для лекций и, при возможности, индекс для поиска (pgvector/FAISS/BM25). "
+        "Повторный запуск кодирует только новые и изменённые лекции."
+    )
+    # Задача IndexingJob, если команда запущена в фоне из веб-интерфейса
+    job = None
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -16,86 +180,695 @@ class Command(BaseCommand):
             default="sentence-transformers/all-MiniLM-L6-v2",
             help="Имя модели sentence-transformers (если доступна)",
         )
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Переиндексировать все лекции, игнорируя сохранённые хэши",
+        )
+        parser.add_argument(
+            "--index-type",
+            choices=("auto",) + ann_index.INDEX_TYPES,
+            default="auto",
+            help=(
+                "Тип FAISS-индекса: flat (точный), ivf, hnsw или auto "
+                f"(flat до {ann_index.FLAT_MAX_VECTORS}, ivf до {ann_index.IVF_MAX_VECTORS} векторов)"
+            ),
+        )
+        parser.add_argument(
+            "--nprobe",
+            type=int,
+            default=None,
+            help="Сколько IVF-списков просматривать при поиске",
+        )
+        parser.add_argument(
+            "--ef-search",
+            type=int,
+            default=None,
+            help="Параметр efSearch для HNSW",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=256,
+            help="Сколько лекций читать из БД и записывать обратно за один раз",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=32,
+            help="Размер батча для model.encode",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=0,
+            help="Число CPU-процессов для кодирования (0 — в текущем процессе)",
+        )
+        parser.add_argument(
+            "--pgvector",
+            choices=("auto", "off"),
+            default="auto",
+            help="Записывать векторы лекций в колонку pgvector (auto — если миграция 0011 создала колонку)",
+        )
+        parser.add_argument(
+            "--embedding-dtype",
+            choices=EMBEDDING_DTYPES,
+            default="float32",
+            help="Тип элементов вектора лекции в БД (float16 — вдвое компактнее)",
+        )
+        parser.add_argument(
+            "--quantize",
+            choices=quantization.QUANTIZE_MODES,
+            default="none",
+            help="Хранить векторы для поиска квантованными: int8 (~4x меньше) или pq (product quantization)",
+        )
+        parser.add_argument(
+            "--pq-m",
+            type=int,
+            default=None,
+            help="Число подпространств PQ (делитель размерности; по умолчанию размерность / 4)",
+        )
+        parser.add_argument(
+            "--rerank",
+            type=int,
+            default=quantization.DEFAULT_RERANK,
+            help="Пересчитывать точно top_k × N кандидатов по float-векторам на диске (0 — без пересчёта)",
+        )
+        parser.add_argument(
+            "--job-id",
+            type=int,
+            default=None,
+            help="Id задачи IndexingJob, в которую писать прогресс (фоновый запуск из веб-интерфейса)",
+        )
 
     def handle(self, *args, **options):
+        self.job = JobReporter(options["job_id"]) if options.get("job_id") else None
+        if self.job is None:
+            return self._index(options)
+        self.job.start(os.getpid())
+        try:
+            self._index(options)
+        except BaseException as exc:
+            self.job.finish(error=f"{type(exc).__name__}: {exc}")
+            raise
+        self.job.finish()
+
+    def warn(self, message):
+        self.stderr.write(self.style.WARNING(message))
+        if self.job is not None:
+            self.job.warning(message)
+
+    def _stage(self, name):
+        if self.job is not None:
+            self.job.stage(name)
+
+    def _index(self, options):
         model_name = options["model_name"]
+        full = options["full"]
+        started = time.perf_counter()
 
         # Путь для файлов индекса
         base = Path("models")
         base.mkdir(exist_ok=True, parents=True)
-        mapping_path = base / "faiss_mapping.json"
         info_path = base / "embeddings_info.json"
+        previous = self._read_info(info_path)
 
         self.stdout.write(self.style.MIGRATE_HEADING("=== Индексация лекций ==="))
 
-        lectures = Lecture.objects.all()
-        if not lectures.exists():
+        if not Lecture.objects.exists():
+            # Пустое описание с новой версией: воркеры перестают отдавать
+            # результаты из прежних индексов, кэш поиска инвалидируется
             self.stdout.write(self.style.WARNING("Лекций в базе нет."))
+            info = {
+                "index_version": uuid.uuid4().hex,
+                "backend": "bm25",
+                "n_lectures": 0,
+                "has_embeddings": False,
+                "model_name": None,
+                "bm25": None,
+                "suggest": None,
+                "last_run": {"encoded": 0, "passages": 0, "removed": 0, "full": full, "seconds": 0.0},
+            }
+            atomic_write_text(info_path, json.dumps(info, indent=2))
+            self._cleanup_generations(base, previous)
             return
 
+        # Уже проиндексированные векторы переиспользуются, только если модель
+        # и параметры разбиения на фрагменты те же
+        store = None
+        if (
+            not full
+            and previous.get("has_embeddings")
+            and previous.get("model_name") == model_name
+            and previous.get("passages") == passages.config()
+        ):
+            store = load_store(vectors_dir(base, previous))
+        indexed_ids = set(passages.lecture_of(store.ids).tolist()) if store is not None else set()
+
+        pipeline = EmbeddingPipeline(
+            self,
+            model_name,
+            batch_size=max(1, options["batch_size"]),
+            workers=options["workers"],
+            vectors_path=base / "new_vectors.f32.tmp",
+            pgvector=options["pgvector"] != "off" and pgvector_store.status(refresh=True) is not None,
+            embedding_dtype=options["embedding_dtype"],
+        )
+        try:
+            current_ids, pending_ids, fingerprints = self._scan(
+                pipeline, indexed_ids, full, max(1, options["chunk_size"])
+            )
+        finally:
+            pipeline.close()
+
+        removed = indexed_ids - set(current_ids)
+        self.stdout.write(
+            f"Лекций: {len(current_ids)}, новых/изменённых: {len(pending_ids)}, удалённых: {len(removed)}."
+        )
+        if pipeline.encoded:
+            self.stdout.write(
+                f"Закодировано {pipeline.encoded} лекций ({pipeline.passages} фрагментов) "
+                f"за {pipeline.encode_seconds:.2f} с "
+                f"({pipeline.encoded / max(pipeline.encode_seconds, 1e-9):.1f} лекций/с)."
+            )
+
+        use_embeddings = pipeline.available or (not pending_ids and store is not None)
+
+        vectors_info = None
+        if use_embeddings:
+            # Все векторные артефакты пишутся в новый каталог поколения: воркеры
+            # переключаются на него целиком, когда видят новый embeddings_info.json
+            vectors_info = {"path": f"vectors-{uuid.uuid4().hex[:12]}"}
+            target = base / vectors_info["path"]
+            target.mkdir()
+            dim = store.dim if store is not None else pipeline.dim
+            new_ids, new_vectors = pipeline.new_ids(), pipeline.new_vectors(dim)
+            drop = removed | set(pending_ids)
+            drop_keys = (
+                passages.keys_for_lectures(store.ids, list(drop))
+                if store is not None
+                else np.empty(0, dtype=np.int64)
+            )
+            incremental = store is not None and bool(previous.get("faiss_id_map"))
+            self._stage("store")
+            store = self._update_store(target, store, drop_keys, new_ids, new_vectors)
+            vectors_info.update(n_vectors=len(store), dim=store.dim)
+            quantize_info = self._update_quantized(target, store, options)
+            self._stage("faiss")
+            backend, faiss_info = self._update_faiss(
+                base, target, vectors_dir(base, previous), store, drop_keys, new_ids, new_vectors,
+                incremental, previous.get("faiss"), options,
+            )
+        else:
+            backend, faiss_info, quantize_info = "bm25", None, None
+        try:
+            pipeline.vectors_path.unlink(missing_ok=True)
+        except OSError:  # pragma: no cover - файл может быть ещё открыт (Windows)
+            pass
+
+        pgvector_info = None
+        if use_embeddings and pipeline.pgvector:
+            self._stage("pgvector")
+            pgvector_info = self._update_pgvector(pipeline, model_name, store.dim)
+
+        self._stage("bm25")
+        bm25_changed = None if full else self._bm25_changed(base, previous.get("bm25"), current_ids, fingerprints)
+        bm25_info = self._build_bm25(base, current_ids, fingerprints, bm25_changed, previous.get("bm25"))
+
+        self._stage("neighbors")
+        # Векторы пересчитываются для pending_ids; BM25 — по отпечаткам прошлой сборки
+        changed = set(pending_ids) | removed if use_embeddings else bm25_changed
+        neighbors_info = self._update_neighbors(
+            base, use_embeddings, model_name, changed, full, previous.get("neighbors"), bm25_info
+        )
+
+        self._stage("suggest")
+        suggest_info = self._update_suggest(base, set(pending_ids) | removed, full)
+
+        info = {
+            # Новая версия при каждом запуске: по ней инвалидируется кэш результатов поиска
+            "index_version": uuid.uuid4().hex,
+            "backend": backend,
+            "n_lectures": len(current_ids),
+            "has_embeddings": use_embeddings,
+            "model_name": model_name if use_embeddings else None,
+            "faiss_id_map": backend == "faiss",
+            # Векторы и BM25 построены по фрагментам: id в индексах — ключи фрагментов
+            "passages": passages.config(),
+            "vectors": vectors_info,
+            "pgvector": pgvector_info,
+            "quantize": quantize_info,
+            "faiss": faiss_info,
+            "bm25": bm25_info,
+            "neighbors": neighbors_info,
+            "suggest": suggest_info,
+            "last_run": {
+                "encoded": pipeline.encoded,
+                "passages": pipeline.passages,
+                "removed": len(removed),
+                "full": full,
+                "seconds": round(time.perf_counter() - started, 3),
+            },
+        }
+        # embeddings_info.json пишется последним: воркеры перечитывают индекс по его изменению
+        atomic_write_text(info_path, json.dumps(info, indent=2))
+        self._cleanup_generations(base, previous, info)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Индексация завершена за {time.perf_counter() - started:.2f} с. "
+                f"Backend={backend}, лекций={len(current_ids)}."
+            )
+        )
+
+    def _read_info(self, info_path: Path):
+        if not info_path.exists():
+            return {}
+        try:
+            return json.loads(info_path.read_text(encoding="utf-8"))
+        except Exception:
+            return {}
+
+    def _scan(self, pipeline, indexed_ids, full, chunk_size):
+        """
+        Один проход по лекциям через .iterator(): отбирает те, у которых изменился
+        текст или модель либо которых ещё нет в индексе, и передаёт их в пайплайн
+        чанками. Возвращает (все id, id новых/изменённых лекций, отпечатки
+        текстов лекций в порядке id — по ним BM25 находит изменённые лекции).
+        """
+        total = Lecture.objects.count()
+        current_ids = []
+        pending_ids = []
+        fingerprints = array("Q")
+        chunk = []
+        started = time.perf_counter()
+        rows = Lecture.objects.values_list(
+            "id", "title", "content_text", "content_hash", "embedding_model"
+        ).iterator(chunk_size=chunk_size)
+        for lec_id, title, content, stored_hash, stored_model in rows:
+            current_ids.append(lec_id)
+            text = lecture_text(title, content)
+            digest = content_hash(text)
+            fingerprints.append(int(digest[:16], 16))
+            if (
+                full
+                or lec_id not in indexed_ids
+                or stored_hash != digest
+                or stored_model != pipeline.model_name
+            ):
+                pending_ids.append(lec_id)
+                chunk.append((lec_id, digest, passages.passage_texts(lec_id, title, content)))
+            if len(chunk) >= chunk_size:
+                pipeline.process(chunk)
+                chunk = []
+                self._report_progress(len(current_ids), total, pipeline, started)
+        pipeline.process(chunk)
+        self._report_progress(len(current_ids), total, pipeline, started, force=True)
+        fingerprints = np.frombuffer(fingerprints, dtype=np.uint64) if fingerprints else np.empty(0, dtype=np.uint64)
+        return current_ids, pending_ids, fingerprints
+
+    def _report_progress(self, scanned, total, pipeline, started, force=False):
+        # Не чаще раза в PROGRESS_INTERVAL секунд, чтобы не засорять вывод на больших корпусах
+        now = time.perf_counter()
+        if not force and now - getattr(self, "_last_progress", 0.0) < PROGRESS_INTERVAL:
+            return
+        self._last_progress = now
+        elapsed = now - started
+        self.stdout.write(
+            f"  обработано {scanned}/{total} лекций, закодировано {pipeline.encoded} "
+            f"({scanned / max(elapsed, 1e-9):.1f} лекций/с)"
+        )
+        if self.job is not None:
+            self.job.progress(scanned, total, pipeline.encoded)
+
+    def _load_model(self, model_name):
         # Пытаемся загрузить sentence-transformers
         try:
             from sentence_transformers import SentenceTransformer
 
-            model = SentenceTransformer(model_name)
-            use_embeddings = True
+            return SentenceTransformer(model_name)
         except Exception as exc:  # pragma: no cover - модель может быть недоступна
-            self.stderr.write(
-                self.style.WARNING(
-                    f"Не удалось загрузить модель sentence-transformers ({exc}). "
-                    f"Будет доступен только текстовый BM25-поиск."
-                )
+            self.warn(
+                f"Не удалось загрузить модель sentence-transformers ({exc}). "
+                f"Будет доступен только текстовый BM25-поиск."
             )
-            use_embeddings = False
-            model = None
+            return None
 
-        texts = [lec.content_text for lec in lectures]
-        ids = [lec.id for lec in lectures]
+    def _update_store(self, target, store, drop_keys, new_ids, new_vectors):
+        """
+        Пересобирает матрицу эмбеддингов в каталоге поколения target: старые строки
+        без фрагментов удалённых/изменённых лекций плюс новые векторы. Кодирование
+        повторно не выполняется, строки копируются чанками.
+        """
+        # Матрица эмбеддингов для бэкенда "database" (mmap, общая для воркеров)
+        kept_ids = np.empty(0, dtype=np.int64)
+        kept_chunks = iter(())
+        if store is not None and len(store):
+            keep = np.flatnonzero(~np.isin(store.ids, drop_keys))
+            kept_ids = np.asarray(store.ids)[keep]
+            kept_chunks = (
+                store.matrix[keep[i:i + COPY_CHUNK]] for i in range(0, len(keep), COPY_CHUNK)
+            )
+        new_chunks = (new_vectors[i:i + COPY_CHUNK] for i in range(0, len(new_vectors), COPY_CHUNK))
+        dim = store.dim if store is not None else new_vectors.shape[1]
+        return VectorStore.save_chunks(
+            target,
+            np.concatenate([kept_ids, new_ids]),
+            dim,
+            itertools.chain(kept_chunks, new_chunks),
+        )
 
-        if use_embeddings:
-            self.stdout.write("Генерация эмбеддингов для лекций...")
-            embeddings = model.encode(texts, show_progress_bar=False)
+    def _update_faiss(self, base, target, source, store, drop_keys, new_ids, new_vectors, incremental, previous, options):
+        """
+        Обновляет FAISS-индекс выбранного типа (flat/IVF/HNSW) с ключами фрагментов:
+        читает прежний индекс из каталога source, удаляет векторы по ключам,
+        добавляет новые и пишет индекс с маппингом в каталог поколения target.
+        Если тип сменился, HNSW нужно что-то удалить или IVF заметно вырос —
+        индекс строится заново из матрицы.
+        Возвращает (backend, описание индекса для embeddings_info.json).
+        """
+        try:
+            import faiss  # type: ignore
+        except Exception as exc:  # pragma: no cover
+            self.warn(f"Не удалось создать FAISS-индекс ({exc}). Будет использоваться поиск по БД.")
+            return "database", None
 
-            # Сохраняем в БД (поле vector_embedding)
-            for lec, emb in zip(lectures, embeddings):
-                lec.vector_embedding = list(map(float, emb))
-                lec.save(update_fields=["vector_embedding"])
+        index_type = options["index_type"]
+        if index_type == "auto":
+            index_type = ann_index.choose_index_type(len(store))
+
+        previous = previous or {}
+        quantize = self._quantize_params(options, store)
+        same_type = previous.get("type") == index_type and all(
+            previous.get(k, "none") == v for k, v in quantize.items() if k != "pq_nbits"
+        )
+        params = ann_index.default_params(index_type, len(store)) | quantize
+        if same_type:
+            params.update({k: v for k, v in previous.items() if k in params})
+        if options.get("nprobe") and index_type == "ivf":
+            params["nprobe"] = min(options["nprobe"], params["nlist"])
+        if options.get("ef_search") and index_type == "hnsw":
+            params["ef_search"] = options["ef_search"]
 
-            # Пытаемся построить FAISS-индекс
+        can_update = incremental and same_type
+        if index_type == "hnsw" and len(drop_keys):
+            can_update = False
+        if index_type == "ivf" and len(store) > ann_index.IVF_RETRAIN_GROWTH * params["trained_on"]:
+            can_update = False
+
+        index = None
+        if can_update and (source / FAISS_INDEX_PATH.name).exists():
             try:
-                import faiss  # type: ignore
-
-                dim = embeddings.shape[1]
-                index = faiss.IndexFlatIP(dim)
-                index.add(embeddings.astype("float32"))
-                faiss.write_index(index, str(base / "faiss_index.bin"))
-
-                mapping_path.write_text(json.dumps(ids), encoding="utf-8")
-                backend = "faiss"
-                self.stdout.write(self.style.SUCCESS("FAISS-индекс успешно создан."))
-            except Exception as exc:  # pragma: no cover
-                self.stderr.write(
-                    self.style.WARNING(
-                        f"Не удалось создать FAISS-индекс ({exc}). Будет использоваться поиск по БД."
-                    )
+                index = faiss.read_index(str(source / FAISS_INDEX_PATH.name))
+            except Exception:  # pragma: no cover
+                index = None
+
+        if index is not None and index.d == store.dim:
+            if len(drop_keys) and ann_index.supports_remove(index_type):
+                index.remove_ids(np.asarray(drop_keys, dtype=np.int64))
+            for i in range(0, len(new_ids), COPY_CHUNK):
+                index.add_with_ids(
+                    normalize(new_vectors[i:i + COPY_CHUNK]), new_ids[i:i + COPY_CHUNK]
                 )
-                backend = "database"
-        else:
-            backend = "bm25"
+            ann_index.apply_search_params(index, index_type, params)
+
+        if index is None or index.d != store.dim or index.ntotal != len(store):
+            self.stdout.write(f"Построение FAISS-индекса ({index_type})...")
+            params = ann_index.default_params(index_type, len(store)) | quantize | {
+                k: v for k, v in params.items() if k in ("nprobe", "ef_search")
+            }
+            if index_type == "ivf":
+                params["nprobe"] = min(params["nprobe"], params["nlist"])
+            index = ann_index.build_index(store, index_type, params)
 
+        # Каталог поколения ещё не упомянут в embeddings_info.json — воркеры его не читают
+        index_path = target / FAISS_INDEX_PATH.name
+        faiss.write_index(index, str(index_path))
+        (target / FAISS_MAPPING_PATH.name).write_text(json.dumps(store.ids.tolist()), encoding="utf-8")
+
+        # Отчёт recall@10 относительно точного поиска по матрице
+        rerank = max(0, options["rerank"]) if params["quantize"] != "none" else 0
+        report = ann_index.recall_report(index, store, k=10, rerank=rerank)
+        memory = {
+            "memory_bytes": index_path.stat().st_size,
+            "float_bytes": int(len(store) * store.dim * 4),
+        }
+        report.update({"index_type": index_type, "params": params, "n_vectors": int(index.ntotal), **memory})
+        atomic_write_text(base / "index_report.json", json.dumps(report, indent=2))
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"FAISS-индекс ({index_type}, quantize={params['quantize']}) обновлён: векторов={index.ntotal}, "
+                f"recall@10={report['recall_at_k']}, {report.get('ann_ms_per_query')} мс/запрос "
+                f"(точный поиск: {report.get('exact_ms_per_query')} мс), "
+                f"память {self._format_memory(memory)}."
+            )
+        )
+        if rerank:
+            self.stdout.write(f"  recall@10 с пересчётом top-{10 * rerank}: {report['recall_at_k_reranked']}")
+        info = {"type": index_type, **params, "recall_at_10": report["recall_at_k"], **memory}
+        if rerank:
+            info.update({"rerank": rerank, "recall_at_10_reranked": report["recall_at_k_reranked"]})
+        return "faiss", info
+
+    @staticmethod
+    def _quantize_params(options, store):
+        mode = options["quantize"]
+        if mode != "pq":
+            return {"quantize": mode}
+        try:
+            return {"quantize": mode, **quantization.pq_params(store.dim, len(store), options["pq_m"])}
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+    @staticmethod
+    def _format_memory(memory):
+        ratio = memory["float_bytes"] / max(memory["memory_bytes"], 1)
+        return f"{memory['memory_bytes'] / 2**20:.1f} МБ (float32: {memory['float_bytes'] / 2**20:.1f} МБ, ×{ratio:.1f})"
+
+    def _update_quantized(self, target, store, options):
+        """
+        Квантует матрицу эмбеддингов для поиска без FAISS (--quantize int8/pq)
+        в каталог поколения target и сравнивает recall@10 с точным поиском: по
+        кодам и с пересчётом кандидатов. Коды пересчитываются из матрицы
+        целиком — это быстрее кодирования текста.
+        """
+        mode = options["quantize"]
+        if mode == "none":
+            return None
+
+        params = self._quantize_params(options, store)
+        started = time.perf_counter()
+        qstore = quantization.STORES[mode].build(target, store, m=params.get("pq_m"), rerank=0)
+        build_seconds = time.perf_counter() - started
+
+        report = quantization.recall_report(qstore.search, store, k=10)
         info = {
-            "backend": backend,
-            "n_lectures": lectures.count(),
-            "has_embeddings": use_embeddings,
-            "model_name": model_name if use_embeddings else None,
+            **params,
+            "rerank": max(0, options["rerank"]),
+            "memory_bytes": qstore.nbytes,
+            "float_bytes": int(len(store) * store.dim * 4),
+            "recall_at_10": report["recall_at_k"],
+            "build_seconds": round(build_seconds, 3),
         }
-        info_path.write_text(json.dumps(info, indent=2), encoding="utf-8")
+        if info["rerank"]:
+            qstore.vectors, qstore.rerank = store, info["rerank"]
+            info["recall_at_10_reranked"] = quantization.recall_report(qstore.search, store, k=10)["recall_at_k"]
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Квантованные векторы ({mode}): память {self._format_memory(info)}, "
+                f"recall@10={info['recall_at_10']}"
+                + (f", с пересчётом top-{10 * info['rerank']}: {info['recall_at_10_reranked']}" if info["rerank"] else "")
+                + "."
+            )
+        )
+        return info
+
+    def _update_pgvector(self, pipeline, model_name, dim):
+        """
+        Доводит колонку pgvector до актуального состояния: новые векторы уже
+        записаны пайплайном, пустые строки заполняются из embedding_data.
+        Колонку и HNSW-индекс создаёт миграция 0011.
+        """
+        if not pgvector_store.column_matches(dim):
+            self.warn(
+                f"Размерность модели ({dim}) не совпадает с колонкой pgvector "
+                f"(SEARCH_PGVECTOR_DIM={pgvector_store.configured_dim()})."
+            )
+            return None
+        try:
+            with transaction.atomic():
+                filled = pgvector_store.backfill_from_lectures(model_name, dim)
+                pg_info = pgvector_store.finalize(model_name, dim)
+        except DatabaseError as exc:
+            self.warn(f"Не удалось обновить pgvector ({exc}).")
+            return None
+        if filled:
+            self.stdout.write(f"pgvector: дозаполнено {filled} векторов из embedding_data.")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"pgvector: векторов={pg_info['vectors']}, размерность={pg_info['dim']}, индекс HNSW."
+            )
+        )
+        return pg_info
+
+    def _bm25_changed(self, base: Path, previous, ids, fingerprints):
+        """
+        Лекции, добавленные, изменённые или удалённые с прошлой сборки BM25:
+        сравнение отпечатков текстов с сохранёнными в её каталоге. None — если
+        прошлой сборки (или её отпечатков) нет.
+        """
+        path = (previous or {}).get("path")
+        if not path:
+            return None
+        try:
+            with np.load(base / path / BM25_LECTURES_FILE) as data:
+                known = dict(zip(data["ids"].tolist(), data["fingerprints"].tolist()))
+        except (OSError, KeyError, ValueError):
+            return None
+        changed = {lec_id for lec_id, fp in zip(ids, fingerprints.tolist()) if known.pop(lec_id, None) != fp}
+        # Оставшиеся в known — удалённые лекции
+        return changed | set(known)
 
+    def _build_bm25(self, base: Path, ids, fingerprints, changed=None, previous=None):
+        """
+        Строит инвертированный BM25-индекс по фрагментам лекций в новом каталоге
+        models/bm25-<id>. Воркеры переключаются на него, когда видят новый
+        embeddings_info.json. Токены фрагментов берутся из TokenCache по хэшу
+        текста лекции: заново анализируются только новые и изменённые лекции.
+        Если ни одна лекция не изменилась (changed пуст), а анализатор и
+        разбиение на фрагменты те же, прежний каталог переиспользуется без пересборки.
+        """
+        analyzer = default_analyzer()
+        previous = previous or {}
+        if (
+            changed is not None
+            and not changed
+            and previous.get("analyzer") == analyzer.signature
+            and previous.get("passages") == passages.config()
+            and previous.get("path")
+            and (base / previous["path"]).is_dir()
+        ):
+            self.stdout.write(f"BM25-индекс: лекции не изменились, используется {previous['path']}.")
+            return {**previous, "reused": True}
+
+        self.stdout.write("Построение BM25-индекса...")
+        started = time.perf_counter()
+        name = f"bm25-{uuid.uuid4().hex[:12]}"
+        cache = TokenCache(base, {"analyzer": analyzer.signature, "passages": passages.config()})
+        try:
+            index = BM25Index.build(self._analyzed_passages(analyzer, cache), analyzer=analyzer)
+        finally:
+            cache.close()
+        index.save(base / name)
+        np.savez(
+            base / name / BM25_LECTURES_FILE,
+            ids=np.asarray(ids, dtype=np.int64),
+            fingerprints=np.asarray(fingerprints, dtype=np.uint64),
+        )
         self.stdout.write(
             self.style.SUCCESS(
-                f"Индексация завершена. Backend={backend}, лекций={lectures.count()}."
+                f"BM25-индекс: документов={len(index)}, термов={index.n_terms}, "
+                f"анализ: из кэша {cache.hits} лекций, заново {cache.misses} "
+                f"({time.perf_counter() - started:.2f} с)."
             )
         )
+        return {
+            "path": name,
+            "n_docs": len(index),
+            "n_terms": index.n_terms,
+            "analyzer": analyzer.signature,
+            "passages": passages.config(),
+            "reused": False,
+            "analysis_cache": {"hits": cache.hits, "misses": cache.misses},
+        }
 
+    @staticmethod
+    def _analyzed_passages(analyzer, cache):
+        rows = Lecture.objects.values_list("id", "title", "content_text").iterator(chunk_size=2000)
+        for lec_id, title, content in rows:
+            parts = passages.passage_texts(lec_id, title, content)
+            digest = content_hash(lecture_text(title, content))
+            tokens = cache.get(digest)
+            if tokens is None or len(tokens) != len(parts):
+                tokens = [analyzer.analyze(text) for _, text in parts]
+                cache.put(digest, tokens)
+            for (key, _), passage_tokens in zip(parts, tokens):
+                yield key, passage_tokens
+
+    def _update_neighbors(self, base, use_embeddings, model_name, changed, full, previous, bm25_info):
+        """
+        Обновляет граф похожих лекций (LectureNeighbor). Граф пересчитывается
+        инкрементально — только списки изменённых лекций и ссылавшихся на них, —
+        если он построен из того же источника с тем же k: векторный — той же
+        моделью, BM25 — тем же анализатором. changed=None — изменённые лекции
+        неизвестны, граф строится заново.
+        """
+        source = "vector" if use_embeddings else "bm25"
+        analyzer = bm25_info["analyzer"] if source == "bm25" else None
+        incremental = (
+            not full
+            and changed is not None
+            and bool(previous)
+            and previous.get("source") == source
+            and previous.get("model_name") == (model_name if use_embeddings else None)
+            and previous.get("analyzer") == analyzer
+            and previous.get("k") == related_lectures.NEIGHBORS_K
+        )
+        try:
+            info = related_lectures.update_graph(
+                source,
+                changed or set(),
+                full=not incremental,
+                model_name=model_name,
+                bm25=None if use_embeddings else load_index(base / bm25_info["path"]),
+            )
+        except DatabaseError as exc:
+            self.warn(f"Не удалось обновить граф похожих лекций ({exc}).")
+            return None
+        info["model_name"] = model_name if use_embeddings else None
+        info["analyzer"] = analyzer
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Похожие лекции ({source}, k={info['k']}): обновлено списков {info['updated']} "
+                f"из {info['lectures']} за {info['seconds']:.2f} с."
+            )
+        )
+        return info
 
+    def _update_suggest(self, base, changed, full):
+        """
+        Словарь подсказок строки поиска (main.autocomplete). Заголовки
+        неизменённых лекций берутся из прежнего models/suggest.json.
+        """
+        started = time.perf_counter()
+        previous = None if full else autocomplete.read_entries(base)
+        entries = autocomplete.build_entries(previous, changed, full=previous is None)
+        info = autocomplete.save(base, entries)
+        info["incremental"] = previous is not None
+        info["seconds"] = round(time.perf_counter() - started, 3)
+        self.stdout.write(
+            self.style.SUCCESS(f"Подсказки: {info['entries']} записей за {info['seconds']:.2f} с.")
+        )
+        return info
 
+    def _cleanup_generations(self, base: Path, previous, info=None):
+        """
+        Удаляет старые каталоги поколений BM25 и векторов, кроме текущего и
+        предыдущего: воркер, ещё не перечитавший embeddings_info.json, может
+        загрузить предыдущий каталог. Он удаляется при следующем запуске.
+        Векторные файлы старого формата в models/ удаляются, как только
+        предыдущее поколение уже лежит в каталоге.
+        """
+        keep = {
+            (descr.get(key) or {}).get("path")
+            for descr in (previous, info or {})
+            for key in ("bm25", "vectors")
+        }
+        for path in base.iterdir():
+            if path.is_dir() and path.name.startswith(GENERATION_PREFIXES) and path.name not in keep:
+                shutil.rmtree(path, ignore_errors=True)
+        if (previous.get("vectors") or {}).get("path") or not previous.get("has_embeddings"):
+            for name in LEGACY_VECTOR_FILES:
+                (base / name).unlink(missing_ok=True)
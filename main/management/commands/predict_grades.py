@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main import grade_predictions
+
+
+class Command(BaseCommand):
+    help = "Пакетный прогноз итоговых оценок для курса, группы или специальности."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--course", type=int, help="id курса")
+        parser.add_argument("--group", type=int, help="id группы")
+        parser.add_argument("--specialty", type=int, help="id специальности")
+        parser.add_argument(
+            "--no-store",
+            action="store_true",
+            help="Только вывести сводку, не сохраняя прогнозы в GradePrediction",
+        )
+
+    def handle(self, *args, **options):
+        if all(options[name] is None for name in ("course", "group", "specialty")):
+            raise CommandError("Нужно указать --course, --group или --specialty")
+        enrollments = grade_predictions.enrollments_for(
+            course=options["course"], group=options["group"], specialty=options["specialty"]
+        )
+        try:
+            result = grade_predictions.predict(enrollments, store=not options["no_store"])
+        except grade_predictions.ModelNotTrained as exc:
+            raise CommandError(str(exc))
+
+        per_1000 = result["seconds_per_1000"]
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Прогнозов: {result['count']} (модель {result['model_version']}) за {result['seconds']:.3f} с"
+                + (f", {per_1000:.3f} с на 1000 записей" if per_1000 is not None else "")
+                + (", сохранены в GradePrediction" if result["stored"] else "")
+            )
+        )
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from main import grade_features
+
+
+class Command(BaseCommand):
+    help = "Пересобирает таблицу признаков для прогноза оценок (EnrollmentFeatures)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--enrollment",
+            type=int,
+            action="append",
+            dest="enrollments",
+            help="Пересчитать только эти записи на курс (можно повторять)",
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        saved = grade_features.rebuild(options["enrollments"])
+        seconds = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(f"Признаки пересчитаны: {saved} записей на курс за {seconds:.2f} с")
+        )
@@ -0,0 +1,375 @@
+import json
+import os
+import platform
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from main import ann_index, postgres_fts
+from main.bm25_index import BM25Index
+from main.models import Course, Lecture
+from main.text_analysis import default_analyzer
+from main.vector_store import VectorStore, normalize
+
+BACKENDS = ("substring", "postgres_fts", "bm25", "database", "faiss")
+DEFAULT_SIZES = "1000,10000"
+WARMUP_QUERIES = 5
+
+SYLLABLES = (
+    "ба ва га да жа за ка ла ма на па ра са та фа ха ца ча ша бе ве ге де же зе ке ле ме не пе ре се те "
+    "би ви ги ди зи ки ли ми ни пи ри си ти бо во го до жо зо ко ло мо но по ро со то бу ву гу ду ку лу "
+    "му ну пу ру су ту ан ен ин он ул ор ар ер ир ас ис ос ем им ом ал ел ил"
+).split()
+
+
+def _rss_bytes():
+    """Текущий RSS процесса (Linux: /proc/self/statm), иначе пик по getrusage."""
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except ImportError:  # pragma: no cover - Windows
+        return None
+
+
+def _dir_bytes(path: Path) -> int:
+    return sum(p.stat().st_size for p in Path(path).rglob("*") if p.is_file())
+
+
+class SyntheticCorpus:
+    """
+    Синтетические лекции: у каждой тема, текст из слов темы и общего словаря
+    (частоты по Ципфу) и вектор — центр темы плюс шум. Запросы — известные
+    лекции: несколько слов из текста и зашумлённый вектор этой лекции.
+    """
+
+    def __init__(self, n: int, dim: int, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        n_topics = max(20, n // 200)
+        words = self._vocabulary(rng, 5000 + 50 * n_topics)
+        common, topic_words = np.array(words[:5000]), np.array(words[5000:]).reshape(n_topics, 50)
+
+        self.topics = rng.integers(0, n_topics, size=n)
+        zipf_cdf = np.cumsum(1.0 / np.arange(1, len(common) + 1))
+        zipf_cdf /= zipf_cdf[-1]
+        lengths = rng.integers(60, 121, size=n)
+        self.titles, self.texts = [], []
+        for i in range(n):
+            own = topic_words[self.topics[i]][rng.integers(0, 50, size=lengths[i] // 2)]
+            rest = common[np.searchsorted(zipf_cdf, rng.random(lengths[i] - len(own)))]
+            text = np.concatenate([own, rest])
+            rng.shuffle(text)
+            self.titles.append(" ".join(own[:3]).capitalize())
+            self.texts.append(" ".join(text.tolist()))
+
+        centers = normalize(rng.normal(size=(n_topics, dim)))
+        self.vectors = normalize(centers[self.topics] + 0.6 * rng.normal(size=(n, dim)) / np.sqrt(dim))
+        self.rng = rng
+
+    @staticmethod
+    def _vocabulary(rng, size):
+        words = set()
+        while len(words) < size:
+            words.add("".join(rng.choice(SYLLABLES, size=rng.integers(2, 5))))
+        return sorted(words)
+
+    def __len__(self):
+        return len(self.texts)
+
+    def queries(self, n_queries: int):
+        """[(позиция лекции, текст запроса, вектор запроса)]"""
+        rows = self.rng.choice(len(self), size=min(n_queries, len(self)), replace=False)
+        dim = self.vectors.shape[1]
+        result = []
+        for row in rows:
+            words = self.texts[row].split()
+            text = " ".join(self.rng.choice(words, size=3, replace=False).tolist())
+            vector = normalize(self.vectors[row] + 0.3 * self.rng.normal(size=dim) / np.sqrt(dim))[0]
+            result.append((int(row), text, vector))
+        return result
+
+
+class Command(BaseCommand):
+    help = (
+        "Бенчмарк поиска: синтетические корпуса заданных размеров, построение каждого "
+        "бэкенда и прогон набора запросов (p50/p95/p99, пропускная способность, память, "
+        "время построения, recall@k относительно точного поиска). Результат — JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            type=str,
+            default=DEFAULT_SIZES,
+            help="Размеры корпусов через запятую (например, 1000,10000,100000)",
+        )
+        parser.add_argument(
+            "--backends",
+            type=str,
+            default=",".join(BACKENDS),
+            help=f"Бэкенды через запятую: {', '.join(BACKENDS)}",
+        )
+        parser.add_argument("--queries", type=int, default=200, help="Число запросов на корпус")
+        parser.add_argument("--k", type=int, default=10, help="Глубина выдачи для recall@k")
+        parser.add_argument("--dim", type=int, default=384, help="Размерность синтетических векторов")
+        parser.add_argument("--seed", type=int, default=0, help="Зерно генератора корпуса")
+        parser.add_argument(
+            "--output",
+            type=str,
+            default=None,
+            help="Путь к JSON-отчёту (по умолчанию models/benchmarks/search-<время>.json)",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(s) for s in options["sizes"].split(",") if s.strip()]
+        except ValueError:
+            raise CommandError("--sizes: ожидаются целые числа через запятую")
+        backends = [b.strip() for b in options["backends"].split(",") if b.strip()]
+        unknown = set(backends) - set(BACKENDS)
+        if unknown or not sizes or min(sizes) < 2:
+            raise CommandError(f"Неизвестные бэкенды {sorted(unknown)} или неверные размеры {sizes}")
+        k = max(1, options["k"])
+
+        self.stdout.write(self.style.MIGRATE_HEADING("=== Бенчмарк поиска ==="))
+        report = {
+            "created_at": timezone.now().isoformat(),
+            "environment": self._environment(),
+            "params": {
+                "sizes": sizes,
+                "backends": backends,
+                "queries": options["queries"],
+                "k": k,
+                "dim": options["dim"],
+                "seed": options["seed"],
+            },
+            "runs": [],
+        }
+        for size in sizes:
+            started = time.perf_counter()
+            corpus = SyntheticCorpus(size, options["dim"], seed=options["seed"])
+            queries = corpus.queries(options["queries"])
+            run = {
+                "size": size,
+                "corpus_seconds": round(time.perf_counter() - started, 3),
+                "backends": {},
+            }
+            self.stdout.write(f"Корпус {size} лекций сгенерирован за {run['corpus_seconds']:.2f} с.")
+            exact = self._exact_top_k(corpus, queries, k)
+            with tempfile.TemporaryDirectory() as tmp:
+                for name in backends:
+                    result = getattr(self, f"_bench_{name}")(corpus, queries, k, exact, Path(tmp))
+                    run["backends"][name] = result
+                    self._print_result(size, name, result)
+            report["runs"].append(run)
+
+        output = Path(options["output"] or f"models/benchmarks/search-{timezone.now():%Y%m%d-%H%M%S}.json")
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+        self.stdout.write(self.style.SUCCESS(f"Отчёт записан в {output}"))
+
+    # ---------- Общие части ----------
+
+    @staticmethod
+    def _environment():
+        try:
+            import faiss  # type: ignore
+
+            faiss_version = getattr(faiss, "__version__", "unknown")
+        except ImportError:
+            faiss_version = None
+        return {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "database": connection.vendor,
+            "faiss": faiss_version,
+            "analyzer": default_analyzer().signature,
+            "cpu_count": os.cpu_count(),
+        }
+
+    @staticmethod
+    def _exact_top_k(corpus, queries, k):
+        # Точный поиск по всей матрице — эталон для recall@k векторных бэкендов
+        q = np.stack([vec for _, _, vec in queries])
+        scores = q @ corpus.vectors.T
+        top = np.argpartition(-scores, min(k, len(corpus)) - 1, axis=1)[:, :k]
+        return [set(row.tolist()) for row in top]
+
+    def _run_queries(self, search, queries, k, exact=None, positions=None):
+        """
+        Прогоняет запросы по одному. search(text, vector) возвращает id лекций;
+        positions переводит id в позиции корпуса. success@k — доля запросов,
+        где исходная лекция попала в top-k.
+        """
+        for row, text, vector in queries[:WARMUP_QUERIES]:
+            search(text, vector)
+        latencies, found = [], []
+        started = time.perf_counter()
+        for row, text, vector in queries:
+            t0 = time.perf_counter()
+            ids = search(text, vector)
+            latencies.append((time.perf_counter() - t0) * 1000.0)
+            found.append([positions(i) if positions else i for i in ids[:k]])
+        total = time.perf_counter() - started
+
+        lat = np.asarray(latencies)
+        result = {
+            "queries": len(queries),
+            "latency_ms": {
+                "p50": round(float(np.percentile(lat, 50)), 3),
+                "p95": round(float(np.percentile(lat, 95)), 3),
+                "p99": round(float(np.percentile(lat, 99)), 3),
+                "mean": round(float(lat.mean()), 3),
+            },
+            "throughput_qps": round(len(queries) / max(total, 1e-9), 1),
+            "success_at_k": round(
+                sum(row in hits for (row, _, _), hits in zip(queries, found)) / len(queries), 4
+            ),
+            "recall_at_k": None,
+        }
+        if exact is not None:
+            hits = sum(len(set(f) & e) for f, e in zip(found, exact))
+            result["recall_at_k"] = round(hits / sum(len(e) for e in exact), 4)
+        return result
+
+    def _measure_build(self, build):
+        rss_before = _rss_bytes()
+        started = time.perf_counter()
+        built = build()
+        seconds = time.perf_counter() - started
+        rss_after = _rss_bytes()
+        memory = None if rss_before is None or rss_after is None else max(rss_after - rss_before, 0)
+        return built, {"build_seconds": round(seconds, 3), "rss_delta_bytes": memory}
+
+    def _print_result(self, size, name, result):
+        if result.get("skipped"):
+            self.stdout.write(self.style.WARNING(f"  [{size}] {name}: пропущен ({result['skipped']})"))
+            return
+        lat = result["latency_ms"]
+        recall = result["recall_at_k"]
+        self.stdout.write(
+            f"  [{size}] {name}: построение {result['build_seconds']:.2f} с, "
+            f"p50={lat['p50']} p95={lat['p95']} p99={lat['p99']} мс, {result['throughput_qps']} запр/с, "
+            f"success@k={result['success_at_k']}"
+            + (f", recall@k={recall}" if recall is not None else "")
+        )
+
+    # ---------- Бэкенды в БД ----------
+
+    def _bench_db(self, corpus, queries, k, make_search):
+        """
+        Лекции вставляются во временную транзакцию и откатываются после замеров,
+        так что настоящие данные не меняются.
+        """
+        with transaction.atomic():
+            course = Course.objects.create(name="search_benchmark")
+
+            def insert():
+                lectures = Lecture.objects.bulk_create(
+                    [
+                        Lecture(course=course, title=title, content_text=text)
+                        for title, text in zip(corpus.titles, corpus.texts)
+                    ],
+                    batch_size=2000,
+                )
+                return {lec.pk: i for i, lec in enumerate(lectures)}
+
+            position, result = self._measure_build(insert)
+            result["index_bytes"] = self._table_bytes()
+            result.update(self._run_queries(make_search(course, k), queries, k, positions=position.get))
+            transaction.set_rollback(True)
+        return result
+
+    @staticmethod
+    def _table_bytes():
+        if connection.vendor != "postgresql":
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_total_relation_size(%s)", [Lecture._meta.db_table])
+            return int(cursor.fetchone()[0])
+
+    def _bench_substring(self, corpus, queries, k, exact, tmp):
+        def make_search(course, k):
+            def search(text, vector):
+                return list(
+                    Lecture.objects.filter(course=course)
+                    .filter(Q(title__icontains=text) | Q(content_text__icontains=text))
+                    .values_list("id", flat=True)[:k]
+                )
+
+            return search
+
+        return self._bench_db(corpus, queries, k, make_search)
+
+    def _bench_postgres_fts(self, corpus, queries, k, exact, tmp):
+        if not postgres_fts.available():
+            return {"skipped": "нужен PostgreSQL с колонкой search_vector"}
+
+        def make_search(course, k):
+            filters = {"course_ids": [course.pk]}
+            return lambda text, vector: [lec_id for lec_id, _, _ in postgres_fts.search(text, k, filters)]
+
+        return self._bench_db(corpus, queries, k, make_search)
+
+    # ---------- Индексы в памяти ----------
+
+    def _bench_bm25(self, corpus, queries, k, exact, tmp):
+        analyzer = default_analyzer()
+        index, result = self._measure_build(
+            lambda: BM25Index.build(
+                ((i, analyzer.analyze(f"{title}\n{text}")) for i, (title, text) in enumerate(zip(corpus.titles, corpus.texts))),
+                analyzer=analyzer,
+            )
+        )
+        index.save(tmp / "bm25")
+        result["index_bytes"] = _dir_bytes(tmp / "bm25")
+        result["n_terms"] = index.n_terms
+        result.update(
+            self._run_queries(lambda text, vector: [i for i, _ in index.search(index.analyze(text), k)], queries, k)
+        )
+        return result
+
+    def _bench_database(self, corpus, queries, k, exact, tmp):
+        base = tmp / "vectors"
+        base.mkdir(exist_ok=True)
+        store, result = self._measure_build(
+            lambda: VectorStore.save(base, np.arange(len(corpus)), corpus.vectors)
+        )
+        result["index_bytes"] = _dir_bytes(base)
+        result.update(
+            self._run_queries(lambda text, vector: [i for i, _ in store.search(vector, k)], queries, k, exact)
+        )
+        return result
+
+    def _bench_faiss(self, corpus, queries, k, exact, tmp):
+        try:
+            import faiss  # type: ignore
+        except ImportError:
+            return {"skipped": "faiss не установлен"}
+
+        store = VectorStore(np.ascontiguousarray(corpus.vectors), np.arange(len(corpus), dtype=np.int64))
+        index_type = ann_index.choose_index_type(len(corpus))
+        params = ann_index.default_params(index_type, len(corpus))
+        index, result = self._measure_build(lambda: ann_index.build_index(store, index_type, params))
+        faiss.write_index(index, str(tmp / "faiss.index"))
+        result["index_bytes"] = (tmp / "faiss.index").stat().st_size
+        result["index_type"] = index_type
+        result["params"] = params
+
+        def search(text, vector):
+            _, ids = index.search(vector[None, :], k)
+            return [int(i) for i in ids[0] if i >= 0]
+
+        result.update(self._run_queries(search, queries, k, exact))
+        return result
@@ -1,12 +1,15 @@
 import json
+import os
+import time
+import uuid
 from pathlib import Path
 
 import numpy as np
-from django.core.management.base import BaseCommand
-from django.db.models import Avg
+from django.core.management.base import BaseCommand, CommandError
 from django.utils import timezone
 
-from main.models import Enrollment, Grade, Attendance
+from main import grade_features
+from main import grade_model_selection as model_selection
 
 
 class Command(BaseCommand):
@@ -19,10 +22,43 @@ class Command(BaseCommand):
             default="models/grade_model.pkl",
             help="Путь для сохранения модели",
         )
+        parser.add_argument(
+            "--no-rebuild-features",
+            action="store_true",
+            help="Обучать на текущей таблице признаков без полной пересборки",
+        )
+        parser.add_argument(
+            "--select",
+            action="store_true",
+            help="Выбрать модель кросс-валидацией среди --candidates (иначе LinearRegression)",
+        )
+        parser.add_argument(
+            "--candidates",
+            type=str,
+            default=",".join(model_selection.CANDIDATES),
+            help="Кандидаты через запятую: linear, ridge, gbr, rf",
+        )
+        parser.add_argument(
+            "--folds",
+            type=int,
+            default=model_selection.DEFAULT_FOLDS,
+            help="Число фолдов кросс-валидации",
+        )
+        parser.add_argument(
+            "--jobs",
+            type=int,
+            default=None,
+            help="Число процессов (по умолчанию — все ядра)",
+        )
+        parser.add_argument(
+            "--time-budget",
+            type=float,
+            default=model_selection.DEFAULT_TIME_BUDGET,
+            help="Ограничение времени на выбор модели, секунд",
+        )
 
     def handle(self, *args, **options):
         try:
-            from sklearn.linear_model import LinearRegression
             from sklearn.preprocessing import StandardScaler
             from sklearn.model_selection import train_test_split
             import joblib
@@ -35,7 +71,10 @@ class Command(BaseCommand):
 
         self.stdout.write(self.style.MIGRATE_HEADING("=== Обучение модели прогноза оценок ==="))
 
-        X, y, feature_names = self._build_dataset()
+        started = time.perf_counter()
+        X, y, feature_names = self._build_dataset(rebuild=not options["no_rebuild_features"])
+        dataset_seconds = time.perf_counter() - started
+        self.stdout.write(f"Выборка: {len(X)} строк за {dataset_seconds:.2f} с")
         if len(X) < 20:
             self.stderr.write(
                 self.style.WARNING("Недостаточно данных для обучения модели (нужно >= 20 записей).")
@@ -49,115 +88,91 @@ class Command(BaseCommand):
             X, y, test_size=0.2, random_state=42
         )
 
+        model_name, selection = "linear", None
+        if options["select"]:
+            candidates = [c.strip() for c in options["candidates"].split(",") if c.strip()]
+            try:
+                selection = model_selection.select(
+                    X_train,
+                    y_train,
+                    candidates,
+                    folds=options["folds"],
+                    jobs=options["jobs"],
+                    time_budget=options["time_budget"],
+                )
+            except ValueError as exc:
+                raise CommandError(str(exc))
+            for name, entry in selection["candidates"].items():
+                cv = f"RMSE={entry['cv_rmse']:.2f}" if "cv_rmse" in entry else "—"
+                self.stdout.write(
+                    f"  {name}: {entry['status']}, фолдов {entry['folds_done']}, {cv}, обучение {entry['fit_seconds']:.2f} с"
+                )
+            if selection["best"] is None:
+                self.stderr.write(
+                    self.style.WARNING("Ни один кандидат не прошёл все фолды в пределах бюджета — используется LinearRegression.")
+                )
+            else:
+                model_name = selection["best"]
+            self.stdout.write(f"Выбрана модель: {model_name} (отбор {selection['seconds']:.1f} с)")
+
         scaler = StandardScaler()
         X_train_scaled = scaler.fit_transform(X_train)
         X_test_scaled = scaler.transform(X_test)
 
-        model = LinearRegression()
+        model = model_selection.make_model(model_name)
         model.fit(X_train_scaled, y_train)
 
         preds = model.predict(X_test_scaled)
-        rmse = float(np.sqrt(np.mean((preds - y_test) ** 2)))
-        r2 = float(1 - np.sum((y_test - preds) ** 2) / np.sum((y_test - np.mean(y_test)) ** 2))
-
+        rmse = model_selection.rmse(preds, y_test)
+        r2 = model_selection.r2(preds, y_test)
+
+        trained_at = timezone.now()
+        # Версия артефакта для реестра моделей (main/model_registry.py)
+        version = f"{trained_at:%Y%m%d%H%M%S}-{uuid.uuid4().hex[:8]}"
+        # Запись через временный файл и os.replace: воркеры, которые
+        # перечитывают модель на лету, видят либо старую, либо новую целиком
+        tmp_path = save_path.with_name(save_path.name + ".tmp")
         joblib.dump(
             {
                 "model": model,
                 "scaler": scaler,
                 "feature_names": feature_names,
-                "trained_at": timezone.now().isoformat(),
+                "trained_at": trained_at.isoformat(),
+                "version": version,
             },
-            save_path,
+            tmp_path,
         )
+        os.replace(tmp_path, save_path)
 
         metrics_path = save_path.parent / "metrics.json"
         metrics = {
             "rmse": rmse,
             "r2": r2,
+            "version": version,
+            "model": model_name,
             "n_samples": int(len(X)),
             "n_features": len(feature_names),
+            "dataset_seconds": round(dataset_seconds, 3),
             "feature_names": feature_names,
         }
+        if selection is not None:
+            metrics["selection"] = selection
         metrics_path.write_text(json.dumps(metrics, indent=2), encoding="utf-8")
 
         self.stdout.write(
             self.style.SUCCESS(
-                f"Модель сохранена в {save_path}, метрики в {metrics_path} (RMSE={rmse:.2f}, R2={r2:.3f})"
+                f"Модель {version} сохранена в {save_path}, метрики в {metrics_path} (RMSE={rmse:.2f}, R2={r2:.3f})"
             )
         )
 
-    def _build_dataset(self):
+    def _build_dataset(self, rebuild=True):
         """
-        Формирует выборку на основе Enrollment/Attendance/Grade.
+        Формирует выборку из таблицы признаков (main/grade_features.py).
         Целевая переменная: итоговая оценка (финальный экзамен).
+        По умолчанию таблица сначала пересобирается целиком — постоянным
+        числом запросов, — чтобы учесть изменения в обход сигналов.
         """
-        X = []
-        y = []
-        feature_names = [
-            "attendance_rate",
-            "avg_homework",
-            "midterm_score",
-            "previous_gpa",
-        ]
-
-        enrollments = Enrollment.objects.all().select_related("student", "course")
-        for enr in enrollments:
-            grades_qs = Grade.objects.filter(enrollment=enr)
-            if not grades_qs.exists():
-                continue
-
-            final_grade = grades_qs.filter(assignment_name__icontains="Финальный").order_by(
-                "-date"
-            ).first()
-            if not final_grade:
-                # fallback: максимальная оценка как итоговая
-                final_grade = grades_qs.order_by("-value").first()
-            if not final_grade:
-                continue
-
-            # Признак: посещаемость
-            att_qs = Attendance.objects.filter(enrollment=enr)
-            attendance_rate = 1.0
-            if att_qs.exists():
-                total = att_qs.count()
-                present = att_qs.filter(present=True).count()
-                attendance_rate = present / total if total else 1.0
-
-            # Признак: средний балл за домашние задания
-            hw_avg = grades_qs.filter(assignment_name__icontains="Домашнее").aggregate(
-                avg=Avg("value")
-            )["avg"]
-            if hw_avg is None:
-                hw_avg = grades_qs.exclude(assignment_name__icontains="Финал").aggregate(
-                    avg=Avg("value")
-                )["avg"] or 0
-
-            # Признак: midterm
-            midterm = grades_qs.filter(assignment_name__icontains="Midterm").order_by(
-                "-date"
-            ).first()
-            midterm_score = float(midterm.value) if midterm else float(hw_avg)
-
-            # Признак: предыдущий GPA (средняя оценка по другим курсам)
-            previous_grades = Grade.objects.filter(
-                student=enr.student.user if enr.student.user else None
-            ).exclude(course=enr.course)
-            if previous_grades.exists():
-                previous_gpa = float(previous_grades.aggregate(avg=Avg("value"))["avg"] or 0)
-            else:
-                previous_gpa = float(hw_avg)
-
-            X.append(
-                [
-                    float(attendance_rate * 100.0),
-                    float(hw_avg),
-                    float(midterm_score),
-                    float(previous_gpa),
-                ]
-            )
-            y.append(float(final_grade.value))
-
-        return X, y, feature_names
-
-
-
+        if rebuild:
+            grade_features.rebuild()
+        X, y = grade_features.training_set()
+        return X, y, list(grade_features.FEATURE_NAMES)
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0008_remove_scheduleentry_group_examprediction_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lecture',
+            name='content_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, verbose_name='Хэш проиндексированного текста'),
+        ),
+        migrations.AddField(
+            model_name='lecture',
+            name='embedding_model',
+            field=models.CharField(blank=True, editable=False, max_length=200, verbose_name='Модель эмбеддинга'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+from django.db import migrations
+
+
+# Колонка tsvector вычисляется самой PostgreSQL (generated column), поэтому
+# остаётся актуальной при любой записи в таблицу, включая bulk_update и правки
+# в админке. В модель Lecture она не добавлена: Django не должен писать в неё.
+CREATE_SQL = [
+    """
+    ALTER TABLE main_lecture ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('russian', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('russian', coalesce(content_text, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS main_lecture_search_vector_gin ON main_lecture USING GIN (search_vector)",
+]
+
+DROP_SQL = [
+    "DROP INDEX IF EXISTS main_lecture_search_vector_gin",
+    "ALTER TABLE main_lecture DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def add_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for sql in CREATE_SQL:
+        schema_editor.execute(sql)
+
+
+def remove_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for sql in DROP_SQL:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0009_lecture_content_hash_embedding_model'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_search_vector, remove_search_vector),
+    ]
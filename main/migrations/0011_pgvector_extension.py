@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.db import migrations
+
+
+# Расширение pgvector ставится, только если оно доступно на сервере: без него
+# поиск работает на FAISS/BM25. Колонка vector(n) и HNSW-индекс создаются
+# здесь же, размерность — SEARCH_PGVECTOR_DIM (размерность модели эмбеддингов).
+# Имена и параметры индекса совпадают с константами main/pgvector_store.py.
+TABLE = 'main_lecture'
+COLUMN = 'embedding'
+INDEX_NAME = 'main_lecture_embedding_hnsw'
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 64
+
+
+def create_extension(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'vector'")
+        if cursor.fetchone() is None:
+            return
+    dim = int(getattr(settings, 'SEARCH_PGVECTOR_DIM', 384))
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS vector")
+    schema_editor.execute(f"ALTER TABLE {TABLE} ADD COLUMN IF NOT EXISTS {COLUMN} vector({dim})")
+    schema_editor.execute(
+        f"CREATE INDEX IF NOT EXISTS {INDEX_NAME} ON {TABLE} "
+        f"USING hnsw ({COLUMN} vector_cosine_ops) "
+        f"WITH (m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION})"
+    )
+
+
+def drop_column(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f"DROP INDEX IF EXISTS {INDEX_NAME}")
+    schema_editor.execute(f"ALTER TABLE {TABLE} DROP COLUMN IF EXISTS {COLUMN}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0010_lecture_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_extension, drop_column),
+    ]
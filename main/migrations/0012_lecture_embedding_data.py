@@ -0,0 +1,70 @@
+import numpy as np
+from django.db import migrations, models
+
+CHUNK = 500
+
+
+def json_to_binary(apps, schema_editor):
+    """Переносит векторы из JSON в float32-байты пачками."""
+    Lecture = apps.get_model('main', 'Lecture')
+    rows = Lecture.objects.exclude(vector_embedding=None).only('id', 'vector_embedding')
+    batch = []
+    for lecture in rows.iterator(chunk_size=CHUNK):
+        vector = lecture.vector_embedding
+        if not isinstance(vector, list) or not vector:
+            continue
+        array = np.asarray(vector, dtype=np.float32)
+        lecture.embedding_data = array.tobytes()
+        lecture.embedding_dim = int(array.shape[0])
+        lecture.embedding_dtype = 'float32'
+        batch.append(lecture)
+        if len(batch) >= CHUNK:
+            Lecture.objects.bulk_update(batch, ['embedding_data', 'embedding_dim', 'embedding_dtype'])
+            batch = []
+    if batch:
+        Lecture.objects.bulk_update(batch, ['embedding_data', 'embedding_dim', 'embedding_dtype'])
+
+
+def binary_to_json(apps, schema_editor):
+    Lecture = apps.get_model('main', 'Lecture')
+    rows = Lecture.objects.exclude(embedding_data=None).only('id', 'embedding_data', 'embedding_dim', 'embedding_dtype')
+    batch = []
+    for lecture in rows.iterator(chunk_size=CHUNK):
+        vector = np.frombuffer(lecture.embedding_data, dtype=lecture.embedding_dtype or 'float32')
+        lecture.vector_embedding = vector.astype(np.float32).tolist()
+        batch.append(lecture)
+        if len(batch) >= CHUNK:
+            Lecture.objects.bulk_update(batch, ['vector_embedding'])
+            batch = []
+    if batch:
+        Lecture.objects.bulk_update(batch, ['vector_embedding'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0011_pgvector_extension'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lecture',
+            name='embedding_data',
+            field=models.BinaryField(blank=True, editable=False, null=True, verbose_name='Векторное представление'),
+        ),
+        migrations.AddField(
+            model_name='lecture',
+            name='embedding_dim',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Размерность вектора'),
+        ),
+        migrations.AddField(
+            model_name='lecture',
+            name='embedding_dtype',
+            field=models.CharField(blank=True, default='float32', editable=False, max_length=8, verbose_name='Тип элементов вектора'),
+        ),
+        migrations.RunPython(json_to_binary, binary_to_json),
+        migrations.RemoveField(
+            model_name='lecture',
+            name='vector_embedding',
+        ),
+    ]
@@ -0,0 +1,40 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0012_lecture_embedding_data'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndexingJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index_name', models.CharField(default='lectures', max_length=50, verbose_name='Индекс')),
+                ('status', models.CharField(choices=[('queued', 'В очереди'), ('running', 'Выполняется'), ('succeeded', 'Завершена'), ('failed', 'Ошибка')], default='queued', max_length=20, verbose_name='Статус')),
+                ('stage', models.CharField(blank=True, max_length=20, verbose_name='Этап')),
+                ('options', models.JSONField(blank=True, default=dict, verbose_name='Параметры index_lectures')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='Всего лекций')),
+                ('processed', models.PositiveIntegerField(default=0, verbose_name='Обработано лекций')),
+                ('encoded', models.PositiveIntegerField(default=0, verbose_name='Закодировано лекций')),
+                ('errors', models.JSONField(blank=True, default=list, verbose_name='Ошибки и предупреждения')),
+                ('pid', models.PositiveIntegerField(blank=True, null=True, verbose_name='PID процесса')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='indexing_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Задача индексации',
+                'verbose_name_plural': 'Задачи индексации',
+                'ordering': ['-created_at'],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status__in', ['queued', 'running'])), fields=('index_name',), name='unique_active_indexing_job')],
+            },
+        ),
+    ]
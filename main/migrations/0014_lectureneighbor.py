@@ -0,0 +1,28 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0013_indexingjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LectureNeighbor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField(verbose_name='Место')),
+                ('score', models.FloatField(verbose_name='Близость')),
+                ('lecture', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbors', to='main.lecture')),
+                ('neighbor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='main.lecture')),
+            ],
+            options={
+                'verbose_name': 'Похожая лекция',
+                'verbose_name_plural': 'Похожие лекции',
+                'ordering': ['lecture', 'rank'],
+                'constraints': [models.UniqueConstraint(fields=('lecture', 'rank'), name='unique_lecture_neighbor_rank')],
+            },
+        ),
+    ]
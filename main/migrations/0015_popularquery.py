@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0014_lectureneighbor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PopularQuery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('query', models.CharField(max_length=200, unique=True, verbose_name='Запрос')),
+                ('count', models.PositiveIntegerField(default=1, verbose_name='Количество')),
+                ('last_seen', models.DateTimeField(auto_now=True, verbose_name='Последний раз')),
+            ],
+            options={
+                'verbose_name': 'Популярный запрос',
+                'verbose_name_plural': 'Популярные запросы',
+                'ordering': ['-count'],
+                'indexes': [models.Index(fields=['-count'], name='popular_query_count_idx')],
+            },
+        ),
+    ]
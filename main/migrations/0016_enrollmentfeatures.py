@@ -0,0 +1,28 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0015_popularquery'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EnrollmentFeatures',
+            fields=[
+                ('enrollment', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='features', serialize=False, to='main.enrollment')),
+                ('attendance_rate', models.FloatField(verbose_name='Посещаемость, %')),
+                ('avg_homework', models.FloatField(verbose_name='Средний балл за домашние')),
+                ('midterm_score', models.FloatField(verbose_name='Midterm')),
+                ('previous_gpa', models.FloatField(verbose_name='Предыдущий GPA')),
+                ('final_grade', models.FloatField(blank=True, null=True, verbose_name='Итоговая оценка')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Признаки записи на курс',
+                'verbose_name_plural': 'Признаки записей на курс',
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0016_enrollmentfeatures'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GradePrediction',
+            fields=[
+                ('enrollment', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='grade_prediction', serialize=False, to='main.enrollment')),
+                ('predicted_grade', models.FloatField(verbose_name='Прогноз итоговой оценки')),
+                ('confidence', models.FloatField(verbose_name='Уверенность модели')),
+                ('contributions', models.JSONField(blank=True, default=dict, verbose_name='Вклад признаков')),
+                ('model_version', models.CharField(blank=True, max_length=64, verbose_name='Версия модели')),
+                ('predicted_at', models.DateTimeField(auto_now=True, verbose_name='Дата прогноза')),
+            ],
+            options={
+                'verbose_name': 'Прогноз оценки',
+                'verbose_name_plural': 'Прогнозы оценок',
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0017_gradeprediction'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='indexingjob',
+            name='host',
+            field=models.CharField(blank=True, max_length=255, verbose_name='Хост процесса'),
+        ),
+        migrations.AddField(
+            model_name='indexingjob',
+            name='process_started',
+            field=models.BigIntegerField(blank=True, null=True, verbose_name='Время запуска процесса (такты с загрузки)'),
+        ),
+    ]
@@ -0,0 +1,189 @@
+"""
+Реестр модели прогноза оценок.
+
+Артефакт train_grade_model (models/grade_model.pkl) загружается один раз на
+процесс (воркер gunicorn) и перечитывается только тогда, когда файл
+заменён: проверка свежести — один stat() (mtime и размер). train_grade_model
+пишет артефакт через временный файл и os.replace, поэтому читатель видит
+либо старую, либо новую модель целиком, а новый снимок подменяет старый
+одной операцией присваивания.
+
+Линейная модель вместе со StandardScaler сводится к w·x + b, так что прогноз —
+одно скалярное произведение без вызова scikit-learn.
+"""
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+MODEL_PATH = Path("models/grade_model.pkl")
+
+# Сколько последних прогнозов учитывать при расчёте перцентилей задержки
+LATENCY_WINDOW = 1000
+
+
+def _linear_form(model, scaler) -> Tuple[Optional[np.ndarray], float]:
+    """
+    Веса и сдвиг линейной модели в пространстве исходных признаков:
+    coef·((x - mean) / scale) + intercept = w·x + b. (None, 0) — модель не линейная.
+    """
+    coef = getattr(model, "coef_", None)
+    if coef is None or np.ndim(coef) != 1:
+        return None, 0.0
+    coef = np.asarray(coef, dtype=float)
+    mean = getattr(scaler, "mean_", None)
+    scale = getattr(scaler, "scale_", None)
+    mean = np.zeros_like(coef) if mean is None else np.asarray(mean, dtype=float)
+    scale = np.ones_like(coef) if scale is None else np.asarray(scale, dtype=float)
+    weights = coef / scale
+    bias = float(np.asarray(getattr(model, "intercept_", 0.0), dtype=float)) - float(weights @ mean)
+    return weights, bias
+
+
+class LoadedModel:
+    """
+    Неизменяемый снимок загруженного артефакта.
+    """
+
+    def __init__(self, bundle: Dict[str, Any], signature, load_seconds: float):
+        self.model = bundle["model"]
+        self.scaler = bundle["scaler"]
+        self.feature_names = list(bundle["feature_names"])
+        self.trained_at = bundle.get("trained_at")
+        # Артефакты старых версий train_grade_model без version — по времени файла
+        self.version = bundle.get("version") or f"mtime-{signature[0]}"
+        self.signature = signature
+        self.load_seconds = load_seconds
+        self.loaded_at = time.time()
+        self.weights, self.bias = _linear_form(self.model, self.scaler)
+
+    def predict(self, X) -> np.ndarray:
+        """
+        Прогноз для матрицы признаков (строки в порядке feature_names).
+        """
+        X = np.atleast_2d(np.asarray(X, dtype=float))
+        if self.weights is not None:
+            return X @ self.weights + self.bias
+        return np.asarray(self.model.predict(self.scaler.transform(X)), dtype=float)
+
+    def explain(self, X) -> Tuple[Optional[np.ndarray], float]:
+        """
+        Простое объяснение прогноза: (вклады признаков по строкам X, уверенность).
+        Для линейной модели вклад — coef × значение признака, для деревьев —
+        feature_importances_ (одинаковые для всех строк). (None, 0.5) — модель
+        не даёт ни того, ни другого.
+        """
+        X = np.atleast_2d(np.asarray(X, dtype=float))
+        coef = getattr(self.model, "coef_", None)
+        if coef is not None:
+            return X * np.asarray(coef, dtype=float), 0.8
+        importances = getattr(self.model, "feature_importances_", None)
+        if importances is not None:
+            importances = np.asarray(importances, dtype=float)
+            confidence = float(importances.max()) if len(importances) else 0.5
+            return np.broadcast_to(importances, X.shape), confidence
+        return None, 0.5
+
+
+class ModelRegistry:
+    def __init__(self, path: Path = MODEL_PATH):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._current: Optional[LoadedModel] = None
+
+        self.loads = 0
+        self.predictions = 0
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def _signature(self):
+        try:
+            st = self.path.stat()
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def current(self) -> Optional[LoadedModel]:
+        """
+        Актуальная модель; None — если модель ещё не обучена.
+        """
+        signature = self._signature()
+        if signature is None:
+            return None
+        current = self._current
+        if current is None or current.signature != signature:
+            with self._lock:
+                current = self._current
+                if current is None or current.signature != signature:
+                    current = self._load(signature)
+        return current
+
+    def _load(self, signature) -> LoadedModel:
+        import joblib  # type: ignore
+
+        started = time.perf_counter()
+        bundle = joblib.load(self.path)
+        loaded = LoadedModel(bundle, signature, time.perf_counter() - started)
+        self._current = loaded
+        self.loads += 1
+        return loaded
+
+    def predict(self, X) -> Tuple[Optional[np.ndarray], Optional[LoadedModel]]:
+        """
+        Прогноз актуальной моделью и сама модель (для версии и вкладов
+        признаков). (None, None) — если модель ещё не обучена.
+        """
+        loaded = self.current()
+        if loaded is None:
+            return None, None
+        started = time.perf_counter()
+        preds = loaded.predict(X)
+        self._latencies.append((time.perf_counter() - started) * 1000.0)
+        self.predictions += 1
+        return preds, loaded
+
+    def stats(self) -> Dict[str, Any]:
+        loaded = self._current
+        latencies = sorted(self._latencies)
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))], 4)
+
+        return {
+            "path": str(self.path),
+            "loaded": loaded is not None,
+            "version": loaded.version if loaded else None,
+            "trained_at": loaded.trained_at if loaded else None,
+            "model": type(loaded.model).__name__ if loaded else None,
+            "linear": loaded is not None and loaded.weights is not None,
+            "loaded_at": loaded.loaded_at if loaded else None,
+            "load_seconds": round(loaded.load_seconds, 4) if loaded else None,
+            "loads": self.loads,
+            "predictions": self.predictions,
+            "latency_ms": {
+                "avg": round(sum(latencies) / len(latencies), 4) if latencies else None,
+                "p50": percentile(0.50),
+                "p95": percentile(0.95),
+                "max": round(latencies[-1], 4) if latencies else None,
+            },
+        }
+
+
+_registry: Optional[ModelRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> ModelRegistry:
+    """
+    Возвращает единственный на процесс реестр.
+    """
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ModelRegistry()
+    return _registry
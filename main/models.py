@@ -245,12 +245,22 @@ class Enrollment(models.Model):
         return f"{self.student} - {self.course.name}"
 
 # ----------------- Lecture -----------------
+class LectureManager(models.Manager):
+    def get_queryset(self):
+        # Байты эмбеддинга нужны только индексации — обычные выборки их не читают
+        return super().get_queryset().defer('embedding_data')
+
+
 class Lecture(models.Model):
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='lectures')
     title = models.CharField(max_length=200, verbose_name='Название')
     content_text = models.TextField(blank=True, verbose_name='Содержание')
     content_url = models.URLField(blank=True, null=True, verbose_name='Ссылка')
-    vector_embedding = models.JSONField(null=True, blank=True, verbose_name='Векторное представление')
+    embedding_data = models.BinaryField(null=True, blank=True, editable=False, verbose_name='Векторное представление')
+    embedding_dim = models.PositiveIntegerField(null=True, blank=True, editable=False, verbose_name='Размерность вектора')
+    embedding_dtype = models.CharField(max_length=8, blank=True, default='float32', editable=False, verbose_name='Тип элементов вектора')
+    content_hash = models.CharField(max_length=64, blank=True, editable=False, verbose_name='Хэш проиндексированного текста')
+    embedding_model = models.CharField(max_length=200, blank=True, editable=False, verbose_name='Модель эмбеддинга')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
 
     class Meta:
@@ -258,9 +268,118 @@ class Lecture(models.Model):
         verbose_name_plural = 'Лекции'
         ordering = ['-created_at']
 
+    objects = LectureManager()
+
     def __str__(self):
         return f"{self.course.name} - {self.title}"
 
+    @property
+    def embedding_vector(self):
+        """Эмбеддинг лекции как массив NumPy без копирования (или None)."""
+        from .indexing import unpack_vector
+
+        return unpack_vector(self.embedding_data, self.embedding_dim, self.embedding_dtype)
+
+    def set_embedding(self, vector, dtype='float32'):
+        from .indexing import pack_vector
+
+        self.embedding_data, self.embedding_dim = pack_vector(vector, dtype)
+        self.embedding_dtype = dtype
+
+# ----------------- LectureNeighbor -----------------
+class LectureNeighbor(models.Model):
+    """Похожая лекция: ребро графа k ближайших соседей, который строит index_lectures"""
+    lecture = models.ForeignKey(Lecture, on_delete=models.CASCADE, related_name='neighbors')
+    neighbor = models.ForeignKey(Lecture, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField(verbose_name='Место')
+    score = models.FloatField(verbose_name='Близость')
+
+    class Meta:
+        verbose_name = 'Похожая лекция'
+        verbose_name_plural = 'Похожие лекции'
+        ordering = ['lecture', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['lecture', 'rank'], name='unique_lecture_neighbor_rank'),
+        ]
+
+    def __str__(self):
+        return f"{self.lecture_id} → {self.neighbor_id} (#{self.rank})"
+
+# ----------------- PopularQuery -----------------
+class PopularQuery(models.Model):
+    """Поисковый запрос ИИ-помощника и сколько раз его задавали (для подсказок)"""
+    query = models.CharField(max_length=200, unique=True, verbose_name='Запрос')
+    count = models.PositiveIntegerField(default=1, verbose_name='Количество')
+    last_seen = models.DateTimeField(auto_now=True, verbose_name='Последний раз')
+
+    class Meta:
+        verbose_name = 'Популярный запрос'
+        verbose_name_plural = 'Популярные запросы'
+        ordering = ['-count']
+        indexes = [models.Index(fields=['-count'], name='popular_query_count_idx')]
+
+    def __str__(self):
+        return f"{self.query} ({self.count})"
+
+# ----------------- IndexingJob -----------------
+class IndexingJob(models.Model):
+    """Фоновая переиндексация лекций (index_lectures в отдельном процессе)"""
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'В очереди'),
+        (STATUS_RUNNING, 'Выполняется'),
+        (STATUS_SUCCEEDED, 'Завершена'),
+        (STATUS_FAILED, 'Ошибка'),
+    ]
+    ACTIVE_STATUSES = (STATUS_QUEUED, STATUS_RUNNING)
+
+    index_name = models.CharField(max_length=50, default='lectures', verbose_name='Индекс')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED, verbose_name='Статус')
+    stage = models.CharField(max_length=20, blank=True, verbose_name='Этап')
+    options = models.JSONField(default=dict, blank=True, verbose_name='Параметры index_lectures')
+    total = models.PositiveIntegerField(default=0, verbose_name='Всего лекций')
+    processed = models.PositiveIntegerField(default=0, verbose_name='Обработано лекций')
+    encoded = models.PositiveIntegerField(default=0, verbose_name='Закодировано лекций')
+    errors = models.JSONField(default=list, blank=True, verbose_name='Ошибки и предупреждения')
+    pid = models.PositiveIntegerField(null=True, blank=True, verbose_name='PID процесса')
+    host = models.CharField(max_length=255, blank=True, verbose_name='Хост процесса')
+    process_started = models.BigIntegerField(null=True, blank=True, verbose_name='Время запуска процесса (такты с загрузки)')
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='indexing_jobs')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Задача индексации'
+        verbose_name_plural = 'Задачи индексации'
+        ordering = ['-created_at']
+        constraints = [
+            # Не больше одной активной задачи на индекс: повторный запуск получает уже идущую
+            models.UniqueConstraint(
+                fields=['index_name'],
+                condition=models.Q(status__in=['queued', 'running']),
+                name='unique_active_indexing_job',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Индексация #{self.pk} ({self.get_status_display()})"
+
+    @property
+    def is_active(self):
+        return self.status in self.ACTIVE_STATUSES
+
+    def eta_seconds(self):
+        """Оценка оставшегося времени по средней скорости обработки лекций."""
+        if self.status != self.STATUS_RUNNING or not self.started_at or not self.processed or not self.total:
+            return None
+        elapsed = (timezone.now() - self.started_at).total_seconds()
+        return round(elapsed / self.processed * max(self.total - self.processed, 0), 1)
+
 # ----------------- Attendance -----------------
 class Attendance(models.Model):
     enrollment = models.ForeignKey(Enrollment, on_delete=models.CASCADE, related_name='attendances')
@@ -315,6 +434,42 @@ class Grade(models.Model):
         student_name = self.student.username if self.student else (self.enrollment.student if self.enrollment else "Неизвестно")
         return f"{student_name} - {self.course.name} - {self.value}"
 
+# ----------------- EnrollmentFeatures -----------------
+class EnrollmentFeatures(models.Model):
+    """Признаки записи на курс для прогноза итоговой оценки (см. main/grade_features.py)"""
+    enrollment = models.OneToOneField(Enrollment, on_delete=models.CASCADE, primary_key=True, related_name='features')
+    attendance_rate = models.FloatField(verbose_name='Посещаемость, %')
+    avg_homework = models.FloatField(verbose_name='Средний балл за домашние')
+    midterm_score = models.FloatField(verbose_name='Midterm')
+    previous_gpa = models.FloatField(verbose_name='Предыдущий GPA')
+    # Итоговая оценка (целевая переменная); пусто, если оценок ещё нет
+    final_grade = models.FloatField(null=True, blank=True, verbose_name='Итоговая оценка')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Признаки записи на курс'
+        verbose_name_plural = 'Признаки записей на курс'
+
+    def __str__(self):
+        return f"Признаки записи {self.enrollment_id}"
+
+# ----------------- GradePrediction -----------------
+class GradePrediction(models.Model):
+    """Последний пакетный прогноз итоговой оценки по записи на курс (predict_grades)"""
+    enrollment = models.OneToOneField(Enrollment, on_delete=models.CASCADE, primary_key=True, related_name='grade_prediction')
+    predicted_grade = models.FloatField(verbose_name='Прогноз итоговой оценки')
+    confidence = models.FloatField(verbose_name='Уверенность модели')
+    contributions = models.JSONField(default=dict, blank=True, verbose_name='Вклад признаков')
+    model_version = models.CharField(max_length=64, blank=True, verbose_name='Версия модели')
+    predicted_at = models.DateTimeField(auto_now=True, verbose_name='Дата прогноза')
+
+    class Meta:
+        verbose_name = 'Прогноз оценки'
+        verbose_name_plural = 'Прогнозы оценок'
+
+    def __str__(self):
+        return f"Прогноз записи {self.enrollment_id}: {self.predicted_grade:.1f}"
+
 # ----------------- SmartLearningProfile -----------------
 class SmartLearningProfile(models.Model):
     """Умный профиль обучения студента с ИИ-анализом"""
@@ -0,0 +1,106 @@
+"""
+Разбиение лекций на перекрывающиеся фрагменты (passages).
+
+В эмбеддинги и BM25 попадают фрагменты, а не вся лекция целиком, поэтому
+длинная лекция не «размывается» в один усреднённый вектор. Id фрагмента
+кодирует id лекции и номер фрагмента: key = lecture_id << PASSAGE_BITS | n.
+Границы фрагмента — символьные смещения в content_text; они однозначно
+восстанавливаются из текста функцией split_passages.
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+PASSAGE_CHARS = 800
+PASSAGE_OVERLAP = 160
+PASSAGE_BITS = 16
+MAX_PASSAGES = 1 << PASSAGE_BITS
+
+# Во сколько раз больше фрагментов запрашивать у бэкенда, чем нужно лекций:
+# несколько фрагментов одной лекции схлопываются в один результат
+POOL_FACTOR = 4
+
+
+def config() -> Dict[str, int]:
+    """
+    Параметры разбиения; записываются в embeddings_info.json, и при их смене
+    index_lectures перекодирует все лекции.
+    """
+    return {"chars": PASSAGE_CHARS, "overlap": PASSAGE_OVERLAP, "bits": PASSAGE_BITS}
+
+
+def split_passages(
+    text: str, size: int = PASSAGE_CHARS, overlap: int = PASSAGE_OVERLAP
+) -> List[Tuple[int, int]]:
+    """
+    Делит текст на фрагменты около size символов с перекрытием overlap.
+    Границы по возможности сдвигаются на пробел, чтобы не резать слова.
+    Возвращает список (start, end); у пустого текста один фрагмент (0, 0).
+    """
+    text = text or ""
+    n = len(text)
+    if n <= size:
+        return [(0, n)]
+
+    spans = []
+    start = 0
+    while True:
+        end = min(start + size, n)
+        if end < n:
+            cut = text.rfind(" ", start + size // 2, end)
+            if cut > start:
+                end = cut
+        if len(spans) == MAX_PASSAGES - 1:
+            end = n
+        spans.append((start, end))
+        if end >= n:
+            return spans
+        next_start = max(end - overlap, start + 1)
+        space = text.find(" ", next_start, end)
+        start = space + 1 if space != -1 else next_start
+
+
+def passage_key(lecture_id: int, n: int) -> int:
+    return (int(lecture_id) << PASSAGE_BITS) | int(n)
+
+
+def lecture_of(keys) -> np.ndarray:
+    return np.asarray(keys, dtype=np.int64) >> PASSAGE_BITS
+
+
+def passage_texts(lecture_id: int, title: str, content_text: str) -> List[Tuple[int, str]]:
+    """
+    Фрагменты лекции для индексации: [(key, текст)]. Заголовок добавляется
+    к каждому фрагменту, чтобы у фрагмента из середины лекции был контекст.
+    """
+    content_text = content_text or ""
+    title = title or ""
+    return [
+        (passage_key(lecture_id, n), f"{title}\n{content_text[start:end]}".strip())
+        for n, (start, end) in enumerate(split_passages(content_text))
+    ]
+
+
+def keys_for_lectures(keys, lecture_ids) -> np.ndarray:
+    """
+    Ключи фрагментов из keys, принадлежащих лекциям lecture_ids
+    (для фильтров по курсам, которые задаются id лекций).
+    """
+    keys = np.asarray(keys, dtype=np.int64)
+    return keys[np.isin(keys >> PASSAGE_BITS, np.asarray(lecture_ids, dtype=np.int64))]
+
+
+def max_pool(
+    hits: Iterable[Tuple[int, float]], top_k: int
+) -> List[Tuple[int, float, Optional[int]]]:
+    """
+    Сводит попадания по фрагментам к лекциям: score лекции — максимум по её
+    фрагментам. Возвращает (id лекции, score, номер лучшего фрагмента).
+    """
+    best: Dict[int, Tuple[float, int]] = {}
+    for key, score in hits:
+        lecture_id, n = int(key) >> PASSAGE_BITS, int(key) & (MAX_PASSAGES - 1)
+        if lecture_id not in best or score > best[lecture_id][0]:
+            best[lecture_id] = (score, n)
+    ranked = sorted(best.items(), key=lambda item: item[1][0], reverse=True)[:top_k]
+    return [(lecture_id, score, n) for lecture_id, (score, n) in ranked]
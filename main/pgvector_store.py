@@ -0,0 +1,208 @@
+"""
+Хранение эмбеддингов лекций в PostgreSQL (расширение pgvector).
+
+Колонка main_lecture.embedding типа vector(SEARCH_PGVECTOR_DIM) и HNSW-индекс
+по ней создаёт миграция 0011: во время работы DDL не выполняется.
+index_lectures только записывает векторы, если размерность модели совпадает
+с колонкой, а имя модели и размерность сохраняет в embeddings_info.json
+(ключ "pgvector") — по ним поиск кодирует запрос той же моделью. Поиск
+ближайших соседей выполняется в SQL вместе с фильтрами по курсам, векторы
+лекций в приложение не передаются.
+"""
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import Lecture
+from .postgres_fts import filter_sql
+
+# Имя колонки, индекса и параметры HNSW повторены в миграции 0011
+COLUMN = "embedding"
+INDEX_NAME = "main_lecture_embedding_hnsw"
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 64
+DEFAULT_EF_SEARCH = 64
+
+# Сколько секунд доверять закэшированному описанию колонки
+STATUS_TTL = 60.0
+
+_status: Dict[str, Tuple[float, Optional[Dict[str, Any]]]] = {}
+
+
+def _table() -> str:
+    return Lecture._meta.db_table
+
+
+def extension_available() -> bool:
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'vector'")
+        if cursor.fetchone():
+            return True
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'vector'")
+        return cursor.fetchone() is not None
+
+
+def configured_dim() -> int:
+    """
+    Размерность колонки, с которой её создаёт миграция 0011.
+    """
+    return int(getattr(settings, "SEARCH_PGVECTOR_DIM", 384))
+
+
+def status(refresh: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    Описание колонки эмбеддингов: {"dim"} или None, если её нет (не
+    PostgreSQL или расширение pgvector не установлено). Кэшируется на
+    STATUS_TTL секунд.
+    """
+    if connection.vendor != "postgresql":
+        return None
+    cached = _status.get(connection.alias)
+    if cached and not refresh and time.monotonic() - cached[0] < STATUS_TTL:
+        return cached[1]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT a.atttypmod
+            FROM pg_attribute a
+            JOIN pg_type t ON t.oid = a.atttypid
+            WHERE a.attrelid = to_regclass(%s) AND a.attname = %s
+              AND NOT a.attisdropped AND t.typname = 'vector'
+            """,
+            [_table(), COLUMN],
+        )
+        row = cursor.fetchone()
+    result = {"dim": int(row[0])} if row else None
+    _status[connection.alias] = (time.monotonic(), result)
+    return result
+
+
+def model_name(info: Optional[Dict[str, Any]]) -> Optional[str]:
+    """
+    Модель, которой заполнена колонка, по описанию из embeddings_info.json;
+    None — если колонки нет или index_lectures в неё не писал.
+    """
+    name = ((info or {}).get("pgvector") or {}).get("model_name")
+    if not name or status() is None:
+        return None
+    return name
+
+
+def available(info: Optional[Dict[str, Any]]) -> bool:
+    return model_name(info) is not None
+
+
+def to_literal(vector) -> str:
+    return "[" + ",".join(f"{x:.7g}" for x in np.asarray(vector, dtype=np.float32).ravel()) + "]"
+
+
+# ---------- Запись (index_lectures) ----------
+
+
+def column_matches(dim: int) -> bool:
+    """
+    Есть ли колонка vector(dim). Колонку другой размерности (модель не
+    совпадает с SEARCH_PGVECTOR_DIM) index_lectures не трогает.
+    """
+    current = status(refresh=True)
+    return bool(current) and current["dim"] == int(dim)
+
+
+def write(ids: Sequence[int], vectors) -> None:
+    """
+    Записывает векторы лекций одним UPDATE ... FROM unnest(...) на пачку.
+    """
+    if not len(ids):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            UPDATE {_table()} AS l SET {COLUMN} = v.embedding::vector
+            FROM unnest(%s::bigint[], %s::text[]) AS v(id, embedding)
+            WHERE l.id = v.id
+            """,
+            [[int(i) for i in ids], [to_literal(vec) for vec in vectors]],
+        )
+
+
+def backfill_from_lectures(model_name: str, dim: int, chunk_size: int = 1000) -> int:
+    """
+    Заполняет пустые векторы из Lecture.embedding_data той же модели —
+    например, когда колонка появилась, а лекции уже проиндексированы.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT id FROM {_table()} WHERE {COLUMN} IS NULL AND embedding_model = %s AND embedding_dim = %s",
+            [model_name, int(dim)],
+        )
+        missing = [row[0] for row in cursor.fetchall()]
+
+    filled = 0
+    for i in range(0, len(missing), chunk_size):
+        # defer(None) снимает отложенную загрузку embedding_data менеджера Lecture
+        lectures = Lecture.objects.defer(None).filter(id__in=missing[i:i + chunk_size]).only(
+            "id", "embedding_data", "embedding_dim", "embedding_dtype"
+        )
+        rows = [(lec.id, lec.embedding_vector) for lec in lectures if lec.embedding_data is not None]
+        write([lec_id for lec_id, _ in rows], [vec for _, vec in rows])
+        filled += len(rows)
+    return filled
+
+
+def finalize(model_name: str, dim: int) -> Dict[str, Any]:
+    """
+    Описание заполненной колонки для embeddings_info.json.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT count(*) FROM {_table()} WHERE {COLUMN} IS NOT NULL")
+        filled = cursor.fetchone()[0]
+    return {
+        "model_name": model_name,
+        "dim": int(dim),
+        "index": "hnsw",
+        "m": HNSW_M,
+        "ef_construction": HNSW_EF_CONSTRUCTION,
+        "vectors": int(filled),
+    }
+
+
+# ---------- Поиск ----------
+
+
+def search(
+    q_vec,
+    top_k: int,
+    filters: Optional[Dict[str, Any]] = None,
+    exact: bool = False,
+    ef_search: int = DEFAULT_EF_SEARCH,
+) -> List[Tuple[int, float]]:
+    """
+    Ближайшие лекции по косинусной близости: пары (id лекции, score).
+    Фильтры по курсам и специальности — в том же запросе. exact=True
+    отключает HNSW-индекс (полный перебор отфильтрованных строк): так
+    узкий фильтр не оставляет индексный обход без кандидатов.
+    """
+    filter_where, params = filter_sql(filters or {})
+    where = [f"l.{COLUMN} IS NOT NULL"] + filter_where
+
+    literal = to_literal(q_vec)
+    # "+ 0" делает выражение сортировки неиндексируемым — планировщик перебирает строки точно
+    order = f"(l.{COLUMN} <=> %s::vector){' + 0' if exact else ''}"
+    sql = f"""
+        SELECT l.id, 1 - (l.{COLUMN} <=> %s::vector) AS score
+        FROM {_table()} l
+        WHERE {" AND ".join(where)}
+        ORDER BY {order}
+        LIMIT %s
+    """
+    # SET LOCAL действует только внутри транзакции
+    with transaction.atomic(), connection.cursor() as cursor:
+        if not exact:
+            cursor.execute(f"SET LOCAL hnsw.ef_search = {max(int(ef_search), int(top_k))}")
+        cursor.execute(sql, [literal] + params + [literal, top_k])
+        return [(int(lec_id), float(score)) for lec_id, score in cursor.fetchall()]
@@ -0,0 +1,81 @@
+"""
+Полнотекстовый поиск лекций средствами PostgreSQL.
+
+Колонка main_lecture.search_vector (tsvector, конфигурация russian; заголовок
+с весом A, текст с весом B) и GIN-индекс по ней создаются миграцией 0010.
+Отбор документов идёт по индексу, ранжирование — ts_rank_cd, сниппеты —
+ts_headline, так что весь лексический поиск остаётся в базе.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.db import connection
+
+from .models import Course, Lecture, Subject
+
+TS_CONFIG = "russian"
+HEADLINE_OPTIONS = 'MaxFragments=2, MinWords=10, MaxWords=30, FragmentDelimiter=" ... ", StartSel="", StopSel=""'
+
+_available: Dict[str, bool] = {}
+
+
+def available() -> bool:
+    """
+    True, если БД — PostgreSQL и колонка search_vector уже создана миграцией.
+    Результат запоминается на соединение (alias).
+    """
+    if connection.vendor != "postgresql":
+        return False
+    if connection.alias not in _available:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM information_schema.columns WHERE table_name = %s AND column_name = 'search_vector'",
+                [Lecture._meta.db_table],
+            )
+            _available[connection.alias] = cursor.fetchone() is not None
+    return _available[connection.alias]
+
+
+def filter_sql(filters: Dict[str, Any], alias: str = "l") -> Tuple[List[str], List[Any]]:
+    """
+    Условия WHERE и параметры для фильтров по курсам и специальности.
+    """
+    where: List[str] = []
+    params: List[Any] = []
+    if "course_ids" in filters:
+        where.append(f"{alias}.course_id = ANY(%s)")
+        params.append(list(filters["course_ids"]))
+    if "specialty" in filters:
+        where.append(
+            f"{alias}.course_id IN (SELECT c.id FROM {Course._meta.db_table} c "
+            f"JOIN {Subject._meta.db_table} s ON s.id = c.subject_id WHERE s.specialty_id = %s)"
+        )
+        params.append(filters["specialty"])
+    return where, params
+
+
+def search(query: str, top_k: int, filters: Optional[Dict[str, Any]] = None) -> List[Tuple[int, float, str]]:
+    """
+    Возвращает top_k троек (id лекции, ts_rank_cd, сниппет ts_headline).
+    Фильтры по курсам и специальности применяются в том же запросе.
+    ts_headline считается только для отобранных top_k строк.
+    """
+    lecture_table = Lecture._meta.db_table
+    filter_where, filter_params = filter_sql(filters or {})
+    where = ["l.search_vector @@ q.query"] + filter_where
+    params: List[Any] = [TS_CONFIG, query] + filter_params + [top_k]
+
+    sql = f"""
+        SELECT top.id, top.rank, ts_headline(%s, coalesce(l.content_text, ''), top.query, %s)
+        FROM (
+            SELECT l.id, ts_rank_cd(l.search_vector, q.query) AS rank, q.query
+            FROM {lecture_table} l, websearch_to_tsquery(%s, %s) AS q(query)
+            WHERE {" AND ".join(where)}
+            ORDER BY rank DESC, l.id
+            LIMIT %s
+        ) AS top
+        JOIN {lecture_table} l ON l.id = top.id
+        ORDER BY top.rank DESC, top.id
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [TS_CONFIG, HEADLINE_OPTIONS] + params)
+        return [(int(lec_id), float(rank), headline) for lec_id, rank, headline in cursor.fetchall()]
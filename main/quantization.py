@@ -0,0 +1,296 @@
+"""
+Квантованное хранилище эмбеддингов для поиска без FAISS.
+
+Вместо float32-матрицы в память воркера загружаются коды:
+  int8 — скалярное квантование, байт на компоненту и масштаб на строку (~4x меньше);
+  pq   — product quantization, байт на подпространство (по умолчанию в 16 раз меньше).
+Поиск идёт по кодам, а top_k · rerank кандидатов пересчитываются точно по
+float-матрице embeddings.npy: она открыта через mmap, и с диска
+читаются только строки кандидатов.
+"""
+import math
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .vector_store import IDS_FILE, VectorStore, _save_npy, normalize
+
+QUANTIZE_MODES = ("none", "int8", "pq")
+
+INT8_CODES_FILE = "embeddings_int8.npy"
+INT8_SCALES_FILE = "embedding_scales.npy"
+PQ_CODES_FILE = "embeddings_pq.npy"
+PQ_CODEBOOKS_FILE = "pq_codebooks.npy"
+
+# Кандидатов на точный пересчёт: top_k * DEFAULT_RERANK (0 — без пересчёта)
+DEFAULT_RERANK = 4
+# Размер подпространства PQ по умолчанию (компонент на байт кода): ~16x меньше float32
+PQ_DSUB = 4
+PQ_TRAIN_SAMPLE = 16_384
+PQ_ITERATIONS = 15
+# Сколько строк декодировать за раз при поиске: временный float-буфер не растёт с корпусом
+SCAN_CHUNK = 16_384
+
+
+def pq_params(dim: int, n_vectors: int, m: Optional[int] = None) -> Dict[str, int]:
+    """
+    Число подпространств m (делитель dim) и бит на код: на маленьком корпусе
+    центроидов не больше, чем векторов для обучения.
+    """
+    if m is None:
+        m = max(d for d in range(1, max(1, dim // PQ_DSUB) + 1) if dim % d == 0)
+    if m <= 0 or dim % m:
+        raise ValueError(f"Размерность {dim} не делится на число подпространств PQ {m}")
+    nbits = max(1, min(8, int(math.log2(max(n_vectors, 2)))))
+    return {"pq_m": int(m), "pq_nbits": nbits}
+
+
+def _kmeans(x: np.ndarray, k: int, iterations: int, rng) -> np.ndarray:
+    centroids = x[rng.choice(len(x), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        # argmin ||x - c||² = argmax (x·c - ||c||²/2)
+        assign = np.argmax(x @ centroids.T - 0.5 * (centroids ** 2).sum(axis=1), axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, x)
+        counts = np.bincount(assign, minlength=k)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+    return centroids
+
+
+class QuantizedStore(ABC):
+    """
+    Общая часть int8 и PQ: поиск кандидатов по кодам и точный пересчёт
+    по float-матрице. Строки и id идут в том же порядке, что в VectorStore.
+    """
+
+    mode = "none"
+
+    def __init__(self, ids: np.ndarray, vectors: Optional[VectorStore] = None, rerank: int = DEFAULT_RERANK):
+        self.ids = ids
+        self.vectors = vectors
+        self.rerank = rerank
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    @abstractmethod
+    def nbytes(self) -> int:
+        """Сколько байт кодов держится в памяти"""
+
+    @abstractmethod
+    def _scores(self, q: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """Приближённые близости запроса q к строкам rows по кодам"""
+
+    def _scan(self, q: np.ndarray, rows: Optional[np.ndarray]) -> np.ndarray:
+        if rows is None:
+            rows = np.arange(len(self.ids))
+        return np.concatenate(
+            [self._scores(q, rows[i:i + SCAN_CHUNK]) for i in range(0, len(rows), SCAN_CHUNK)]
+        ) if len(rows) else np.empty(0, dtype=np.float32)
+
+    def search(self, q_vec, top_k: int, allowed=None) -> List[Tuple[int, float]]:
+        """
+        Приближённые top_k по кодам; при rerank > 0 и доступной float-матрице
+        top_k · rerank кандидатов пересчитываются точно.
+        """
+        if not len(self) or top_k <= 0:
+            return []
+        q = normalize(q_vec)[0]
+        rows = None
+        if allowed is not None:
+            rows = np.flatnonzero(np.isin(self.ids, np.asarray(allowed, dtype=np.int64)))
+            if not len(rows):
+                return []
+        scores = self._scan(q, rows)
+        exact = self.rerank > 0 and self.vectors is not None
+        k = min(top_k * self.rerank if exact else top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        positions = top if rows is None else rows[top]
+        if exact:
+            positions = np.sort(positions)
+            scores = np.asarray(self.vectors.matrix[positions]) @ q
+            order = np.argsort(-scores)[:top_k]
+        else:
+            scores = scores[top]
+            order = np.argsort(-scores)
+        return [(int(self.ids[positions[i]]), float(scores[i])) for i in order]
+
+
+class Int8Store(QuantizedStore):
+    mode = "int8"
+
+    def __init__(self, codes, scales, ids, vectors=None, rerank=DEFAULT_RERANK):
+        super().__init__(ids, vectors, rerank)
+        self.codes = codes
+        self.scales = scales
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.codes.nbytes + self.scales.nbytes)
+
+    @staticmethod
+    def encode(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    def _scores(self, q, rows):
+        return (self.codes[rows].astype(np.float32) @ q) * self.scales[rows]
+
+    @classmethod
+    def build(cls, base: Path, store: VectorStore, chunk: int = SCAN_CHUNK, **kwargs) -> "Int8Store":
+        base = Path(base)
+        tmp = base / (INT8_CODES_FILE + ".tmp")
+        codes = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.int8, shape=(len(store), store.dim))
+        scales = np.empty(len(store), dtype=np.float32)
+        for i in range(0, len(store), chunk):
+            codes[i:i + chunk], scales[i:i + chunk] = cls.encode(store.matrix[i:i + chunk])
+        codes.flush()
+        del codes
+        tmp.replace(base / INT8_CODES_FILE)
+        _save_npy(base / INT8_SCALES_FILE, scales)
+        return cls.load(base, store, **kwargs)
+
+    @classmethod
+    def load(cls, base: Path, vectors=None, rerank=DEFAULT_RERANK, **_) -> "Int8Store":
+        base = Path(base)
+        # Коды читаются в память целиком: именно они заменяют float-матрицу в RAM
+        codes = np.load(base / INT8_CODES_FILE)
+        scales = np.load(base / INT8_SCALES_FILE)
+        ids = np.load(base / IDS_FILE, mmap_mode="r")
+        return cls(codes, scales, ids, vectors, rerank)
+
+
+class PQStore(QuantizedStore):
+    mode = "pq"
+
+    def __init__(self, codes, codebooks, ids, vectors=None, rerank=DEFAULT_RERANK):
+        super().__init__(ids, vectors, rerank)
+        self.codes = codes
+        self.codebooks = codebooks  # (m, ksub, dsub)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.codes.nbytes + self.codebooks.nbytes)
+
+    @staticmethod
+    def train(sample: np.ndarray, m: int, nbits: int) -> np.ndarray:
+        dim = sample.shape[1]
+        dsub = dim // m
+        ksub = min(1 << nbits, len(sample))
+        rng = np.random.default_rng(0)
+        return np.stack([
+            _kmeans(np.ascontiguousarray(sample[:, j * dsub:(j + 1) * dsub]), ksub, PQ_ITERATIONS, rng)
+            for j in range(m)
+        ]).astype(np.float32)
+
+    @staticmethod
+    def encode(vectors: np.ndarray, codebooks: np.ndarray) -> np.ndarray:
+        m, _, dsub = codebooks.shape
+        vectors = np.asarray(vectors, dtype=np.float32)
+        codes = np.empty((len(vectors), m), dtype=np.uint8)
+        for j in range(m):
+            sub = vectors[:, j * dsub:(j + 1) * dsub]
+            centroids = codebooks[j]
+            codes[:, j] = np.argmax(sub @ centroids.T - 0.5 * (centroids ** 2).sum(axis=1), axis=1)
+        return codes
+
+    def _scores(self, q, rows):
+        m, _, dsub = self.codebooks.shape
+        # Таблица скалярных произведений подвекторов запроса с центроидами: (m, ksub)
+        lut = np.einsum("mkd,md->mk", self.codebooks, q.reshape(m, dsub))
+        return lut[np.arange(m), self.codes[rows]].sum(axis=1)
+
+    @classmethod
+    def build(cls, base: Path, store: VectorStore, m=None, chunk: int = SCAN_CHUNK, **kwargs) -> "PQStore":
+        base = Path(base)
+        params = pq_params(store.dim, len(store), m)
+        rng = np.random.default_rng(0)
+        sample = np.sort(rng.choice(len(store), size=min(len(store), PQ_TRAIN_SAMPLE), replace=False))
+        codebooks = cls.train(np.asarray(store.matrix[sample]), params["pq_m"], params["pq_nbits"])
+        tmp = base / (PQ_CODES_FILE + ".tmp")
+        codes = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.uint8, shape=(len(store), params["pq_m"]))
+        for i in range(0, len(store), chunk):
+            codes[i:i + chunk] = cls.encode(store.matrix[i:i + chunk], codebooks)
+        codes.flush()
+        del codes
+        tmp.replace(base / PQ_CODES_FILE)
+        _save_npy(base / PQ_CODEBOOKS_FILE, codebooks)
+        return cls.load(base, store, **kwargs)
+
+    @classmethod
+    def load(cls, base: Path, vectors=None, rerank=DEFAULT_RERANK, **_) -> "PQStore":
+        base = Path(base)
+        codes = np.load(base / PQ_CODES_FILE)
+        codebooks = np.load(base / PQ_CODEBOOKS_FILE)
+        ids = np.load(base / IDS_FILE, mmap_mode="r")
+        return cls(codes, codebooks, ids, vectors, rerank)
+
+
+STORES = {"int8": Int8Store, "pq": PQStore}
+
+
+def load_quantized(base: Path, info: Optional[Dict[str, Any]], vectors=None) -> Optional[QuantizedStore]:
+    """
+    Загружает квантованное хранилище по описанию info["quantize"] из embeddings_info.json.
+    """
+    info = info or {}
+    cls = STORES.get(info.get("quantize"))
+    if cls is None:
+        return None
+    try:
+        return cls.load(base, vectors, rerank=int(info.get("rerank", DEFAULT_RERANK)))
+    except Exception:
+        return None
+
+
+def rerank_hits(store: VectorStore, q_vec, hits: List[Tuple[int, float]], top_k: int) -> List[Tuple[int, float]]:
+    """
+    Точно пересчитывает score кандидатов (id документов) по float-матрице.
+    """
+    if not hits:
+        return hits
+    positions = store.positions([key for key, _ in hits])
+    found = positions >= 0
+    keys = np.asarray([key for key, _ in hits], dtype=np.int64)[found]
+    positions = positions[found]
+    order = np.argsort(positions)
+    scores = np.asarray(store.matrix[positions[order]]) @ normalize(q_vec)[0]
+    best = np.argsort(-scores)[:top_k]
+    return [(int(keys[order][i]), float(scores[i])) for i in best]
+
+
+def recall_report(search, store: VectorStore, k: int = 10, n_queries: int = 200) -> Dict[str, Any]:
+    """
+    recall@k функции search(q_vec, k) относительно точного поиска по float-матрице
+    на выборке векторов корпуса и среднее время запроса.
+    """
+    n = len(store)
+    if not n:
+        return {"k": k, "n_queries": 0, "recall_at_k": None}
+    k = min(k, n)
+    rng = np.random.default_rng(0)
+    rows = np.sort(rng.choice(n, size=min(n_queries, n), replace=False))
+    queries = np.ascontiguousarray(store.matrix[rows])
+    # Точный top-k для всех запросов за один проход по матрице блоками строк
+    exact = [{key for key, _ in hits} for hits in store.search_batch(queries, k)]
+    hits = 0
+    elapsed = 0.0
+    for q, exact_keys in zip(queries, exact):
+        started = time.perf_counter()
+        found = search(q, k)
+        elapsed += time.perf_counter() - started
+        hits += len({key for key, _ in found} & exact_keys)
+    return {
+        "k": k,
+        "n_queries": int(len(rows)),
+        "recall_at_k": round(hits / (k * len(rows)), 4),
+        "ms_per_query": round(elapsed * 1000.0 / len(rows), 4),
+    }
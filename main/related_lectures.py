@@ -0,0 +1,256 @@
+"""
+Граф похожих лекций (k ближайших соседей).
+
+Граф строит index_lectures: по векторам лекций (Lecture.embedding_data),
+а если эмбеддингов нет — по BM25-индексу фрагментов. Рёбра лежат в таблице
+LectureNeighbor с уникальным индексом (lecture, rank), так что страница
+лекции получает похожие одним индексным запросом вместо поиска по заголовку.
+
+Повторный запуск пересчитывает не весь граф, а только списки новых и
+изменённых лекций, списки, ссылавшиеся на них, и списки, укоротившиеся из-за
+удаления лекций — и в векторном, и в BM25-графе. В векторном графе новые
+лекции ещё и вставляются в чужие списки, если они ближе текущего k-го соседа
+(близость симметрична); BM25-близость несимметрична, поэтому остальные
+списки BM25-графа обновляются только при полной пересборке (--full).
+"""
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from django.db import transaction
+
+from . import passages
+from .bm25_index import BM25Index
+from .indexing import lecture_text
+from .models import Lecture, LectureNeighbor
+from .search_service import lecture_to_result
+
+NEIGHBORS_K = 10
+SOURCES = ("vector", "bm25")
+
+# Ограничение на размер блока матрицы близостей (строк × лекций), ~64 МБ float32
+SCORE_BLOCK_ELEMENTS = 1 << 24
+
+# Сколько самых весомых (tf·idf) термов лекции брать в BM25-запрос
+BM25_QUERY_TERMS = 32
+
+WRITE_CHUNK = 1000
+
+
+def load_vectors(model_name: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Векторы лекций модели model_name: (id лекций по возрастанию, матрица float32).
+    Векторы в БД уже нормированы, так что близость — скалярное произведение.
+    """
+    rows = (
+        # defer(None) снимает отложенную загрузку embedding_data менеджера Lecture
+        Lecture.objects.defer(None)
+        .filter(embedding_model=model_name, embedding_data__isnull=False)
+        .only("id", "embedding_data", "embedding_dim", "embedding_dtype")
+        .order_by("id")
+        .iterator(chunk_size=2000)
+    )
+    ids, vectors = [], []
+    for lecture in rows:
+        ids.append(lecture.id)
+        vectors.append(lecture.embedding_vector)
+    if not ids:
+        return np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32)
+    return np.asarray(ids, dtype=np.int64), np.vstack(vectors).astype(np.float32, copy=False)
+
+
+def load_graph(lecture_ids: Optional[Iterable[int]] = None) -> Dict[int, List[Tuple[int, float]]]:
+    """
+    Текущие списки соседей {id лекции: [(id соседа, score)]} в порядке rank.
+    """
+    qs = LectureNeighbor.objects.all()
+    if lecture_ids is not None:
+        qs = qs.filter(lecture_id__in=list(lecture_ids))
+    graph: Dict[int, List[Tuple[int, float]]] = {}
+    rows = qs.order_by("lecture_id", "rank").values_list("lecture_id", "neighbor_id", "score")
+    for lecture_id, neighbor_id, score in rows.iterator(chunk_size=5000):
+        graph.setdefault(lecture_id, []).append((neighbor_id, score))
+    return graph
+
+
+def stale_lectures(graph: Dict[int, List[Tuple[int, float]]], ids, changed: Set[int], k: int) -> Set[int]:
+    """
+    Лекции, чьи списки нужно пересчитать целиком: сами изменённые, ссылающиеся
+    на изменённые и те, у кого соседей меньше k (часть строк удалена каскадом
+    вместе с лекциями).
+    """
+    expected = min(k, max(len(ids) - 1, 0))
+    stale = set(changed)
+    for lecture_id in ids:
+        lecture_id = int(lecture_id)
+        neighbors = graph.get(lecture_id, [])
+        if len(neighbors) < expected or any(n in changed for n, _ in neighbors):
+            stale.add(lecture_id)
+    return stale
+
+
+def _top_k(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    # Индексы и значения k наибольших по строкам, по убыванию
+    k = min(k, scores.shape[1])
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1, kind="stable")
+    return np.take_along_axis(part, order, axis=1), np.take_along_axis(part_scores, order, axis=1)
+
+
+def vector_neighbors(
+    ids: np.ndarray,
+    matrix: np.ndarray,
+    graph: Dict[int, List[Tuple[int, float]]],
+    stale: Set[int],
+    changed: Set[int],
+    k: int = NEIGHBORS_K,
+) -> Dict[int, List[Tuple[int, float]]]:
+    """
+    Пересчитывает соседей по векторам блоками строк (matrix[rows] @ matrix.T),
+    не держа в памяти всю матрицу близостей. Возвращает только списки, которые
+    изменились: устаревшие лекции целиком и свежие списки, куда попали
+    изменённые лекции.
+    """
+    n = len(ids)
+    k = min(k, n - 1)
+    if k <= 0:
+        return {int(lec_id): [] for lec_id in ids if int(lec_id) in stale}
+    position = {int(lec_id): i for i, lec_id in enumerate(ids)}
+
+    # Текущие top-k каждой лекции (для несвежих — из графа), -inf — пустое место
+    best_pos = np.full((n, k), -1, dtype=np.int64)
+    best_scores = np.full((n, k), -np.inf, dtype=np.float32)
+    fresh = np.ones(n, dtype=bool)
+    for lec_id in stale:
+        if lec_id in position:
+            fresh[position[lec_id]] = False
+    for i in np.flatnonzero(fresh):
+        for j, (neighbor_id, score) in enumerate(graph.get(int(ids[i]), [])[:k]):
+            if neighbor_id in position:
+                best_pos[i, j], best_scores[i, j] = position[neighbor_id], score
+    before = best_pos.copy()
+
+    rows = np.flatnonzero(~fresh)
+    is_changed = np.isin(ids, np.fromiter(changed, dtype=np.int64, count=len(changed)))
+    block = max(1, min(len(rows) or 1, SCORE_BLOCK_ELEMENTS // max(n, 1)))
+    for start in range(0, len(rows), block):
+        rows_block = rows[start:start + block]
+        scores = matrix[rows_block] @ matrix.T
+        scores[np.arange(len(rows_block)), rows_block] = -np.inf
+        best_pos[rows_block], best_scores[rows_block] = _top_k(scores, k)
+
+        # Близость симметрична: изменённые лекции из блока — кандидаты в списки свежих лекций
+        cand = is_changed[rows_block]
+        if cand.any() and fresh.any():
+            cols = np.flatnonzero(fresh)
+            cand_rows = rows_block[cand]
+            merged_scores = np.hstack([best_scores[cols], scores[cand][:, cols].T])
+            merged_pos = np.hstack([best_pos[cols], np.broadcast_to(cand_rows, (len(cols), len(cand_rows)))])
+            top, best_scores[cols] = _top_k(merged_scores, k)
+            best_pos[cols] = np.take_along_axis(merged_pos, top, axis=1)
+
+    updated = (~fresh) | (best_pos != before).any(axis=1)
+    result = {}
+    for i in np.flatnonzero(updated):
+        valid = best_pos[i] >= 0
+        result[int(ids[i])] = [
+            (int(ids[j]), float(s)) for j, s in zip(best_pos[i][valid], best_scores[i][valid])
+        ]
+    return result
+
+
+def _bm25_query(index: BM25Index, text: str) -> List[str]:
+    # Самые весомые термы лекции (tf·idf) — запрос «найти похожие на неё»
+    weights: Dict[str, float] = {}
+    for term in index.analyze(text):
+        term_id = index.vocab.get(term)
+        if term_id is not None:
+            weights[term] = weights.get(term, 0.0) + float(index.idf[term_id])
+    return sorted(weights, key=weights.get, reverse=True)[:BM25_QUERY_TERMS]
+
+
+def bm25_neighbors(index: BM25Index, lecture_ids: Iterable[int], k: int = NEIGHBORS_K) -> Dict[int, List[Tuple[int, float]]]:
+    """
+    Соседи по BM25: запрос из характерных термов лекции по индексу фрагментов,
+    фрагменты сводятся к лекциям (max_pool), сама лекция исключается.
+    """
+    result = {}
+    lecture_ids = list(lecture_ids)
+    for i in range(0, len(lecture_ids), WRITE_CHUNK):
+        rows = Lecture.objects.filter(id__in=lecture_ids[i:i + WRITE_CHUNK]).values_list("id", "title", "content_text")
+        for lec_id, title, content in rows:
+            hits = index.search(_bm25_query(index, lecture_text(title, content)), (k + 1) * passages.POOL_FACTOR)
+            pooled = passages.max_pool(hits, k + 1)
+            result[lec_id] = [(other, score) for other, score, _ in pooled if other != lec_id][:k]
+    return result
+
+
+def save_neighbors(neighbors: Dict[int, List[Tuple[int, float]]], full: bool = False) -> None:
+    """
+    Заменяет списки соседей перечисленных лекций (full=True — весь граф).
+    """
+    with transaction.atomic():
+        if full:
+            LectureNeighbor.objects.all().delete()
+        lecture_ids = list(neighbors)
+        for i in range(0, len(lecture_ids), WRITE_CHUNK):
+            chunk = lecture_ids[i:i + WRITE_CHUNK]
+            if not full:
+                LectureNeighbor.objects.filter(lecture_id__in=chunk).delete()
+            LectureNeighbor.objects.bulk_create(
+                [
+                    LectureNeighbor(lecture_id=lec_id, neighbor_id=neighbor_id, rank=rank, score=score)
+                    for lec_id in chunk
+                    for rank, (neighbor_id, score) in enumerate(neighbors[lec_id])
+                ],
+                batch_size=WRITE_CHUNK,
+            )
+
+
+def update_graph(
+    source: str,
+    changed: Set[int],
+    full: bool,
+    model_name: Optional[str] = None,
+    bm25: Optional[BM25Index] = None,
+    k: int = NEIGHBORS_K,
+) -> Dict[str, Any]:
+    """
+    Обновляет граф соседей: source="vector" — по векторам модели model_name,
+    "bm25" — по индексу bm25. changed — id новых/изменённых лекций; при
+    full=True граф строится заново. Возвращает сводку для embeddings_info.json.
+    """
+    started = time.perf_counter()
+    if source == "vector":
+        ids, matrix = load_vectors(model_name)
+    else:
+        ids = np.asarray(Lecture.objects.order_by("id").values_list("id", flat=True), dtype=np.int64)
+    graph = {} if full else load_graph()
+    stale = {int(i) for i in ids} if full else stale_lectures(graph, ids, changed, k)
+
+    if source == "vector":
+        neighbors = vector_neighbors(ids, matrix, graph, stale, changed, k)
+    else:
+        neighbors = bm25_neighbors(bm25, sorted(stale), k)
+    save_neighbors(neighbors, full=full)
+    return {
+        "source": source,
+        "k": k,
+        "lectures": int(len(ids)),
+        "updated": len(neighbors),
+        "full": full,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def related_for(lecture: Lecture, limit: int = 5) -> List[Dict[str, Any]]:
+    """
+    Похожие лекции из готового графа — один запрос по индексу (lecture, rank).
+    """
+    rows = (
+        LectureNeighbor.objects.filter(lecture_id=lecture.pk)
+        .select_related("neighbor__course")
+        .order_by("rank")[:limit]
+    )
+    return [lecture_to_result(row.neighbor, row.score) for row in rows]
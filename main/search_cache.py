@@ -0,0 +1,123 @@
+"""
+Кэш результатов поиска поверх кэш-фреймворка Django.
+
+Ключ — нормализованный запрос, top_k и параметры поиска, плюс версия индекса,
+которую index_lectures записывает в embeddings_info.json, и поколение кэша.
+После переиндексации версия меняется, а поколение меняют сигналы изменения и
+удаления лекций и курсов (main/signals.py) — правка видна в поиске сразу, не
+дожидаясь TTL. Старые записи просто перестают запрашиваться, а затем
+вытесняются по LRU/TTL настроенного кэша "search".
+
+Кэш "search" может быть локальным для процесса (LocMemCache), поэтому
+поколение хранится не в нём, а в файле-метке рядом с embeddings_info.json:
+его перезаписывает воркер, обработавший правку, а все воркеры проверяют
+одним stat(), как и версию индекса.
+"""
+import hashlib
+import json
+import os
+import threading
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .search_engine import get_engine
+from .text_analysis import normalize_query
+
+SEARCH_CACHE_ALIAS = "search"
+GENERATION_FILE = "search_cache.stamp"
+
+_lock = threading.Lock()
+_counters = {"hits": 0, "misses": 0}
+
+
+def _cache():
+    alias = SEARCH_CACHE_ALIAS if SEARCH_CACHE_ALIAS in settings.CACHES else "default"
+    return caches[alias]
+
+
+def index_version() -> str:
+    return str(get_engine().state().info.get("index_version", "0"))
+
+
+def _generation_path():
+    return get_engine().models_dir / GENERATION_FILE
+
+
+def generation() -> str:
+    """
+    Поколение кэша — подпись файла-метки (inode и время изменения): одна и та
+    же во всех воркерах и меняется при каждой перезаписи метки.
+    """
+    try:
+        st = _generation_path().stat()
+    except OSError:
+        return "0"
+    return f"{st.st_ino:x}-{st.st_mtime_ns:x}"
+
+
+def bump_generation() -> None:
+    """
+    Делает недействительными все закэшированные ответы во всех воркерах
+    (лекции изменились).
+    """
+    path = _generation_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Своё временное имя: метку могут одновременно перезаписывать несколько воркеров
+    tmp = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+    tmp.write_text(uuid.uuid4().hex, encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def make_key(query: str, top_k: int, **params) -> str:
+    payload = json.dumps(
+        {"q": normalize_query(query), "k": top_k, **params}, sort_keys=True, default=str
+    )
+    digest = hashlib.sha1(payload.encode("utf-8")).hexdigest()
+    return f"search:{index_version()}:{generation()}:{digest}"
+
+
+def _count(name: str) -> None:
+    with _lock:
+        _counters[name] += 1
+
+
+def lookup(query: str, top_k: int, **params) -> Optional[Any]:
+    """
+    Закэшированный ответ или None (учитывается как попадание/промах).
+    """
+    results = _cache().get(make_key(query, top_k, **params))
+    _count("hits" if results is not None else "misses")
+    return results
+
+
+def store(query: str, top_k: int, results: Any, **params) -> None:
+    _cache().set(make_key(query, top_k, **params), results)
+
+
+def cached_search(
+    query: str, top_k: int, compute: Callable[[], List[Dict[str, Any]]], **params
+) -> List[Dict[str, Any]]:
+    """
+    Возвращает результаты из кэша или вычисляет их через compute() и кэширует.
+    """
+    results = lookup(query, top_k, **params)
+    if results is not None:
+        return results
+    results = compute()
+    store(query, top_k, results, **params)
+    return results
+
+
+def stats() -> Dict[str, Any]:
+    hits, misses = _counters["hits"], _counters["misses"]
+    total = hits + misses
+    return {
+        "index_version": index_version(),
+        "generation": generation(),
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / total, 4) if total else None,
+    }
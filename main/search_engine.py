@@ -0,0 +1,506 @@
+"""
+Резидентный поисковый движок.
+
+Модель sentence-transformers, FAISS-индекс, маппинг id лекций, матрица
+эмбеддингов и BM25-индекс загружаются один раз на процесс (воркер gunicorn) и перечитываются только
+тогда, когда index_lectures перезаписывает models/embeddings_info.json.
+Векторные артефакты и BM25-индекс лежат в каталогах поколений
+(models/vectors-<id>, models/bm25-<id>), на которые ссылается
+embeddings_info.json, поэтому воркер всегда загружает согласованный набор.
+"""
+import json
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+MODELS_DIR = Path("models")
+FAISS_INDEX_PATH = MODELS_DIR / "faiss_index.bin"
+FAISS_MAPPING_PATH = MODELS_DIR / "faiss_mapping.json"
+EMBEDDINGS_INFO_PATH = MODELS_DIR / "embeddings_info.json"
+
+DEFAULT_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+DEFAULT_INFO = {"backend": "bm25", "has_embeddings": False}
+
+# Сколько последних запросов учитывать при расчёте перцентилей задержки
+LATENCY_WINDOW = 1000
+
+
+def vectors_dir(models_dir: Path, info: Dict[str, Any]) -> Path:
+    """
+    Каталог поколения векторных артефактов (FAISS-индекс, маппинг, матрица
+    эмбеддингов, квантованные коды) по embeddings_info.json. В описаниях
+    старого формата без "vectors" файлы лежат прямо в models/.
+    """
+    path = (info.get("vectors") or {}).get("path")
+    return Path(models_dir) / path if path else Path(models_dir)
+
+
+class EngineState:
+    """
+    Неизменяемый снимок загруженных артефактов.
+    При перезагрузке создаётся новый снимок и подменяется одной операцией,
+    поэтому параллельные запросы никогда не видят наполовину обновлённый индекс.
+    """
+
+    def __init__(
+        self,
+        info=None,
+        model=None,
+        model_name=None,
+        index=None,
+        mapping=None,
+        vectors=None,
+        bm25=None,
+        quantized=None,
+        suggest=None,
+        index_bytes=0,
+    ):
+        self.info = info or dict(DEFAULT_INFO)
+        self.model = model
+        self.model_name = model_name
+        self.index = index
+        # Размер FAISS-индекса в памяти (по файлу индекса)
+        self.index_bytes = index_bytes
+        self.mapping = mapping or []
+        self.vectors = vectors
+        self.bm25 = bm25
+        # Квантованные коды для поиска без FAISS (main.quantization)
+        self.quantized = quantized
+        # Подсказки строки поиска (main.autocomplete.Suggester)
+        self.suggest = suggest
+
+    @property
+    def backend(self) -> str:
+        return self.info.get("backend", "simple")
+
+    @property
+    def passages(self) -> bool:
+        """
+        Индексы построены по фрагментам лекций (id в них — ключи фрагментов).
+        """
+        return bool(self.info.get("passages"))
+
+    @property
+    def faiss_rerank(self) -> int:
+        """
+        Во сколько раз больше кандидатов брать из квантованного FAISS-индекса
+        для точного пересчёта по float-матрице (0 — без пересчёта).
+        """
+        params = self.info.get("faiss") or {}
+        if params.get("quantize", "none") == "none" or self.vectors is None:
+            return 0
+        return int(params.get("rerank") or 0)
+
+    def allowed_keys(self, keys, lecture_ids):
+        """
+        Переводит фильтр по id лекций в id документов индекса с ключами keys.
+        """
+        if not self.passages:
+            return lecture_ids
+        from .passages import keys_for_lectures
+
+        return keys_for_lectures(keys, lecture_ids)
+
+
+class SearchEngine:
+    def __init__(self, models_dir: Path = MODELS_DIR):
+        self.models_dir = Path(models_dir)
+        self._lock = threading.Lock()
+        self._state = EngineState()
+        self._signature = None
+        self._loaded = False
+
+        self.loads = 0
+        self.load_seconds = 0.0
+        self.loaded_at: Optional[float] = None
+        self.queries = 0
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._stage_latencies: Dict[str, deque] = {}
+        self._stage_counts: Dict[str, int] = {}
+        # Модели, запрошенные явно по имени (например, для pgvector без файлов models/)
+        self._named_models: Dict[str, Any] = {}
+
+    # ---------- Загрузка ----------
+
+    @property
+    def info_path(self) -> Path:
+        return self.models_dir / EMBEDDINGS_INFO_PATH.name
+
+    def _info_signature(self):
+        try:
+            st = self.info_path.stat()
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def state(self) -> EngineState:
+        """
+        Возвращает актуальный снимок, при необходимости перечитывая артефакты.
+        Проверка свежести — один stat() файла embeddings_info.json.
+        """
+        signature = self._info_signature()
+        if not self._loaded or signature != self._signature:
+            with self._lock:
+                if not self._loaded or signature != self._signature:
+                    self._load(signature)
+        return self._state
+
+    def reload(self) -> EngineState:
+        with self._lock:
+            self._load(self._info_signature())
+        return self._state
+
+    def _load(self, signature) -> None:
+        started = time.perf_counter()
+        info = self._read_info()
+
+        model, model_name = None, None
+        if info.get("has_embeddings"):
+            model_name = info.get("model_name") or DEFAULT_MODEL_NAME
+            previous = self._state
+            if previous.model is not None and previous.model_name == model_name:
+                # Модель не менялась — не тратим время на повторную загрузку весов
+                model = previous.model
+            else:
+                model = self._load_model(model_name)
+
+        directory = vectors_dir(self.models_dir, info)
+        index, mapping, index_bytes = None, [], 0
+        if info.get("backend") == "faiss":
+            index, mapping = self._load_faiss(directory, info.get("faiss") or {})
+            if index is not None:
+                index_bytes = (directory / FAISS_INDEX_PATH.name).stat().st_size
+
+        vectors, quantized = None, None
+        if info.get("has_embeddings"):
+            from .quantization import load_quantized
+            from .vector_store import load_store
+
+            vectors = load_store(directory)
+            # Коды нужны только поиску без FAISS: при загруженном индексе они
+            # дублировали бы в памяти те же векторы
+            if index is None:
+                quantized = load_quantized(directory, info.get("quantize"), vectors)
+
+        bm25 = self._load_bm25(info)
+        suggest = self._load_suggest(info)
+
+        self._state = EngineState(
+            info=info,
+            model=model,
+            model_name=model_name,
+            index=index,
+            mapping=mapping,
+            vectors=vectors,
+            bm25=bm25,
+            quantized=quantized,
+            suggest=suggest,
+            index_bytes=index_bytes,
+        )
+        self._signature = signature
+        self._loaded = True
+        self.loads += 1
+        self.load_seconds = time.perf_counter() - started
+        self.loaded_at = time.time()
+
+    def _read_info(self) -> Dict[str, Any]:
+        if not self.info_path.exists():
+            return dict(DEFAULT_INFO)
+        try:
+            return json.loads(self.info_path.read_text(encoding="utf-8"))
+        except Exception:
+            return dict(DEFAULT_INFO)
+
+    @staticmethod
+    def _load_model(model_name: str):
+        try:
+            from sentence_transformers import SentenceTransformer
+
+            return SentenceTransformer(model_name)
+        except Exception:  # pragma: no cover - внешняя зависимость
+            return None
+
+    def _load_faiss(self, directory: Path, params: Dict[str, Any]) -> Tuple[Any, List[int]]:
+        index_path = directory / FAISS_INDEX_PATH.name
+        mapping_path = directory / FAISS_MAPPING_PATH.name
+        if not index_path.exists() or not mapping_path.exists():
+            return None, []
+        try:
+            import faiss  # type: ignore
+
+            from .ann_index import apply_search_params
+
+            index = faiss.read_index(str(index_path))
+            # nprobe/efSearch не сохраняются в файле индекса — берём их из embeddings_info.json
+            apply_search_params(index, params.get("type", "flat"), params)
+            mapping = json.loads(mapping_path.read_text(encoding="utf-8"))
+            return index, mapping
+        except Exception:  # pragma: no cover - внешняя зависимость
+            return None, []
+
+    def _load_bm25(self, info: Dict[str, Any]):
+        from .bm25_index import load_index
+
+        bm25_info = info.get("bm25") or {}
+        if not bm25_info.get("path"):
+            return None
+        return load_index(self.models_dir / bm25_info["path"])
+
+    def _load_suggest(self, info: Dict[str, Any]):
+        from .autocomplete import Suggester
+
+        if not (info.get("suggest") or {}).get("path"):
+            return None
+        try:
+            return Suggester.load(self.models_dir)
+        except Exception:
+            return None
+
+    # ---------- Запросы ----------
+
+    def encode(self, text: str, model_name: Optional[str] = None):
+        """
+        Кодирует запрос в вектор float32, если модель доступна.
+        model_name — модель, которой закодированы векторы в другом хранилище;
+        по умолчанию используется модель текущего индекса.
+        """
+        state = self.state()
+        model = state.model
+        if model_name and model_name != state.model_name:
+            model = self._named_model(model_name)
+        if model is None:
+            return None
+        try:
+            return model.encode([text])[0].astype("float32")
+        except Exception:  # pragma: no cover - внешняя зависимость
+            return None
+
+    def encode_batch(self, texts: List[str], model_name: Optional[str] = None):
+        """
+        Кодирует несколько запросов одним вызовом модели: матрица (len(texts), dim)
+        float32 или None, если модель недоступна.
+        """
+        state = self.state()
+        model = state.model
+        if model_name and model_name != state.model_name:
+            model = self._named_model(model_name)
+        if model is None or not texts:
+            return None
+        try:
+            return np.asarray(model.encode(list(texts)), dtype="float32")
+        except Exception:  # pragma: no cover - внешняя зависимость
+            return None
+
+    def _named_model(self, model_name: str):
+        if model_name not in self._named_models:
+            with self._lock:
+                if model_name not in self._named_models:
+                    self._named_models[model_name] = self._load_model(model_name)
+        return self._named_models[model_name]
+
+    def search_faiss(self, q_vec, top_k: int, allowed=None) -> List[Tuple[int, float]]:
+        """
+        Ищет ближайшие лекции в FAISS-индексе. Возвращает пары (id документа, score):
+        id лекции или ключ фрагмента, если индекс построен по фрагментам.
+        allowed — необязательный массив id лекций, которыми ограничен поиск.
+        """
+        state = self.state()
+        if state.index is None:
+            return []
+        rerank = state.faiss_rerank
+        k = top_k * rerank if rerank else top_k
+        if allowed is not None:
+            hits = self._search_faiss_filtered(state, q_vec, k, allowed)
+        else:
+            scores, indices = state.index.search(q_vec.reshape(1, -1), k)
+            hits = self._faiss_hits(state, scores[0], indices[0])
+        if rerank:
+            from .quantization import rerank_hits
+
+            # Score квантованного индекса приблизительный — пересчитываем кандидатов по float-матрице
+            hits = rerank_hits(state.vectors, q_vec, hits, top_k)
+        return hits
+
+    def _search_faiss_filtered(self, state, q_vec, top_k: int, allowed) -> List[Tuple[int, float]]:
+        from .ann_index import EXACT_FILTER_MAX, search_parameters
+
+        if not len(allowed):
+            return []
+        lecture_ids = allowed
+        if state.vectors is not None:
+            allowed = state.allowed_keys(state.vectors.ids, lecture_ids)
+            if len(allowed) <= EXACT_FILTER_MAX:
+                return state.vectors.search(q_vec, top_k, allowed)
+
+        q = q_vec.reshape(1, -1)
+        if state.info.get("faiss_id_map", False) and (state.vectors is not None or not state.passages):
+            params = state.info.get("faiss") or {}
+            selector_params = search_parameters(params.get("type", "flat"), params, allowed)
+            scores, indices = state.index.search(q, top_k, params=selector_params)
+            return self._faiss_hits(state, scores[0], indices[0])
+
+        # Старый индекс без id лекций: берём кандидатов с запасом и фильтруем их
+        from .passages import PASSAGE_BITS
+
+        shift = PASSAGE_BITS if state.passages else 0
+        allowed_set = set(int(i) for i in lecture_ids)
+        k = min(state.index.ntotal, max(top_k * 10, 100))
+        scores, indices = state.index.search(q, k)
+        hits = [
+            hit for hit in self._faiss_hits(state, scores[0], indices[0])
+            if hit[0] >> shift in allowed_set
+        ]
+        return hits[:top_k]
+
+    @staticmethod
+    def _faiss_hits(state, scores, indices) -> List[Tuple[int, float]]:
+        # Индекс с IndexIDMap2 возвращает id лекций напрямую,
+        # старый плоский индекс — позиции в faiss_mapping.json
+        id_mapped = state.info.get("faiss_id_map", False)
+        hits = []
+        for score, idx in zip(scores, indices):
+            if idx < 0:
+                continue
+            if id_mapped:
+                hits.append((int(idx), float(score)))
+            elif idx < len(state.mapping):
+                hits.append((state.mapping[idx], float(score)))
+        return hits
+
+    def search_batch(self, q_vecs, top_k: int) -> List[List[Tuple[int, float]]]:
+        """
+        Поиск без фильтров сразу для матрицы запросов: один вызов FAISS
+        (или один проход по матрице эмбеддингов). Списки попаданий — в порядке запросов.
+        """
+        state = self.state()
+        q_vecs = np.ascontiguousarray(q_vecs, dtype="float32")
+        results: List[List[Tuple[int, float]]] = [[] for _ in range(len(q_vecs))]
+        if state.index is not None:
+            rerank = state.faiss_rerank
+            try:
+                scores, indices = state.index.search(q_vecs, top_k * rerank if rerank else top_k)
+            except Exception:  # pragma: no cover - внешняя зависимость
+                scores, indices = None, None
+            if scores is not None:
+                results = [self._faiss_hits(state, row_scores, row_ids) for row_scores, row_ids in zip(scores, indices)]
+                if rerank:
+                    from .quantization import rerank_hits
+
+                    results = [rerank_hits(state.vectors, q, hits, top_k) for q, hits in zip(q_vecs, results)]
+
+        missing = [i for i, hits in enumerate(results) if not hits]
+        if missing and state.quantized is not None:
+            for i in missing:
+                results[i] = state.quantized.search(q_vecs[i], top_k)
+        elif missing and state.vectors is not None:
+            for i, hits in zip(missing, state.vectors.search_batch(q_vecs[missing], top_k)):
+                results[i] = hits
+        return results
+
+    def search_vectors(self, q_vec, top_k: int, allowed=None) -> List[Tuple[int, float]]:
+        """
+        Ищет ближайшие лекции в матрице эмбеддингов (embeddings.npy)
+        или, если индекс построен с --quantize, в её квантованных кодах.
+        allowed — необязательный массив id лекций.
+        """
+        state = self.state()
+        store = state.quantized if state.quantized is not None else state.vectors
+        if store is None:
+            return []
+        if allowed is not None:
+            allowed = state.allowed_keys(store.ids, allowed)
+        return store.search(q_vec, top_k, allowed)
+
+    # ---------- Статистика ----------
+
+    def record_query(self, seconds: float) -> None:
+        self.queries += 1
+        self._latencies.append(seconds * 1000.0)
+
+    def record_stage(self, name: str, ms: float) -> None:
+        """
+        Учитывает время одного этапа поиска (bm25, vector, substring).
+        """
+        with self._lock:
+            if name not in self._stage_latencies:
+                self._stage_latencies[name] = deque(maxlen=LATENCY_WINDOW)
+                self._stage_counts[name] = 0
+        self._stage_latencies[name].append(ms)
+        self._stage_counts[name] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        state = self._state
+        latencies = sorted(self._latencies)
+
+        def percentile(p, values=latencies):
+            if not values:
+                return None
+            return round(values[min(len(values) - 1, int(len(values) * p))], 3)
+
+        stages = {}
+        for name, values in list(self._stage_latencies.items()):
+            values = sorted(values)
+            stages[name] = {
+                "count": self._stage_counts.get(name, 0),
+                "p50": percentile(0.50, values),
+                "p95": percentile(0.95, values),
+            }
+
+        return {
+            "backend": state.backend,
+            "model_name": state.model_name,
+            "model_loaded": state.model is not None,
+            "index_loaded": state.index is not None,
+            "index_type": (state.info.get("faiss") or {}).get("type"),
+            "index_size": len(state.mapping),
+            "vectors": len(state.vectors) if state.vectors is not None else 0,
+            "quantize": state.quantized.mode if state.quantized is not None else "none",
+            "quantized_bytes": state.quantized.nbytes if state.quantized is not None else 0,
+            "index_bytes": state.index_bytes,
+            # Векторы в памяти процесса: FAISS-индекс и квантованные коды (float-матрица — mmap)
+            "resident_bytes": state.index_bytes + (state.quantized.nbytes if state.quantized is not None else 0),
+            "bm25_docs": len(state.bm25) if state.bm25 is not None else 0,
+            "suggest_entries": len(state.suggest) if state.suggest is not None else 0,
+            "loads": self.loads,
+            "load_seconds": round(self.load_seconds, 3),
+            "loaded_at": self.loaded_at,
+            "queries": self.queries,
+            "latency_ms": {
+                "avg": round(sum(latencies) / len(latencies), 3) if latencies else None,
+                "p50": percentile(0.50),
+                "p95": percentile(0.95),
+                "max": round(latencies[-1], 3) if latencies else None,
+            },
+            "stages": stages,
+        }
+
+
+_engine: Optional[SearchEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> SearchEngine:
+    """
+    Возвращает единственный на процесс экземпляр движка.
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = SearchEngine()
+    return _engine
+
+
+def warm_up() -> Dict[str, Any]:
+    """
+    Загружает артефакты заранее (вызывается при старте воркера),
+    чтобы первый пользовательский запрос не платил за загрузку модели.
+    """
+    engine = get_engine()
+    engine.state()
+    engine.encode("warm up")
+    return engine.stats()
@@ -1,191 +1,551 @@
-import json
-from pathlib import Path
-from typing import List, Dict, Any
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
+import numpy as np
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
 from django.db.models import QuerySet, Q
 
+from . import pgvector_store, postgres_fts
+from .ann_index import EXACT_FILTER_MAX
 from .models import Lecture
+from .passages import POOL_FACTOR, max_pool, split_passages
+from . import search_cache
+from .search_cache import cached_search, normalize_query
+from .search_engine import get_engine
 
+SEARCH_MODES = ("hybrid", "vector", "lexical")
 
-MODELS_DIR = Path("models")
-FAISS_INDEX_PATH = MODELS_DIR / "faiss_index.bin"
-FAISS_MAPPING_PATH = MODELS_DIR / "faiss_mapping.json"
-EMBEDDINGS_INFO_PATH = MODELS_DIR / "embeddings_info.json"
+# Константа сглаживания RRF (стандартное значение из литературы)
+RRF_K = 60
+# Сколько лекций брать из каждого этапа для слияния
+RRF_DEPTH = 50
+
+DEFAULT_STAGE_BUDGET_MS = {"bm25": 100, "postgres_fts": 100, "vector": 300, "pgvector": 300, "substring": 300}
+
+# Максимум запросов в одном пакете search_batch (settings.SEARCH_BATCH_MAX)
+DEFAULT_BATCH_MAX = 50
 
 
 def _load_embeddings_backend():
     """
     Читает информацию о доступном бэкенде семантического поиска.
     """
-    if not EMBEDDINGS_INFO_PATH.exists():
-        return {"backend": "bm25", "has_embeddings": False}
-    try:
-        return json.loads(EMBEDDINGS_INFO_PATH.read_text(encoding="utf-8"))
-    except Exception:
-        return {"backend": "bm25", "has_embeddings": False}
+    return get_engine().state().info
 
 
 def _encode_query(text: str):
     """
     Кодирует запрос в вектор, если возможно.
     """
-    try:
-        from sentence_transformers import SentenceTransformer
+    return get_engine().encode(text)
 
-        info = _load_embeddings_backend()
-        model_name = info.get("model_name") or "sentence-transformers/all-MiniLM-L6-v2"
-        model = SentenceTransformer(model_name)
-        return model.encode([text])[0]
-    except Exception:  # pragma: no cover - внешняя зависимость
-        return None
 
+def semantic_search(
+    query: str,
+    top_k: int = 5,
+    course_ids: Optional[Iterable[int]] = None,
+    specialty=None,
+    mode: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Ищет релевантные лекции по запросу и возвращает список результатов.
+    Подробности (режим, этапы и их время) — в search().
+    """
+    return search(query, top_k, course_ids=course_ids, specialty=specialty, mode=mode)["results"]
 
-def semantic_search(query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+
+def search(
+    query: str,
+    top_k: int = 5,
+    course_ids: Optional[Iterable[int]] = None,
+    specialty=None,
+    mode: Optional[str] = None,
+) -> Dict[str, Any]:
     """
     Ищет релевантные лекции по запросу.
-    Использует (в порядке приоритета):
-      1) FAISS-индекс
-      2) vector_embedding в БД
-      3) BM25 (rank-bm25) по тексту
-      4) Простой текстовый поиск (fallback)
-    """
-    query = (query or "").strip()
-    if not query:
-        return []
-    
-    # Простой текстовый поиск как основной fallback (работает всегда)
+    Режимы (mode, по умолчанию settings.SEARCH_MODE):
+      hybrid  — лексический и векторный поиск (FAISS или матрица эмбеддингов),
+                ранжирования сливаются через reciprocal rank fusion;
+      vector  — только векторный поиск;
+      lexical — только лексический поиск.
+    Лексический этап — BM25 по индексу index_lectures или полнотекстовый
+    поиск PostgreSQL (postgres_fts), см. settings.SEARCH_LEXICAL_BACKEND.
+    Векторный этап — FAISS/матрица в памяти процесса или pgvector в БД,
+    см. settings.SEARCH_VECTOR_BACKEND.
+    Поиск подстроки в БД (icontains) выполняется лишь в крайнем случае,
+    когда индексные этапы ничего не нашли. У каждого этапа есть бюджет
+    времени (settings.SEARCH_STAGE_BUDGET_MS); в ответе "stages" указано,
+    какие этапы выполнялись, сколько они заняли и уложились ли в бюджет.
+    course_ids и specialty (объект или id специальности) ограничивают поиск
+    лекциями этих курсов; фильтр применяется внутри каждого бэкенда, а не
+    к готовому глобальному top_k.
+    Ответы кэшируются до следующей переиндексации или правки лекций (см. search_cache),
+    время каждого запроса учитывается в статистике движка (get_engine().stats()).
+    """
+    started = time.perf_counter()
+    mode = mode or getattr(settings, "SEARCH_MODE", "hybrid")
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Неизвестный режим поиска: {mode}")
     try:
-        # Ищем по заголовку и содержимому
-        lectures = Lecture.objects.filter(
-            Q(title__icontains=query) | 
-            Q(content_text__icontains=query)
-        )[:top_k]
-        
-        if lectures.exists():
-            results = []
-            for lec in lectures:
-                # Простой подсчет релевантности по количеству вхождений
-                title_matches = lec.title.lower().count(query.lower())
-                content_matches = lec.content_text.lower().count(query.lower()) if lec.content_text else 0
-                score = (title_matches * 2 + content_matches) / max(len(lec.content_text or ""), 1) * 100
-                
-                results.append(_lecture_to_result(lec, min(score, 100.0)))
-            
-            # Сортируем по релевантности
-            results.sort(key=lambda x: x['score'], reverse=True)
-            return results[:top_k]
-    except Exception:
-        pass
+        query = normalize_query(query)
+        if not query:
+            return {"results": [], "mode": mode, "stages": [], "cached": False}
+        filters = _normalize_filters(course_ids, specialty)
+        computed = []
 
-    info = _load_embeddings_backend()
-    backend = info.get("backend", "simple")
+        def compute():
+            computed.append(True)
+            return _search(query, top_k, filters, mode)
 
-    if backend == "faiss" and FAISS_INDEX_PATH.exists() and FAISS_MAPPING_PATH.exists():
-        try:
-            import faiss  # type: ignore
-            import numpy as np
-
-            from sentence_transformers import SentenceTransformer
-
-            model_name = info.get("model_name") or "sentence-transformers/all-MiniLM-L6-v2"
-            model = SentenceTransformer(model_name)
-
-            index = faiss.read_index(str(FAISS_INDEX_PATH))
-            mapping = json.loads(FAISS_MAPPING_PATH.read_text(encoding="utf-8"))
-
-            q_vec = model.encode([query])[0].astype("float32")
-            scores, indices = index.search(q_vec.reshape(1, -1), top_k)
-            scores = scores[0]
-            indices = indices[0]
-
-            results = []
-            for s, idx in zip(scores, indices):
-                if idx < 0 or idx >= len(mapping):
-                    continue
-                lec_id = mapping[idx]
-                try:
-                    lec = Lecture.objects.get(id=lec_id)
-                except Lecture.DoesNotExist:
-                    continue
-                results.append(_lecture_to_result(lec, float(s)))
-            return results
-        except Exception:  # pragma: no cover
-            backend = "database"
-
-    if backend in ("database",) and info.get("has_embeddings"):
+        response = cached_search(query, top_k, compute, mode=mode, **filters)
+        return {**response, "cached": not computed}
+    finally:
+        get_engine().record_query(time.perf_counter() - started)
+
+
+def search_batch(queries: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Пакетный поиск: queries — список словарей с ключами q, top_k, course_ids,
+    specialty, mode (как у search()). Ответы возвращаются в порядке запросов.
+    Векторы всех некэшированных запросов считаются одним вызовом модели,
+    а запросы без фильтров ищутся одним многозапросным поиском по индексу;
+    остальные этапы выполняются для каждого запроса как в search().
+    У каждого ответа есть "ms" — время его собственной обработки; общие
+    кодирование и векторный поиск пакета — в "timings".
+    """
+    started = time.perf_counter()
+    max_batch = getattr(settings, "SEARCH_BATCH_MAX", DEFAULT_BATCH_MAX)
+    if len(queries) > max_batch:
+        raise ValueError(f"Не больше {max_batch} запросов в пакете")
+    default_mode = getattr(settings, "SEARCH_MODE", "hybrid")
+
+    responses: List[Optional[Dict[str, Any]]] = [None] * len(queries)
+    pending = []
+    allowed_by_filters: Dict[str, Any] = {}
+    for i, item in enumerate(queries):
+        item_started = time.perf_counter()
+        mode = item.get("mode") or default_mode
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Неизвестный режим поиска: {mode}")
+        query = normalize_query(item.get("q"))
+        top_k = int(item.get("top_k") or 5)
+        filters = _normalize_filters(item.get("course_ids"), item.get("specialty"))
+        response = {"results": [], "mode": mode, "stages": [], "cached": False} if not query else None
+        if query:
+            cached = search_cache.lookup(query, top_k, mode=mode, **filters)
+            if cached is not None:
+                response = {**cached, "cached": True}
+        if response is not None:
+            responses[i] = {**response, "ms": _ms_since(item_started)}
+            continue
+        # Одинаковые фильтры в пакете (например, курсы одного студента) — один запрос к БД
+        filters_key = repr(sorted(filters.items()))
+        if filters_key not in allowed_by_filters:
+            allowed_by_filters[filters_key] = _allowed_lecture_ids(filters)
+        ctx = SearchContext(query, top_k, filters, allowed_by_filters[filters_key])
+        pending.append((i, mode, ctx, _ms_since(item_started)))
+
+    timings = _prepare_batch_vectors([(mode, ctx) for _, mode, ctx, _ in pending])
+
+    engine = get_engine()
+    for i, mode, ctx, prepare_ms in pending:
+        item_started = time.perf_counter()
+        response = _search(ctx.query, ctx.top_k, ctx.filters, mode, ctx=ctx)
+        search_cache.store(ctx.query, ctx.top_k, response, mode=mode, **ctx.filters)
+        elapsed = prepare_ms + _ms_since(item_started)
+        engine.record_query(elapsed / 1000.0)
+        responses[i] = {**response, "cached": False, "ms": round(elapsed, 3)}
+
+    timings["total_ms"] = _ms_since(started)
+    return {"responses": responses, "count": len(responses), "timings": timings}
+
+
+def _prepare_batch_vectors(items: List[Tuple[str, "SearchContext"]]) -> Dict[str, Any]:
+    """
+    Кодирует все запросы пакета, которым нужен векторный этап, одним вызовом
+    модели и выполняет один многозапросный поиск для запросов без фильтров.
+    Результаты кладутся в контексты (q_vec, vector_hits).
+    """
+    timings = {"encode_ms": 0.0, "vector_search_ms": 0.0, "encoded": 0}
+    dense = [ctx for mode, ctx in items if "dense" in MODE_STAGES[mode]]
+    if not dense:
+        return timings
+    stage = _dense_stage()
+    model_name = None
+    if stage == "pgvector":
+        model_name = pgvector_store.model_name(dense[0].state.info)
+        if model_name is None:
+            return timings
+    elif not dense[0].state.info.get("has_embeddings") and dense[0].state.index is None:
+        return timings
+
+    engine = get_engine()
+    started = time.perf_counter()
+    q_vecs = engine.encode_batch([ctx.query for ctx in dense], model_name=model_name)
+    timings["encode_ms"] = _ms_since(started)
+    if q_vecs is None:
+        return timings
+    timings["encoded"] = len(dense)
+    for ctx, q_vec in zip(dense, q_vecs):
+        ctx.q_vec = q_vec
+
+    unfiltered = [ctx for ctx in dense if ctx.allowed is None]
+    if stage == "vector" and unfiltered:
+        started = time.perf_counter()
+        fetch_k = max(ctx.fetch_k for ctx in unfiltered)
+        hits = engine.search_batch(np.stack([ctx.q_vec for ctx in unfiltered]), fetch_k)
+        for ctx, ctx_hits in zip(unfiltered, hits):
+            ctx.vector_hits = ctx_hits[:ctx.fetch_k]
+        timings["vector_search_ms"] = _ms_since(started)
+    return timings
+
+
+def _ms_since(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000.0, 3)
+
+
+def _normalize_filters(course_ids, specialty) -> Dict[str, Any]:
+    filters: Dict[str, Any] = {}
+    if course_ids is not None:
+        filters["course_ids"] = sorted({int(c) for c in course_ids})
+    if specialty is not None:
+        filters["specialty"] = getattr(specialty, "pk", specialty)
+    return filters
+
+
+def _filter_lectures(qs: QuerySet, filters: Dict[str, Any]) -> QuerySet:
+    if "course_ids" in filters:
+        qs = qs.filter(course_id__in=filters["course_ids"])
+    if "specialty" in filters:
+        qs = qs.filter(course__subject__specialty=filters["specialty"])
+    return qs
+
+
+def _allowed_lecture_ids(filters: Dict[str, Any]) -> Optional[np.ndarray]:
+    """
+    Id лекций, подходящих под фильтр (один запрос к БД), или None без фильтра.
+    """
+    if not filters:
+        return None
+    ids = _filter_lectures(Lecture.objects.all(), filters).values_list("id", flat=True)
+    return np.fromiter(ids, dtype=np.int64)
+
+
+# ---------- Этапы поиска ----------
+
+
+class StageTimeout(Exception):
+    pass
+
+
+class SearchContext:
+    """
+    Всё, что нужно этапам поиска: запрос, фильтр и снимок движка.
+    """
+
+    def __init__(self, query: str, top_k: int, filters: Dict[str, Any], allowed):
+        self.query = query
+        self.top_k = top_k
+        self.filters = filters
+        self.allowed = allowed
+        self.state = get_engine().state()
+        # Глубина кандидатов этапа: для слияния нужно больше, чем top_k
+        self.depth = max(top_k, RRF_DEPTH)
+        # По фрагментам запрашиваем кандидатов с запасом: они сворачиваются в лекции
+        self.fetch_k = self.depth * POOL_FACTOR if self.state.passages else self.depth
+        # Готовые сниппеты этапов (ts_headline) по id лекции
+        self.snippets: Dict[int, str] = {}
+        # Заранее посчитанные вектор запроса и попадания векторного этапа (search_batch)
+        self.q_vec = None
+        self.vector_hits: Optional[List[Tuple[int, float]]] = None
+
+
+def _stage_bm25(ctx: SearchContext, budget_ms):
+    """BM25 по инвертированному индексу, который строит index_lectures."""
+    bm25 = ctx.state.bm25
+    if bm25 is None:
+        return None
+    allowed = ctx.allowed
+    if allowed is not None:
+        allowed = ctx.state.allowed_keys(bm25.doc_ids, allowed)
+    return _pool(ctx.state, bm25.search(bm25.analyze(ctx.query), ctx.fetch_k, allowed), ctx.depth)
+
+
+def _stage_postgres_fts(ctx: SearchContext, budget_ms):
+    """Полнотекстовый поиск PostgreSQL по GIN-индексу (см. postgres_fts)."""
+    if not postgres_fts.available():
+        return None
+    with _statement_timeout(budget_ms):
+        hits = postgres_fts.search(ctx.query, ctx.depth, ctx.filters)
+    ctx.snippets.update({lec_id: headline for lec_id, _, headline in hits if headline})
+    return [(lec_id, rank, None) for lec_id, rank, _ in hits]
+
+
+def _stage_vector(ctx: SearchContext, budget_ms):
+    """Векторный поиск: FAISS-индекс или матрица эмбеддингов (embeddings.npy)."""
+    info = ctx.state.info
+    if not info.get("has_embeddings") and ctx.state.index is None:
+        return None
+    if ctx.vector_hits is not None:
+        return _pool(ctx.state, ctx.vector_hits, ctx.depth)
+    engine = get_engine()
+    q_vec = ctx.q_vec if ctx.q_vec is not None else engine.encode(ctx.query)
+    if q_vec is None:
+        return None
+    hits = []
+    if ctx.state.index is not None:
         try:
-            import numpy as np
-
-            q_vec = _encode_query(query)
-            if q_vec is None:
-                raise RuntimeError("no embeddings model")
-
-            lectures = Lecture.objects.exclude(vector_embedding__isnull=True)
-            scored = []
-            for lec in lectures:
-                emb = lec.vector_embedding
-                if not emb:
-                    continue
-                v = np.array(emb, dtype=float)
-                q = np.array(q_vec, dtype=float)
-                denom = (np.linalg.norm(v) * np.linalg.norm(q)) or 1.0
-                score = float(np.dot(v, q) / denom)
-                scored.append((score, lec))
-            scored.sort(key=lambda x: x[0], reverse=True)
-            return [_lecture_to_result(lec, score) for score, lec in scored[:top_k]]
-        except Exception:  # pragma: no cover
-            pass
-
-    # BM25 fallback
+            hits = engine.search_faiss(q_vec, ctx.fetch_k, ctx.allowed)
+        except Exception:  # pragma: no cover - внешняя зависимость
+            hits = []
+    if not hits:
+        hits = engine.search_vectors(q_vec, ctx.fetch_k, ctx.allowed)
+    return _pool(ctx.state, hits, ctx.depth)
+
+
+def _stage_pgvector(ctx: SearchContext, budget_ms):
+    """
+    Векторный поиск в PostgreSQL: ближайшие соседи по HNSW-индексу pgvector,
+    фильтр по курсам — в том же запросе. Узкий фильтр перебирается точно.
+    """
+    model_name = pgvector_store.model_name(ctx.state.info)
+    if model_name is None:
+        return None
+    q_vec = ctx.q_vec
+    if q_vec is None:
+        q_vec = get_engine().encode(ctx.query, model_name=model_name)
+    if q_vec is None:
+        return None
+    exact = ctx.allowed is not None and len(ctx.allowed) <= EXACT_FILTER_MAX
+    with _statement_timeout(budget_ms):
+        hits = pgvector_store.search(q_vec, ctx.depth, ctx.filters, exact=exact)
+    return [(lec_id, score, None) for lec_id, score in hits]
+
+
+def _stage_substring(ctx: SearchContext, budget_ms):
+    """
+    Поиск подстроки по заголовку и содержимому (полный просмотр таблицы).
+    На PostgreSQL запрос ограничен statement_timeout = бюджету этапа.
+    """
+    query = ctx.query
+    with _statement_timeout(budget_ms):
+        lectures = list(
+            _filter_lectures(
+                Lecture.objects.filter(Q(title__icontains=query) | Q(content_text__icontains=query)),
+                ctx.filters,
+            ).values_list("id", "title", "content_text")[:ctx.top_k]
+        )
+    ranked = []
+    for lec_id, title, content in lectures:
+        # Простой подсчет релевантности по количеству вхождений
+        title_matches = title.lower().count(query)
+        content_matches = content.lower().count(query) if content else 0
+        score = (title_matches * 2 + content_matches) / max(len(content or ""), 1) * 100
+        ranked.append((lec_id, min(score, 100.0), _match_passage(content, query)))
+    ranked.sort(key=lambda item: item[1], reverse=True)
+    return ranked
+
+
+@contextmanager
+def _statement_timeout(budget_ms):
+    if not budget_ms or connection.vendor != "postgresql":
+        yield
+        return
     try:
-        from rank_bm25 import BM25Okapi  # type: ignore
-    except Exception:  # pragma: no cover
-        # Простейший fallback: фильтрация по вхождению текста
-        qs: QuerySet[Lecture] = Lecture.objects.filter(content_text__icontains=query)[
-            :top_k
-        ]
-        return [_lecture_to_result(lec, 1.0) for lec in qs]
-
-    lectures = Lecture.objects.exclude(content_text__isnull=True).exclude(content_text='')
-    if not lectures.exists():
-        # Если нет лекций с текстом, возвращаем пустой список
-        return []
-    
-    corpus = []
-    valid_lectures = []
-    for lec in lectures:
-        if lec.content_text:
-            try:
-                corpus.append(lec.content_text.split())
-                valid_lectures.append(lec)
-            except Exception:
-                continue
-    
-    if not corpus:
-        return []
-    
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL statement_timeout = %s", [int(budget_ms)])
+            yield
+            # SET LOCAL действует до конца внешней транзакции — возвращаем значение сессии
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL statement_timeout = DEFAULT")
+    except OperationalError as exc:
+        raise StageTimeout() from exc
+
+
+STAGES = {
+    "bm25": _stage_bm25,
+    "postgres_fts": _stage_postgres_fts,
+    "vector": _stage_vector,
+    "pgvector": _stage_pgvector,
+    "substring": _stage_substring,
+}
+
+MODE_STAGES = {
+    "hybrid": ("lexical", "dense"),
+    "vector": ("dense",),
+    "lexical": ("lexical",),
+}
+
+
+def _lexical_stage() -> str:
+    backend = getattr(settings, "SEARCH_LEXICAL_BACKEND", "auto")
+    if backend == "auto":
+        return "postgres_fts" if postgres_fts.available() else "bm25"
+    return backend
+
+
+def _dense_stage() -> str:
+    backend = getattr(settings, "SEARCH_VECTOR_BACKEND", "auto")
+    if backend == "auto":
+        # Индекс в памяти процесса быстрее; pgvector — когда матрицы эмбеддингов в models/ нет
+        info = get_engine().state().info
+        if info.get("has_embeddings") or not pgvector_store.available(info):
+            return "vector"
+        return "pgvector"
+    return backend
+
+
+def _mode_stages(mode: str) -> Tuple[str, ...]:
+    resolved = {"lexical": _lexical_stage(), "dense": _dense_stage()}
+    return tuple(resolved[name] for name in MODE_STAGES[mode])
+
+
+def _stage_budgets() -> Dict[str, float]:
+    return {**DEFAULT_STAGE_BUDGET_MS, **getattr(settings, "SEARCH_STAGE_BUDGET_MS", {})}
+
+
+def _run_stage(name: str, ctx: SearchContext, budget_ms, trace: List[Dict[str, Any]]):
+    started = time.perf_counter()
     try:
-        bm25 = BM25Okapi(corpus)
-        scores = bm25.get_scores(query.split())
-        scored = list(zip(scores, valid_lectures))
-        scored.sort(key=lambda x: x[0], reverse=True)
-        return [_lecture_to_result(lec, float(score)) for score, lec in scored[:top_k]]
+        ranked = STAGES[name](ctx, budget_ms)
+        status = "ok" if ranked is not None else "unavailable"
+    except StageTimeout:
+        ranked, status = None, "timeout"
     except Exception:
-        # Fallback: простой поиск по вхождению
-        qs = Lecture.objects.filter(content_text__icontains=query)[:top_k]
-        return [_lecture_to_result(lec, 1.0) for lec in qs]
+        ranked, status = None, "error"
+    elapsed_ms = (time.perf_counter() - started) * 1000.0
+    if status == "ok" and budget_ms and elapsed_ms > budget_ms:
+        status = "over_budget"
+    trace.append(
+        {
+            "stage": name,
+            "status": status,
+            "ms": round(elapsed_ms, 3),
+            "budget_ms": budget_ms,
+            "hits": len(ranked or []),
+        }
+    )
+    get_engine().record_stage(name, elapsed_ms)
+    return ranked or []
+
 
+def _search(
+    query: str, top_k: int, filters: Dict[str, Any], mode: str, ctx: Optional[SearchContext] = None
+) -> Dict[str, Any]:
+    started = time.perf_counter()
+    trace: List[Dict[str, Any]] = []
+    response = {"results": [], "mode": mode, "stages": trace}
 
-def _lecture_to_result(lecture: Lecture, score: float) -> Dict[str, Any]:
+    allowed = ctx.allowed if ctx is not None else _allowed_lecture_ids(filters)
+    if allowed is not None and not len(allowed):
+        return response
+
+    if ctx is None:
+        ctx = SearchContext(query, top_k, filters, allowed)
+    budgets = _stage_budgets()
+    rankings = []
+    for name in _mode_stages(mode) + ("substring",):
+        if name == "substring" and any(rankings):
+            break
+        spent_ms = (time.perf_counter() - started) * 1000.0
+        # Этап не начинается, если запрос уже исчерпал суммарный бюджет предыдущих
+        spent_budget = sum(budgets.get(stage["stage"]) or 0 for stage in trace)
+        if trace and spent_budget and spent_ms > spent_budget:
+            trace.append({"stage": name, "status": "skipped", "ms": 0.0, "budget_ms": budgets.get(name), "hits": 0})
+            continue
+        rankings.append(_run_stage(name, ctx, budgets.get(name), trace))
+
+    response["results"] = _hits_to_results(fuse(rankings, top_k), ctx.snippets)
+    return response
+
+
+def fuse(rankings: List[List[Tuple[int, float, Optional[int]]]], top_k: int):
+    """
+    Reciprocal rank fusion: score лекции = Σ 1 / (RRF_K + ранг) по всем
+    ранжированиям, где она встретилась. Если результаты дал только один этап,
+    его собственные score сохраняются. Фрагмент для сниппета берётся из
+    ранжирования, где лекция стоит выше всего.
+    """
+    rankings = [ranked for ranked in rankings if ranked]
+    if not rankings:
+        return []
+    if len(rankings) == 1:
+        return rankings[0][:top_k]
+
+    scores: Dict[int, float] = {}
+    best: Dict[int, Tuple[int, Optional[int]]] = {}
+    for ranked in rankings:
+        for rank, (lec_id, _, passage) in enumerate(ranked, start=1):
+            scores[lec_id] = scores.get(lec_id, 0.0) + 1.0 / (RRF_K + rank)
+            if lec_id not in best or rank < best[lec_id][0]:
+                best[lec_id] = (rank, passage)
+    fused = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+    return [(lec_id, score, best[lec_id][1]) for lec_id, score in fused]
+
+
+def _pool(state, hits, top_k: int):
+    """
+    Сводит попадания бэкенда к лекциям: для индекса по фрагментам score лекции —
+    максимум по её фрагментам (max-pooling). Возвращает (id лекции, score, номер фрагмента).
+    """
+    if state.passages:
+        return max_pool(hits, top_k)
+    return [(lec_id, score, None) for lec_id, score in hits[:top_k]]
+
+
+def _match_passage(text: str, query: str) -> Optional[int]:
+    """
+    Номер фрагмента, в котором впервые встречается запрос (для сниппета).
+    """
+    pos = (text or "").lower().find(query.lower())
+    if pos < 0:
+        return None
+    for n, (start, end) in enumerate(split_passages(text)):
+        if start <= pos < end:
+            return n
+    return None
+
+
+def _hits_to_results(hits, snippets: Optional[Dict[int, str]] = None) -> List[Dict[str, Any]]:
+    """
+    Превращает тройки (id лекции, score, номер фрагмента) в результаты одним
+    запросом к БД, сохраняя порядок ранжирования. Курс подтягивается тем же запросом.
+    """
+    snippets = snippets or {}
+    lectures = Lecture.objects.select_related("course").in_bulk([lec_id for lec_id, _, _ in hits])
+    return [
+        lecture_to_result(lectures[lec_id], float(score), passage, snippets.get(lec_id))
+        for lec_id, score, passage in hits
+        if lec_id in lectures
+    ]
+
+
+def lecture_to_result(
+    lecture: Lecture, score: float, passage: Optional[int] = None, snippet: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Результат поиска по лекции — общий формат для поиска и похожих лекций
+    (main.related_lectures). Курс лекции должен быть уже загружен.
+    """
     text = lecture.content_text or ""
-    snippet = text[:200] + ("..." if len(text) > 200 else "")
+    start, end = 0, len(text)
+    if passage is not None:
+        # Сниппет из лучшего фрагмента, а не из начала лекции
+        spans = split_passages(text)
+        start, end = spans[min(passage, len(spans) - 1)]
+    if snippet is None:
+        snippet = ("..." if start > 0 else "") + text[start:start + 200]
+        snippet += "..." if end - start > 200 or end < len(text) else ""
     return {
         "id": lecture.id,
         "title": lecture.title,
+        "course_id": lecture.course_id,
+        "course_name": lecture.course.name if lecture.course_id else "",
         "snippet": snippet,
         "url": lecture.content_url,
         "score": score,
+        "passage": {"start": start, "end": end},
     }
-
-
-
@@ -1,7 +1,9 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.contrib.auth.models import User
 from django.dispatch import receiver
-from .models import Profile
+from . import grade_features, search_cache
+from .models import Attendance, Course, Enrollment, Grade, Lecture, Profile
 
 @receiver(post_save, sender=User)
 def create_profile(sender, instance, created, **kwargs):
@@ -15,3 +17,51 @@ def save_profile(sender, instance, **kwargs):
         instance.profile.save()
     except Profile.DoesNotExist:
         Profile.objects.create(user=instance)
+
+
+# ---------- Признаки для прогноза оценок (main/grade_features.py) ----------
+
+@receiver(pre_save, sender=Grade)
+def remember_grade_keys(sender, instance, **kwargs):
+    # Оценку могли перенести на другую запись или другого студента — старые тоже пересчитать
+    if instance.pk:
+        instance._previous_feature_keys = (
+            Grade.objects.filter(pk=instance.pk).values_list("enrollment_id", "student_id").first()
+        )
+
+
+@receiver(post_save, sender=Grade)
+@receiver(post_delete, sender=Grade)
+def grade_features_on_grade(sender, instance, **kwargs):
+    keys = [(instance.enrollment_id, instance.student_id)]
+    previous = getattr(instance, "_previous_feature_keys", None)
+    if previous:
+        keys.append(previous)
+    grade_features.mark_dirty(
+        enrollment_ids=[enr_id for enr_id, _ in keys],
+        users=[user_id for _, user_id in keys],
+        userless=any(user_id is None for _, user_id in keys),
+    )
+
+
+@receiver(post_save, sender=Attendance)
+@receiver(post_delete, sender=Attendance)
+def grade_features_on_attendance(sender, instance, **kwargs):
+    grade_features.mark_dirty(enrollment_ids=[instance.enrollment_id])
+
+
+@receiver(post_save, sender=Enrollment)
+def grade_features_on_enrollment(sender, instance, created, **kwargs):
+    if created:
+        grade_features.mark_dirty(enrollment_ids=[instance.pk])
+
+
+# ---------- Кэш результатов поиска (main/search_cache.py) ----------
+
+@receiver(post_save, sender=Lecture)
+@receiver(post_delete, sender=Lecture)
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def search_cache_on_lecture(sender, instance, **kwargs):
+    # Ответы содержат заголовки, фрагменты и названия курсов — сбрасываем после коммита
+    transaction.on_commit(search_cache.bump_generation)
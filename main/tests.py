@@ -2,7 +2,7 @@ from pathlib import Path
 import json
 
 from django.core.management import call_command
-from django.test import TestCase, Client
+from django.test import TestCase, TransactionTestCase, Client
 from django.urls import reverse
 
 from .models import Student, Group, Course, Lecture
@@ -39,6 +39,248 @@ class TrainModelTests(TestCase):
         self.assertIn("r2", metrics)
 
 
+class GradeFeaturesTests(TestCase):
+    def setUp(self):
+        from datetime import date, timedelta
+
+        from django.contrib.auth.models import User
+        from django.utils import timezone
+
+        from .models import Attendance, Enrollment, Grade
+
+        now = timezone.now()
+        student = Student.objects.create(
+            user=User.objects.create_user(username="s1"), first_name="А", last_name="Б", email="s1@example.com"
+        )
+        no_grades = Student.objects.create(first_name="В", last_name="Г", email="s2@example.com")
+        db_course = Course.objects.create(name="Базы данных")
+        py_course = Course.objects.create(name="Python")
+
+        first = Enrollment.objects.create(student=student, course=db_course, enrolled_at=now - timedelta(days=2))
+        second = Enrollment.objects.create(student=student, course=py_course, enrolled_at=now - timedelta(days=1))
+        Enrollment.objects.create(student=no_grades, course=db_course, enrolled_at=now)
+        for name, value in [
+            ("Домашнее задание 1", 80), ("Домашнее задание 2", 90), ("Midterm", 70), ("Финальный экзамен", 85)
+        ]:
+            Grade.objects.create(enrollment=first, course=db_course, assignment_name=name, value=value)
+        for name, value in [("Квиз", 60), ("Финал проект", 95)]:
+            Grade.objects.create(enrollment=second, course=py_course, assignment_name=name, value=value)
+        for day, present in enumerate([True, True, True, False]):
+            Attendance.objects.create(enrollment=first, date=date(2024, 9, 1 + day), present=present)
+
+    def test_dataset_built_with_constant_queries(self):
+        from main import grade_features
+        from main.management.commands.train_grade_model import Command
+
+        with self.assertNumQueries(6):
+            rows = grade_features.compute()
+        self.assertEqual(len(rows), 3)
+
+        X, y, feature_names = Command()._build_dataset()
+        self.assertEqual(feature_names, ["attendance_rate", "avg_homework", "midterm_score", "previous_gpa"])
+        # Порядок — по дате записи (новые первыми), запись без оценок пропущена
+        self.assertEqual(X, [[100.0, 60.0, 60.0, 81.25], [75.0, 85.0, 70.0, 77.5]])
+        self.assertEqual(y, [95.0, 85.0])
+
+    def test_features_updated_after_commit(self):
+        from main import grade_features
+
+        from .models import Attendance, Enrollment, EnrollmentFeatures, Grade
+
+        grade_features.rebuild()
+        first = Enrollment.objects.get(course__name="Базы данных", student__email="s1@example.com")
+        second = Enrollment.objects.get(course__name="Python")
+        with self.captureOnCommitCallbacks(execute=True):
+            Grade.objects.create(enrollment=first, course=first.course, assignment_name="Домашнее задание 3", value=100)
+            Attendance.objects.create(enrollment=first, date="2024-09-10", present=True)
+
+        row = EnrollmentFeatures.objects.get(enrollment=first)
+        self.assertEqual((row.attendance_rate, row.avg_homework), (80.0, 90.0))
+        # Новая оценка меняет и предыдущий GPA того же студента на другом курсе
+        self.assertEqual(EnrollmentFeatures.objects.get(enrollment=second).previous_gpa, 85.0)
+        self.assertEqual(
+            grade_features.features_for(first.student_id, first.course_id), [80.0, 90.0, 70.0, 77.5]
+        )
+
+    def test_userless_grade_refreshes_only_previous_gpa(self):
+        from unittest import mock
+
+        from main import grade_features
+
+        from .models import Enrollment, EnrollmentFeatures, Grade
+
+        userless = Student.objects.create(first_name="Д", last_name="Е", email="s3@example.com")
+        py_course = Course.objects.get(name="Python")
+        enrollment = Enrollment.objects.create(student=userless, course=py_course)
+        grade_features.rebuild()
+        grade_features.flush_pending()  # записи из setUp, помеченные без коммита
+
+        # Оценка без студента на другом курсе меняет только previous_gpa записей без пользователя
+        with mock.patch.object(grade_features, "rebuild", wraps=grade_features.rebuild) as rebuild:
+            with self.captureOnCommitCallbacks(execute=True):
+                Grade.objects.create(course=Course.objects.get(name="Базы данных"), assignment_name="Квиз", value=40)
+        rebuild.assert_not_called()
+
+        expected = grade_features.compute()
+        for row in EnrollmentFeatures.objects.all():
+            features = [getattr(row, name) for name in grade_features.FEATURE_NAMES]
+            self.assertEqual(features, expected[row.enrollment_id][0])
+        self.assertEqual(EnrollmentFeatures.objects.get(enrollment=enrollment).previous_gpa, 40.0)
+
+
+def _dump_grade_model(path, shift=0):
+    # Линейная модель на случайных признаках, записанная как train_grade_model
+    import os
+
+    import joblib
+    import numpy as np
+    from sklearn.linear_model import LinearRegression
+    from sklearn.preprocessing import StandardScaler
+
+    rng = np.random.default_rng(0)
+    X = rng.uniform(0, 100, size=(50, 4))
+    y = X @ np.array([0.1, 0.3, 0.4, 0.2]) + shift
+    scaler = StandardScaler().fit(X)
+    model = LinearRegression().fit(scaler.transform(X), y)
+    tmp = path.with_name(path.name + ".tmp")
+    joblib.dump(
+        {
+            "model": model,
+            "scaler": scaler,
+            "feature_names": ["attendance_rate", "avg_homework", "midterm_score", "previous_gpa"],
+            "version": f"v{shift}",
+        },
+        tmp,
+    )
+    os.replace(tmp, path)
+    return model, scaler, X
+
+
+class ModelRegistryTests(TestCase):
+    def test_loads_once_and_reloads_replaced_file(self):
+        import os
+        import tempfile
+
+        from .model_registry import ModelRegistry
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "grade_model.pkl"
+            registry = ModelRegistry(path)
+            self.assertEqual(registry.predict([[1, 2, 3, 4]]), (None, None))
+
+            model, scaler, X = _dump_grade_model(path, shift=0)
+            preds, loaded = registry.predict(X[:5])
+            self.assertEqual(loaded.version, "v0")
+            for got, expected in zip(preds, model.predict(scaler.transform(X[:5]))):
+                self.assertAlmostEqual(got, expected, places=8)
+            registry.predict(X[:1])
+            self.assertEqual(registry.loads, 1)
+
+            _dump_grade_model(path, shift=10)
+            # mtime мог не измениться в пределах разрешения ФС — сдвигаем явно
+            os.utime(path, ns=(0, loaded.signature[0] + 1))
+            preds, reloaded = registry.predict(X[:1])
+            self.assertEqual(reloaded.version, "v10")
+            self.assertEqual(registry.loads, 2)
+            stats = registry.stats()
+            self.assertEqual((stats["version"], stats["predictions"], stats["linear"]), ("v10", 3, True))
+
+
+class ModelSelectionTests(TestCase):
+    def setUp(self):
+        import numpy as np
+
+        rng = np.random.default_rng(1)
+        self.X = rng.uniform(0, 100, size=(120, 4))
+        self.y = self.X @ np.array([0.1, 0.3, 0.4, 0.2]) + rng.normal(0, 1, size=120)
+
+    def test_candidates_cross_validated_in_parallel(self):
+        from .grade_model_selection import select
+
+        report = select(self.X, self.y, ["linear", "ridge", "rf"], folds=3, jobs=2, time_budget=120)
+        self.assertEqual((report["folds"], report["jobs"]), (3, 2))
+        for entry in report["candidates"].values():
+            self.assertEqual((entry["status"], entry["folds_done"]), ("ok", 3))
+            self.assertIn("cv_rmse", entry)
+        # Зависимость линейная — линейные модели точнее случайного леса
+        self.assertIn(report["best"], ("linear", "ridge"))
+
+    def test_time_budget_stops_selection(self):
+        from .grade_model_selection import select
+
+        report = select(self.X, self.y, ["gbr", "rf"], folds=3, jobs=1, time_budget=0)
+        self.assertIsNone(report["best"])
+        self.assertEqual({e["status"] for e in report["candidates"].values()}, {"timeout"})
+        with self.assertRaises(ValueError):
+            select(self.X, self.y, ["svm"])
+
+
+class BatchGradePredictionTests(TestCase):
+    def setUp(self):
+        from django.contrib.auth.models import User
+
+        from .models import Enrollment, Grade
+
+        self.course = Course.objects.create(name="Базы данных")
+        other = Course.objects.create(name="Python")
+        self.group = Group.objects.create(name="CS-101", year=2024)
+        for i in range(6):
+            student = Student.objects.create(
+                user=User.objects.create_user(username=f"s{i}"),
+                first_name="А", last_name="Б", email=f"s{i}@example.com", group=self.group if i % 2 else None,
+            )
+            for course in (self.course, other):
+                enrollment = Enrollment.objects.create(student=student, course=course)
+                Grade.objects.create(enrollment=enrollment, course=course, assignment_name="Домашнее задание", value=50 + i)
+                Grade.objects.create(enrollment=enrollment, course=course, assignment_name="Midterm", value=60 + i)
+
+    def test_course_predictions_match_single_and_are_stored(self):
+        import tempfile
+        from unittest import mock
+
+        from . import grade_features, grade_predictions
+        from .model_registry import ModelRegistry
+        from .models import GradePrediction
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "grade_model.pkl"
+            _dump_grade_model(path)
+            registry = ModelRegistry(path)
+            with mock.patch.object(grade_predictions, "get_registry", return_value=registry):
+                result = grade_predictions.predict(grade_predictions.enrollments_for(course=self.course), store=True)
+                by_group = grade_predictions.predict(grade_predictions.enrollments_for(group=self.group))
+            loaded = registry.current()
+
+        self.assertEqual(result["count"], 6)
+        self.assertEqual(registry.predictions, 2)
+        self.assertEqual(by_group["count"], 6)
+        for item in result["predictions"]:
+            features = grade_features.features_for(item["student_id"], item["course_id"])
+            self.assertAlmostEqual(item["predicted_final_grade"], float(loaded.predict([features])[0]), places=8)
+            self.assertAlmostEqual(
+                item["feature_contributions"]["midterm_score"], float(loaded.model.coef_[2]) * features[2], places=8
+            )
+        stored = GradePrediction.objects.filter(enrollment__course=self.course)
+        self.assertEqual(stored.count(), 6)
+        self.assertEqual(set(stored.values_list("model_version", flat=True)), {"v0"})
+
+    def test_filters_are_required_and_validated(self):
+        from django.contrib.auth.models import User
+        from django.core.management.base import CommandError
+        from django.test import RequestFactory
+
+        from .views import api_predict_grades
+
+        with self.assertRaises(CommandError):
+            call_command("predict_grades")
+
+        staff = User.objects.create_user(username="admin", is_staff=True)
+        for payload in ({}, {"course_id": "abc"}, {"group_id": [1]}):
+            request = RequestFactory().post("/api/predict_grades/", json.dumps(payload), content_type="application/json")
+            request.user = staff
+            self.assertEqual(api_predict_grades(request).status_code, 400)
+
+
 class ApiTests(TestCase):
     def setUp(self):
         call_command("seed_demo", students=20, groups=3, courses=3, seed=3)
@@ -90,4 +332,1007 @@ class ApiTests(TestCase):
         self.assertIn("results", data)
 
 
+class SearchEngineTests(TestCase):
+    def test_engine_reloads_only_when_info_changes(self):
+        import tempfile
+
+        from .search_engine import SearchEngine
+
+        with tempfile.TemporaryDirectory() as tmp:
+            info_path = Path(tmp) / "embeddings_info.json"
+            info_path.write_text(json.dumps({"backend": "bm25", "has_embeddings": False}), encoding="utf-8")
+
+            engine = SearchEngine(models_dir=Path(tmp))
+            self.assertEqual(engine.state().backend, "bm25")
+            engine.state()
+            self.assertEqual(engine.loads, 1)
+
+            info_path.write_text(
+                json.dumps({"backend": "database", "has_embeddings": False, "n_lectures": 1}),
+                encoding="utf-8",
+            )
+            self.assertEqual(engine.state().backend, "database")
+            self.assertEqual(engine.loads, 2)
+
+            engine.record_query(0.002)
+            stats = engine.stats()
+            self.assertEqual(stats["queries"], 1)
+            self.assertIsNotNone(stats["latency_ms"]["p50"])
+
+
+class BM25IndexTests(TestCase):
+    def test_search_uses_postings_and_survives_save_load(self):
+        import tempfile
+
+        from .bm25_index import BM25Index, load_index, tokenize
+
+        index = BM25Index.build(
+            [
+                (10, tokenize("Основы SQL: SELECT и JOIN")),
+                (20, tokenize("Индексы в базах данных, B-tree индексы")),
+                (30, tokenize("Функции в Python")),
+            ]
+        )
+        hits = index.search(tokenize("индексы sql"), top_k=5)
+        self.assertEqual([doc_id for doc_id, _ in hits], [20, 10])
+        self.assertEqual(index.search(tokenize("несуществующее"), top_k=5), [])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            index.save(Path(tmp))
+            loaded = load_index(Path(tmp))
+            self.assertEqual(loaded.search(tokenize("индексы sql"), top_k=5), hits)
+
+    def test_index_lectures_keeps_previous_generation(self):
+        from unittest import mock
+
+        from main.management.commands.index_lectures import Command
+
+        course = Course.objects.create(name="Базы данных")
+        lecture = Lecture.objects.create(course=course, title="Лекция", content_text="Индексы")
+        paths = []
+        for text in ("Индексы B-tree", "Транзакции", "Журнал"):
+            lecture.content_text = text
+            lecture.save()
+            with mock.patch.object(Command, "_load_model", return_value=None):
+                call_command("index_lectures")
+            info = json.loads(Path("models/embeddings_info.json").read_text(encoding="utf-8"))
+            paths.append(info["bm25"]["path"])
+            # Текущий и предыдущий каталоги на месте, более старые удалены
+            self.assertTrue(Path("models", paths[-1]).is_dir())
+            if len(paths) > 1:
+                self.assertTrue(Path("models", paths[-2]).is_dir())
+        self.assertFalse(Path("models", paths[0]).exists())
+
+    def test_unchanged_corpus_reuses_index_and_empty_corpus_resets_info(self):
+        from unittest import mock
+
+        from main.management.commands.index_lectures import Command
+
+        from .search_engine import get_engine
+
+        course = Course.objects.create(name="Базы данных")
+        lecture = Lecture.objects.create(course=course, title="Лекция", content_text="Индексы")
+
+        def run():
+            with mock.patch.object(Command, "_load_model", return_value=None):
+                call_command("index_lectures")
+            return json.loads(Path("models/embeddings_info.json").read_text(encoding="utf-8"))
+
+        first, second = run(), run()
+        self.assertFalse(first["bm25"]["reused"])
+        self.assertTrue(second["bm25"]["reused"])
+        self.assertEqual(second["bm25"]["path"], first["bm25"]["path"])
+        self.assertNotEqual(second["index_version"], first["index_version"])
+
+        lecture.delete()
+        empty = run()
+        self.assertNotEqual(empty["index_version"], second["index_version"])
+        self.assertEqual(empty["n_lectures"], 0)
+        self.assertIsNone(empty["bm25"])
+        state = get_engine().reload()
+        self.assertIsNone(state.bm25)
+        self.assertIsNone(state.suggest)
+
+
+class TextAnalysisTests(TestCase):
+    def test_inflections_case_and_stop_words_share_terms(self):
+        from .text_analysis import Analyzer
+
+        analyzer = Analyzer(stemmer="suffix")
+        self.assertEqual(analyzer.analyze("Индексы в БАЗАХ данных"), analyzer.analyze("индекс базами данные"))
+        self.assertEqual(analyzer.analyze("Ёлка и ёлки"), analyzer.analyze("елка елке"))
+        self.assertEqual(analyzer.analyze("деректердің және деректерді"), ["дерек", "дерек"])
+
+        legacy = Analyzer.from_signature(None)
+        self.assertEqual(legacy.analyze("Индексы в SQL"), ["индексы", "в", "sql"])
+        self.assertEqual(Analyzer.from_signature(analyzer.signature).analyze("Базах"), analyzer.analyze("Базах"))
+
+    def test_rebuild_reuses_tokens_of_unchanged_lectures(self):
+        course = Course.objects.create(name="Базы данных")
+        lectures = [
+            Lecture.objects.create(course=course, title=f"Лекция {i}", content_text=f"Индексы и таблицы {i}")
+            for i in range(3)
+        ]
+        call_command("index_lectures", full=True)
+        lectures[0].content_text = "Транзакции"
+        lectures[0].save()
+        call_command("index_lectures")
+
+        info = json.loads(Path("models/embeddings_info.json").read_text(encoding="utf-8"))
+        self.assertEqual(info["bm25"]["analysis_cache"], {"hits": 2, "misses": 1})
+        self.assertEqual(info["bm25"]["analyzer"]["version"], 1)
+
+
+class SearchBenchmarkTests(TestCase):
+    def test_benchmark_writes_json_report_and_leaves_no_lectures(self):
+        import tempfile
+
+        with tempfile.TemporaryDirectory() as tmp:
+            output = Path(tmp) / "bench.json"
+            call_command(
+                "search_benchmark", sizes="300", queries=20, dim=16,
+                backends="substring,bm25,database", output=str(output),
+            )
+            report = json.loads(output.read_text(encoding="utf-8"))
+
+        run = report["runs"][0]
+        self.assertEqual(run["size"], 300)
+        database = run["backends"]["database"]
+        self.assertEqual(database["recall_at_k"], 1.0)
+        self.assertEqual(set(database["latency_ms"]), {"p50", "p95", "p99", "mean"})
+        self.assertGreater(run["backends"]["bm25"]["success_at_k"], 0.5)
+        self.assertIn("build_seconds", run["backends"]["substring"])
+        self.assertFalse(Lecture.objects.exists())
+
+
+class AutocompleteTests(TestCase):
+    def test_suggest_prefix_typo_and_incremental_rebuild(self):
+        from unittest import mock
+
+        from django.contrib.auth.models import User
+        from django.test import RequestFactory
+
+        from main.management.commands.index_lectures import Command
+
+        from .autocomplete import read_entries, record_query
+        from .search_engine import get_engine
+        from .views import api_suggest
+
+        course = Course.objects.create(name="Базы данных")
+        Lecture.objects.create(course=course, title="Индексы в PostgreSQL", content_text="текст")
+        stale = Lecture.objects.create(course=course, title="Транзакции", content_text="текст")
+        with mock.patch.object(Command, "_load_model", return_value=None):
+            call_command("index_lectures", full=True)
+        get_engine().reload()
+
+        user = User.objects.create_user(username="reader")
+
+        def suggest(q):
+            request = RequestFactory().get("/api/suggest/", {"q": q})
+            request.user = user
+            # Ссылки подсказок здесь не проверяются — URLconf тесту не нужен
+            with mock.patch("main.views.reverse", return_value="/"):
+                response = api_suggest(request)
+            self.assertEqual(response.status_code, 200)
+            return [item["text"] for item in json.loads(response.content)["suggestions"]]
+
+        self.assertEqual(suggest("баз"), ["Базы данных"])
+        self.assertEqual(suggest("postgr"), ["Индексы в PostgreSQL"])
+        self.assertEqual(suggest("индэксы"), ["Индексы в PostgreSQL"])
+        self.assertEqual(suggest("и"), [])
+
+        # Запрос становится подсказкой только после пересборки и при достаточной частоте
+        with self.settings(SUGGEST_MIN_QUERY_COUNT=3):
+            for _ in range(3):
+                record_query("Индексы B-tree")
+            record_query("Индексы моей курсовой")
+            self.assertNotIn("индексы b-tree", suggest("индексы"))
+
+            stale.title = "Уровни изоляции"
+            stale.save()
+            with mock.patch.object(Command, "_load_model", return_value=None):
+                call_command("index_lectures")
+        info = json.loads(Path("models/embeddings_info.json").read_text(encoding="utf-8"))
+        self.assertTrue(info["suggest"]["incremental"])
+        texts = read_entries(Path("models"))["text"]
+        self.assertIn("Уровни изоляции", texts)
+        self.assertNotIn("Транзакции", texts)
+        self.assertIn("индексы b-tree", texts)
+        self.assertNotIn("индексы моей курсовой", texts)
+        get_engine().reload()
+        self.assertIn("индексы b-tree", suggest("индексы"))
+
+
+class VectorStoreTests(TestCase):
+    def test_matrix_search_matches_cosine_ranking(self):
+        import tempfile
+
+        import numpy as np
+
+        from .vector_store import VectorStore, load_store
+
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(50, 16))
+        ids = list(range(100, 150))
+        query = rng.normal(size=16)
+
+        cosine = vectors @ query / (np.linalg.norm(vectors, axis=1) * np.linalg.norm(query))
+        expected = [ids[i] for i in np.argsort(-cosine)[:5]]
+
+        with tempfile.TemporaryDirectory() as tmp:
+            VectorStore.save(Path(tmp), ids, vectors)
+            store = load_store(Path(tmp))
+            self.assertIsInstance(store.matrix, np.memmap)
+            hits = store.search(query, top_k=5)
+            self.assertEqual([lec_id for lec_id, _ in hits], expected)
+            self.assertAlmostEqual(hits[0][1], float(cosine.max()), places=5)
+
+
+class _FakeEncoder:
+    """Детерминированный «энкодер» для тестов индексации без загрузки модели."""
+
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, texts, **kwargs):
+        import numpy as np
+
+        self.encoded.extend(texts)
+        return np.array(
+            [[len(t), t.count("а") + 1, t.count("о") + 1, 1.0] for t in texts], dtype="float32"
+        )
+
+
+class IncrementalIndexTests(TestCase):
+    def setUp(self):
+        course = Course.objects.create(name="Базы данных")
+        for i in range(3):
+            Lecture.objects.create(course=course, title=f"Лекция {i}", content_text=f"Текст лекции {i}")
+
+    def test_rerun_encodes_only_changed_lectures(self):
+        from unittest import mock
+
+        from main.management.commands.index_lectures import Command
+
+        encoder = _FakeEncoder()
+        with mock.patch.object(Command, "_load_model", return_value=encoder):
+            call_command("index_lectures", full=True)
+            self.assertEqual(len(encoder.encoded), 3)
+
+            encoder.encoded.clear()
+            call_command("index_lectures")
+            self.assertEqual(encoder.encoded, [])
+
+            lecture = Lecture.objects.order_by("id").first()
+            lecture.content_text = "Обновлённый текст"
+            lecture.save()
+            Lecture.objects.order_by("id").last().delete()
+            call_command("index_lectures")
+            self.assertEqual(len(encoder.encoded), 1)
+
+        info = json.loads(Path("models/embeddings_info.json").read_text(encoding="utf-8"))
+        self.assertEqual(info["n_lectures"], 2)
+        self.assertEqual(info["last_run"]["removed"], 1)
+        lecture.refresh_from_db()
+        self.assertTrue(lecture.content_hash)
+
+    def test_vector_artifacts_switch_as_one_generation(self):
+        from unittest import mock
+
+        from main.management.commands.index_lectures import Command
+
+        from .search_engine import get_engine
+
+        def run():
+            with mock.patch.object(Command, "_load_model", return_value=_FakeEncoder()):
+                call_command("index_lectures")
+            return json.loads(Path("models/embeddings_info.json").read_text(encoding="utf-8"))
+
+        first = run()
+        directory = Path("models", first["vectors"]["path"])
+        for name in ("faiss_index.bin", "faiss_mapping.json", "embeddings.npy", "embedding_ids.npy"):
+            self.assertTrue((directory / name).exists(), name)
+            # Прямо в models/ векторных файлов нет — только в каталоге поколения
+            self.assertFalse(Path("models", name).exists(), name)
+
+        lecture = Lecture.objects.order_by("id").first()
+        lecture.content_text = "Обновлённый текст"
+        lecture.save()
+        second = run()
+        self.assertNotEqual(second["vectors"]["path"], first["vectors"]["path"])
+        # Предыдущее поколение не тронуто: воркер со старым описанием загрузит его целиком
+        self.assertTrue(directory.is_dir())
+        mapping = json.loads((directory / "faiss_mapping.json").read_text(encoding="utf-8"))
+        self.assertEqual(len(mapping), first["vectors"]["n_vectors"])
+
+        state = get_engine().reload()
+        if state.index is not None:
+            self.assertEqual(state.index.ntotal, len(state.mapping))
+        self.assertEqual(len(state.vectors), second["vectors"]["n_vectors"])
+
+        run()
+        self.assertFalse(directory.exists())
+        self.assertTrue(Path("models", second["vectors"]["path"]).is_dir())
+
+
+class AnnIndexTests(TestCase):
+    def test_ivf_and_hnsw_report_recall_against_exact_search(self):
+        import tempfile
+        import unittest
+
+        import numpy as np
+
+        from . import ann_index
+        from .vector_store import VectorStore
+
+        try:
+            import faiss  # noqa: F401
+        except ImportError:
+            raise unittest.SkipTest("faiss не установлен")
+
+        self.assertEqual(ann_index.choose_index_type(500), "flat")
+        self.assertEqual(ann_index.choose_index_type(50_000), "ivf")
+        self.assertEqual(ann_index.choose_index_type(1_000_000), "hnsw")
+
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(2000, 32)).astype("float32")
+        with tempfile.TemporaryDirectory() as tmp:
+            store = VectorStore.save(Path(tmp), np.arange(2000), vectors)
+            for index_type in ("ivf", "hnsw"):
+                params = ann_index.default_params(index_type, len(store))
+                index = ann_index.build_index(store, index_type, params)
+                report = ann_index.recall_report(index, store, k=10, n_queries=50)
+                self.assertEqual(index.ntotal, 2000)
+                self.assertGreater(report["recall_at_k"], 0.5)
+
+
+class SearchCacheTests(TestCase):
+    def test_results_are_cached_per_index_version(self):
+        from unittest import mock
+
+        from . import search_cache
+
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return [{"id": 1, "score": 1.0}]
+
+        with mock.patch.object(search_cache, "index_version", return_value="v1"):
+            search_cache.cached_search("  Базы   ДАННЫХ ", 5, compute)
+            search_cache.cached_search("базы данных", 5, compute)
+            self.assertEqual(len(calls), 1)
+            search_cache.cached_search("базы данных", 3, compute)
+            self.assertEqual(len(calls), 2)
+
+        with mock.patch.object(search_cache, "index_version", return_value="v2"):
+            search_cache.cached_search("базы данных", 5, compute)
+            self.assertEqual(len(calls), 3)
+
+    def test_lecture_changes_invalidate_cached_results(self):
+        from . import search_cache
+
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return [{"id": 1, "score": 1.0}]
+
+        course = Course.objects.create(name="Базы данных")
+        lecture = Lecture.objects.create(course=course, title="Индексы", content_text="текст")
+        search_cache.cached_search("индексы", 5, compute)
+        search_cache.cached_search("индексы", 5, compute)
+        self.assertEqual(len(calls), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            lecture.title = "Индексы B-tree"
+            lecture.save()
+        search_cache.cached_search("индексы", 5, compute)
+        self.assertEqual(len(calls), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            lecture.delete()
+        search_cache.cached_search("индексы", 5, compute)
+        self.assertEqual(len(calls), 3)
+
+    def test_generation_is_shared_between_workers(self):
+        from django.core.cache import caches
+
+        from . import search_cache
+
+        before = search_cache.generation()
+        # Поколение не живёт в локальном кэше процесса: очистка его не меняет
+        caches[search_cache.SEARCH_CACHE_ALIAS].clear()
+        self.assertEqual(search_cache.generation(), before)
+        search_cache.bump_generation()
+        self.assertNotEqual(search_cache.generation(), before)
+
+
+class FilteredSearchTests(TestCase):
+    def setUp(self):
+        self.db_course = Course.objects.create(name="Базы данных")
+        self.py_course = Course.objects.create(name="Python")
+        self.db_lecture = Lecture.objects.create(course=self.db_course, title="Индексы", content_text="Про индексы в SQL")
+        self.py_lecture = Lecture.objects.create(course=self.py_course, title="Индексы списков", content_text="Про индексы в Python")
+
+    def test_filter_is_applied_inside_backends(self):
+        import numpy as np
+
+        from .bm25_index import BM25Index, tokenize
+        from .vector_store import VectorStore
+
+        bm25 = BM25Index.build([(1, tokenize("индексы sql")), (2, tokenize("индексы индексы python"))])
+        self.assertEqual([i for i, _ in bm25.search(tokenize("индексы"), 5, allowed=[1])], [1])
+        self.assertEqual(bm25.search(tokenize("индексы"), 5, allowed=[]), [])
+
+        store = VectorStore(np.eye(3, dtype="float32"), np.array([7, 8, 9]))
+        self.assertEqual([i for i, _ in store.search([0, 1, 0.5], 1, allowed=[7, 9])], [9])
+
+    def test_semantic_search_returns_only_filtered_courses_with_course_data(self):
+        from django.core.cache import caches
+
+        from .search_cache import SEARCH_CACHE_ALIAS
+        from .search_engine import get_engine
+        from .search_service import semantic_search
+
+        call_command("index_lectures", full=True)
+        get_engine().reload()
+        caches[SEARCH_CACHE_ALIAS].clear()
+
+        results = semantic_search("индексы", top_k=5, course_ids=[self.db_course.id])
+        self.assertEqual([r["id"] for r in results], [self.db_lecture.id])
+        self.assertEqual(results[0]["course_name"], "Базы данных")
+        self.assertEqual(len(semantic_search("индексы", top_k=5)), 2)
+
+
+class PassageIndexTests(TestCase):
+    def test_split_passages_covers_text_with_overlap(self):
+        from .passages import max_pool, passage_key, split_passages
+
+        text = " ".join(f"слово{i}" for i in range(1000))
+        spans = split_passages(text, size=300, overlap=60)
+        self.assertEqual(spans[0][0], 0)
+        self.assertEqual(spans[-1][1], len(text))
+        for (s1, e1), (s2, e2) in zip(spans, spans[1:]):
+            self.assertLess(s2, e1)
+            self.assertGreater(s2, s1)
+        self.assertEqual(split_passages(""), [(0, 0)])
+
+        hits = [(passage_key(1, 3), 0.9), (passage_key(2, 0), 0.8), (passage_key(1, 0), 0.7)]
+        self.assertEqual(max_pool(hits, 5), [(1, 0.9, 3), (2, 0.8, 0)])
+
+    def test_long_lecture_is_found_by_its_passage(self):
+        from .search_engine import get_engine
+        from .search_service import semantic_search
+
+        course = Course.objects.create(name="Сети")
+        filler = " ".join(["маршрутизация пакетов"] * 400)
+        lecture = Lecture.objects.create(
+            course=course, title="Сетевые протоколы", content_text=f"{filler} Протокол OSPF {filler}"
+        )
+        Lecture.objects.create(course=course, title="Введение", content_text="Общие понятия")
+        call_command("index_lectures", full=True)
+        get_engine().reload()
+
+        with self.settings(SEARCH_LEXICAL_BACKEND="bm25"):
+            results = semantic_search("ospf", top_k=3, mode="lexical")
+        self.assertEqual(results[0]["id"], lecture.id)
+        passage = results[0]["passage"]
+        self.assertGreater(passage["start"], 0)
+        self.assertIn("OSPF", lecture.content_text[passage["start"]:passage["end"]])
+
+        # Тот же фрагмент находит и BM25 по фрагментам
+        state = get_engine().state()
+        self.assertTrue(state.passages)
+        key, _ = state.bm25.search(["ospf"], 1)[0]
+        self.assertEqual(key >> 16, lecture.id)
+
+
+class LectureEmbeddingStorageTests(TestCase):
+    def test_vectors_are_stored_as_bytes_and_not_loaded_by_default(self):
+        from unittest import mock
+
+        import numpy as np
+
+        from main.management.commands.index_lectures import Command
+
+        course = Course.objects.create(name="Базы данных")
+        lecture = Lecture.objects.create(course=course, title="Лекция", content_text="ааааа")
+
+        with mock.patch.object(Command, "_load_model", return_value=_FakeEncoder()):
+            call_command("index_lectures", full=True, embedding_dtype="float16")
+
+        self.assertEqual(Lecture.objects.get(pk=lecture.pk).get_deferred_fields(), {"embedding_data"})
+        stored = Lecture.objects.defer(None).get(pk=lecture.pk)
+        self.assertEqual((stored.embedding_dim, stored.embedding_dtype), (4, "float16"))
+        self.assertEqual(len(bytes(stored.embedding_data)), 4 * 2)
+
+        vector = stored.embedding_vector
+        self.assertEqual(vector.dtype, np.float16)
+        self.assertFalse(vector.flags.writeable)
+        self.assertAlmostEqual(float(np.linalg.norm(vector.astype(np.float32))), 1.0, places=2)
+
+        lecture.set_embedding([3.0, 4.0])
+        self.assertEqual(lecture.embedding_vector.tolist(), [3.0, 4.0])
+
+
+class RelatedLecturesTests(TestCase):
+    def test_incremental_graph_matches_full_rebuild(self):
+        import numpy as np
+
+        from .related_lectures import stale_lectures, vector_neighbors
+        from .vector_store import normalize
+
+        rng = np.random.default_rng(1)
+        ids = np.arange(1, 61, dtype=np.int64)
+        matrix = normalize(rng.normal(size=(60, 8)))
+        full = vector_neighbors(ids, matrix, {}, set(ids.tolist()), set(), k=5)
+
+        # Две лекции изменились: инкрементальный пересчёт должен дать тот же граф
+        changed = {7, 42}
+        matrix[[6, 41]] = normalize(rng.normal(size=(2, 8)))
+        graph = {lec_id: neighbors for lec_id, neighbors in full.items()}
+        stale = stale_lectures(graph, ids, changed, k=5)
+        updated = vector_neighbors(ids, matrix, graph, stale, changed, k=5)
+        graph.update(updated)
+
+        expected = vector_neighbors(ids, matrix, {}, set(ids.tolist()), set(), k=5)
+        self.assertEqual({i: [n for n, _ in v] for i, v in graph.items()}, {i: [n for n, _ in v] for i, v in expected.items()})
+        self.assertLess(len(updated), len(ids))
+
+    def test_index_lectures_stores_neighbors_for_lecture_page(self):
+        from unittest import mock
+
+        from main.management.commands.index_lectures import Command
+
+        from .models import LectureNeighbor
+        from .related_lectures import related_for
+
+        course = Course.objects.create(name="Базы данных")
+        lectures = [
+            Lecture.objects.create(course=course, title=f"Лекция {i}", content_text="а" * i + "о" * (5 - i))
+            for i in range(5)
+        ]
+        with mock.patch.object(Command, "_load_model", return_value=_FakeEncoder()):
+            call_command("index_lectures", full=True)
+        self.assertEqual(LectureNeighbor.objects.filter(lecture=lectures[0]).count(), 4)
+
+        with self.assertNumQueries(1):
+            related = related_for(lectures[0], limit=3)
+        self.assertEqual(len(related), 3)
+        self.assertNotIn(lectures[0].pk, [r["id"] for r in related])
+        self.assertEqual(related[0]["course_name"], "Базы данных")
+
+        lectures[1].delete()
+        with mock.patch.object(Command, "_load_model", return_value=_FakeEncoder()):
+            call_command("index_lectures")
+        info = json.loads(Path("models/embeddings_info.json").read_text(encoding="utf-8"))
+        self.assertEqual(info["neighbors"]["source"], "vector")
+        self.assertFalse(info["neighbors"]["full"])
+        self.assertEqual(LectureNeighbor.objects.filter(lecture=lectures[0]).count(), 3)
+
+    def test_bm25_graph_recomputes_only_changed_lectures(self):
+        from unittest import mock
+
+        from main.management.commands.index_lectures import Command
+
+        from .models import LectureNeighbor
+
+        networks = Course.objects.create(name="Сети")
+        databases = Course.objects.create(name="Базы данных")
+        routing = [
+            Lecture.objects.create(course=networks, title=f"Сети {i}", content_text=f"маршрутизация ospf тема{i}")
+            for i in range(12)
+        ]
+        sql = [
+            Lecture.objects.create(course=databases, title="Базы", content_text=f"индексы sql запрос{i}")
+            for i in range(2)
+        ]
+
+        def run(**options):
+            with mock.patch.object(Command, "_load_model", return_value=None):
+                call_command("index_lectures", **options)
+            return json.loads(Path("models/embeddings_info.json").read_text(encoding="utf-8"))["neighbors"]
+
+        run(full=True)
+        before = list(LectureNeighbor.objects.filter(lecture=routing[0]).values_list("id", flat=True))
+        self.assertEqual(len(before), 10)
+
+        sql[0].content_text = "индексы sql транзакции"
+        sql[0].save()
+        info = run()
+        self.assertEqual(info["source"], "bm25")
+        self.assertFalse(info["full"])
+        # Пересчитаны только списки лекций по базам данных — там, где встречается изменённая
+        self.assertEqual(info["updated"], 2)
+        self.assertEqual(list(LectureNeighbor.objects.filter(lecture=routing[0]).values_list("id", flat=True)), before)
+        self.assertEqual(
+            list(LectureNeighbor.objects.filter(lecture=sql[1]).values_list("neighbor_id", flat=True)), [sql[0].id]
+        )
+
+
+class QuantizedStoreTests(TestCase):
+    def test_quantized_search_reranks_with_float_vectors(self):
+        import tempfile
+
+        import numpy as np
+
+        from .quantization import Int8Store, PQStore
+        from .vector_store import VectorStore
+
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(300, 16)).astype("float32")
+        with tempfile.TemporaryDirectory() as tmp:
+            store = VectorStore.save(tmp, np.arange(300) * 10, vectors)
+            for cls in (Int8Store, PQStore):
+                qstore = cls.build(tmp, store, rerank=4)
+                self.assertLess(qstore.codes.nbytes, store.matrix.nbytes / 2)
+                hits = qstore.search(vectors[7], 3)
+                self.assertEqual(hits[0][0], 70)
+                self.assertAlmostEqual(hits[0][1], 1.0, places=5)
+                filtered = qstore.search(vectors[7], 2, allowed=[20, 30])
+                self.assertEqual([k for k, _ in filtered], [k for k, _ in store.search(vectors[7], 2, allowed=[20, 30])])
+
+    def test_quantized_store_is_abstract(self):
+        from .quantization import QuantizedStore
+
+        with self.assertRaises(TypeError):
+            QuantizedStore(None, None)
+
+    def test_index_lectures_reports_memory_and_recall(self):
+        import json
+        from pathlib import Path
+        from unittest import mock
+
+        from main.management.commands.index_lectures import Command
+
+        from .search_engine import get_engine
+
+        course = Course.objects.create(name="Базы данных")
+        lectures = [
+            Lecture.objects.create(course=course, title="Лекция", content_text="а" * (i + 1) + "о" * (9 - i))
+            for i in range(8)
+        ]
+        with mock.patch.object(Command, "_load_model", return_value=_FakeEncoder()):
+            call_command("index_lectures", full=True, quantize="int8")
+
+        info = json.loads(Path("models/embeddings_info.json").read_text(encoding="utf-8"))
+        self.assertEqual(info["quantize"]["quantize"], "int8")
+        self.assertLess(info["quantize"]["memory_bytes"], info["quantize"]["float_bytes"])
+        self.assertIsNotNone(info["quantize"]["recall_at_10"])
+
+        engine = get_engine()
+        state = engine.reload()
+        if state.index is not None:
+            # При загруженном FAISS-индексе коды в память не читаются
+            self.assertIsNone(state.quantized)
+            self.assertEqual(engine.stats()["resident_bytes"], state.index_bytes)
+
+        # Поиск без FAISS — по квантованным кодам
+        with mock.patch.object(type(engine), "_load_faiss", return_value=(None, [])):
+            state = engine.reload()
+        self.assertEqual(state.quantized.mode, "int8")
+        self.assertEqual(engine.stats()["resident_bytes"], state.quantized.nbytes)
+        q_vec = _FakeEncoder().encode(["Лекция\n" + lectures[3].content_text])[0]
+        key, score = engine.search_vectors(q_vec, 1)[0]
+        self.assertEqual(key >> 16, lectures[3].id)
+        self.assertAlmostEqual(score, 1.0, places=5)
+
+        call_command("index_lectures", full=True)
+        self.assertIsNone(engine.reload().quantized)
+
+
+class HybridSearchTests(TestCase):
+    def setUp(self):
+        from django.core.cache import caches
+
+        from .search_cache import SEARCH_CACHE_ALIAS
+
+        caches[SEARCH_CACHE_ALIAS].clear()
+
+    def test_rrf_prefers_lectures_found_by_both_stages(self):
+        from .search_service import fuse
+
+        lexical = [(1, 12.0, 0), (2, 9.0, 1), (3, 4.0, None)]
+        vector = [(2, 0.9, 2), (4, 0.8, 0), (1, 0.1, 5)]
+        fused = fuse([lexical, vector], top_k=3)
+        self.assertEqual([lec_id for lec_id, _, _ in fused], [2, 1, 4])
+        # Фрагмент берётся из ранжирования, где лекция выше
+        self.assertEqual(fused[0][2], 2)
+        self.assertEqual(fuse([[], vector], top_k=2), vector[:2])
+
+    def test_response_reports_stages(self):
+        from .search_engine import get_engine
+        from .search_service import _lexical_stage, search
+
+        course = Course.objects.create(name="Базы данных")
+        lecture = Lecture.objects.create(course=course, title="Транзакции", content_text="уровни изоляции транзакций")
+        call_command("index_lectures", full=True)
+        get_engine().reload()
+
+        response = search("уровни изоляции", top_k=3, mode="lexical")
+        self.assertEqual([r["id"] for r in response["results"]], [lecture.id])
+        self.assertEqual([s["stage"] for s in response["stages"]], [_lexical_stage()])
+        self.assertEqual(response["stages"][0]["status"] in ("ok", "over_budget"), True)
+        self.assertTrue(search("уровни изоляции", top_k=3, mode="lexical")["cached"])
+
+        # Подстрока ищется только если индексные этапы ничего не нашли
+        response = search("золяци", top_k=3, mode="lexical")
+        self.assertEqual([s["stage"] for s in response["stages"]], [_lexical_stage(), "substring"])
+        self.assertIn(_lexical_stage(), get_engine().stats()["stages"])
+
+
+class BatchSearchTests(TestCase):
+    def setUp(self):
+        from django.core.cache import caches
+
+        from .search_cache import SEARCH_CACHE_ALIAS
+
+        caches[SEARCH_CACHE_ALIAS].clear()
+        self.db_course = Course.objects.create(name="Базы данных")
+        self.other_course = Course.objects.create(name="Python")
+        self.lectures = [
+            Lecture.objects.create(course=self.db_course, title="Лекция", content_text="ааааа"),
+            Lecture.objects.create(course=self.db_course, title="Лекция", content_text="ооооо"),
+            Lecture.objects.create(course=self.other_course, title="Лекция", content_text="ааааааа"),
+        ]
+
+    def test_batch_encodes_once_and_keeps_request_order(self):
+        from unittest import mock
+
+        from django.test import RequestFactory
+
+        from main.management.commands.index_lectures import Command
+
+        from .search_engine import SearchEngine, get_engine
+        from .views import api_search_resources
+
+        encoder = _FakeEncoder()
+        with mock.patch.object(Command, "_load_model", return_value=encoder):
+            call_command("index_lectures", full=True)
+        with mock.patch.object(SearchEngine, "_load_model", return_value=encoder):
+            get_engine().reload()
+
+        queries = [
+            {"q": "Лекция\nооооо", "mode": "vector", "top_k": 1},
+            {"q": "Лекция\nааааа", "mode": "vector", "top_k": 2, "course_ids": [self.other_course.id]},
+            {"q": ""},
+            {"q": "Лекция\nааааа", "mode": "vector", "top_k": 1},
+        ]
+        def post(payload):
+            request = RequestFactory().post(
+                "/api/search_resources/", data=json.dumps(payload), content_type="application/json"
+            )
+            return api_search_resources(request)
+
+        encoder.encoded.clear()
+        with mock.patch.object(encoder, "encode", wraps=encoder.encode) as encode:
+            resp = post({"queries": queries})
+        self.assertEqual(resp.status_code, 200, resp.content)
+        data = json.loads(resp.content)
+        self.assertEqual(encode.call_count, 1)
+        self.assertEqual(len(encode.call_args[0][0]), 3)
+
+        responses = data["responses"]
+        self.assertEqual(len(responses), 4)
+        self.assertEqual([r["id"] for r in responses[0]["results"]], [self.lectures[1].id])
+        self.assertEqual([r["id"] for r in responses[1]["results"]], [self.lectures[2].id])
+        self.assertEqual(responses[2]["results"], [])
+        self.assertEqual([r["id"] for r in responses[3]["results"]], [self.lectures[0].id])
+        self.assertTrue(all("ms" in r for r in responses))
+        self.assertEqual(data["timings"]["encoded"], 3)
+
+        with self.settings(SEARCH_BATCH_MAX=2):
+            resp = post({"queries": queries})
+        self.assertEqual(resp.status_code, 400)
+
+
+class IndexingJobTests(TestCase):
+    def setUp(self):
+        from django.contrib.auth.models import User
+
+        self.staff = User.objects.create_user("admin", is_staff=True)
+        course = Course.objects.create(name="Базы данных")
+        for i in range(3):
+            Lecture.objects.create(course=course, title=f"Лекция {i}", content_text=f"Текст лекции {i}")
+
+    def test_retrain_endpoint_enqueues_one_job_and_reports_progress(self):
+        from unittest import mock
+
+        from django.test import RequestFactory
+
+        from main.management.commands.index_lectures import Command
+
+        from .models import IndexingJob
+        from .views import api_index_job_status, api_retrain_embeddings
+
+        def call(view, method="post", *args, body=None):
+            request = getattr(RequestFactory(), method)("/api/", body or "", content_type="application/json")
+            request.user = self.staff
+            # Ссылка status_url здесь не проверяется — URLconf тесту не нужен
+            with mock.patch("main.views.reverse", return_value="/api/"):
+                response = view(request, *args)
+            return response.status_code, json.loads(response.content)
+
+        alive = mock.patch("main.indexing_jobs.process_alive", return_value=True)
+        with mock.patch("main.indexing_jobs.subprocess.Popen") as popen, alive:
+            popen.return_value.pid = 4242
+            with self.captureOnCommitCallbacks(execute=True):
+                first_status, first = call(api_retrain_embeddings)
+            with self.captureOnCommitCallbacks(execute=True):
+                _, second = call(api_retrain_embeddings)
+        self.assertEqual(first_status, 202)
+        self.assertTrue(first["created"])
+        self.assertFalse(second["created"])
+        self.assertEqual(first["job_id"], second["job_id"])
+        self.assertEqual(popen.call_count, 1)
+        self.assertIn("--job-id", popen.call_args[0][0])
+        self.assertEqual(IndexingJob.objects.count(), 1)
+
+        # Фоновый процесс: та же команда с --job-id
+        job_id = first["job_id"]
+        with mock.patch.object(Command, "_load_model", return_value=_FakeEncoder()):
+            call_command("index_lectures", job_id=job_id, full=True)
+
+        _, status = call(api_index_job_status, "get", job_id)
+        self.assertEqual(status["status"], "succeeded")
+        self.assertEqual((status["processed"], status["total"], status["encoded"]), (3, 3, 3))
+        self.assertEqual(status["stage"], "done")
+        self.assertIsNone(status["eta_seconds"])
+
+        # Завершённая задача не мешает запустить новую; полная переиндексация — из JSON-тела
+        with mock.patch("main.indexing_jobs.subprocess.Popen") as popen, self.captureOnCommitCallbacks(execute=True):
+            popen.return_value.pid = 4243
+            _, third = call(api_retrain_embeddings, body=json.dumps({"full": True}))
+        self.assertTrue(third["created"])
+        self.assertEqual(IndexingJob.objects.get(pk=third["job_id"]).options, {"full": True})
+        self.assertIn("--full", popen.call_args[0][0])
+        self.assertEqual(call(api_retrain_embeddings, body="{")[0], 400)
+
+    def test_only_jobs_with_dead_process_are_failed(self):
+        import os
+        from datetime import timedelta
+
+        from django.utils import timezone
+
+        from . import indexing_jobs
+        from .models import IndexingJob
+
+        pid = os.getpid()
+        started = indexing_jobs.process_start_time(pid)
+        self.assertTrue(indexing_jobs.process_alive(pid, started))
+
+        def check(heartbeat_age=timedelta(0), **fields):
+            IndexingJob.objects.all().delete()
+            job = IndexingJob.objects.create(status=IndexingJob.STATUS_RUNNING, **fields)
+            IndexingJob.objects.filter(pk=job.pk).update(updated_at=timezone.now() - heartbeat_age)
+            indexing_jobs._fail_stale(indexing_jobs.DEFAULT_INDEX)
+            job.refresh_from_db()
+            return job.status
+
+        host = indexing_jobs.host_id()
+        # Процесс жив и пишет heartbeat — задача остаётся активной
+        self.assertEqual(check(pid=pid, host=host, process_started=started), IndexingJob.STATUS_RUNNING)
+        # PID занят другим процессом (после перезапуска контейнера)
+        self.assertEqual(check(pid=pid, host=host, process_started=started + 1), IndexingJob.STATUS_FAILED)
+        # Процесс на другом хосте локально не проверяется — только по heartbeat
+        self.assertEqual(check(pid=pid, host="other:boot", process_started=started + 1), IndexingJob.STATUS_RUNNING)
+        self.assertEqual(
+            check(timedelta(hours=1), pid=pid, host="other:boot", process_started=started), IndexingJob.STATUS_FAILED
+        )
+        # Heartbeat пропал — задача снимается, даже если PID жив
+        self.assertEqual(
+            check(timedelta(hours=1), pid=pid, host=host, process_started=started), IndexingJob.STATUS_FAILED
+        )
+        # Процесс так и не запустился
+        self.assertEqual(check(), IndexingJob.STATUS_RUNNING)
+        self.assertEqual(check(timedelta(hours=1)), IndexingJob.STATUS_FAILED)
+
+
+class PostgresFullTextSearchTests(TestCase):
+    def setUp(self):
+        import unittest
+
+        from django.db import connection
+
+        if connection.vendor != "postgresql":
+            raise unittest.SkipTest("нужна PostgreSQL")
+
+        self.db_course = Course.objects.create(name="Базы данных")
+        self.other_course = Course.objects.create(name="Python")
+        self.title_hit = Lecture.objects.create(
+            course=self.db_course, title="Транзакции", content_text="Уровни изоляции и блокировки."
+        )
+        self.body_hit = Lecture.objects.create(
+            course=self.db_course, title="Журнал", content_text="Журнал предзаписи нужен для транзакций."
+        )
+        Lecture.objects.create(course=self.other_course, title="Транзакции в ORM", content_text="atomic")
+
+    def test_title_weighs_more_and_filters_stay_in_sql(self):
+        from . import postgres_fts
+
+        self.assertTrue(postgres_fts.available())
+        hits = postgres_fts.search("транзакция", 10, {"course_ids": [self.db_course.id]})
+        self.assertEqual([lec_id for lec_id, _, _ in hits], [self.title_hit.id, self.body_hit.id])
+        self.assertIn("транзакций", hits[1][2])
+
+    def test_fts_uses_gin_index(self):
+        from django.db import connection
+
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute(
+                "EXPLAIN SELECT id FROM main_lecture WHERE search_vector @@ websearch_to_tsquery('russian', 'журнал')"
+            )
+            plan = "\n".join(row[0] for row in cursor.fetchall())
+        self.assertIn("main_lecture_search_vector_gin", plan)
+
+
+class PgvectorTests(TransactionTestCase):
+    def setUp(self):
+        import unittest
+
+        from . import pgvector_store
+
+        meta = pgvector_store.status(refresh=True)
+        if meta is None:
+            raise unittest.SkipTest("нужна PostgreSQL с расширением pgvector")
+        self.dim = meta["dim"]
+
+        self.db_course = Course.objects.create(name="Базы данных")
+        self.other_course = Course.objects.create(name="Python")
+        self.lectures = [
+            Lecture.objects.create(course=self.db_course, title="Лекция", content_text="ааааа"),
+            Lecture.objects.create(course=self.db_course, title="Лекция", content_text="ооооо"),
+            Lecture.objects.create(course=self.other_course, title="Лекция", content_text="ааааааа"),
+        ]
+
+    def test_index_lectures_fills_column_and_search_filters_in_sql(self):
+        import json
+        from pathlib import Path
+        from unittest import mock
+
+        import numpy as np
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        from main.management.commands.index_lectures import Command
+
+        from . import pgvector_store
+        from .search_engine import SearchEngine
+        from .search_service import search
+
+        dim = self.dim
+
+        class Encoder(_FakeEncoder):
+            # Колонку создала миграция с размерностью SEARCH_PGVECTOR_DIM — дополняем нулями
+            def encode(self, texts, **kwargs):
+                vectors = super().encode(texts, **kwargs)
+                return np.pad(vectors, ((0, 0), (0, dim - vectors.shape[1])))
+
+        encoder = Encoder()
+        with CaptureQueriesContext(connection) as queries, mock.patch.object(Command, "_load_model", return_value=encoder):
+            call_command("index_lectures", full=True)
+        # DDL выполняет только миграция
+        self.assertFalse([q["sql"] for q in queries if q["sql"].lstrip().upper().startswith(("ALTER", "CREATE", "COMMENT"))])
+
+        info = json.loads(Path("models/embeddings_info.json").read_text(encoding="utf-8"))
+        self.assertEqual(info["pgvector"]["model_name"], "sentence-transformers/all-MiniLM-L6-v2")
+        self.assertEqual(info["pgvector"]["dim"], self.dim)
+        self.assertEqual(info["pgvector"]["vectors"], 3)
+
+        q_vec = encoder.encode(["Лекция\nааааа"])[0]
+        hits = pgvector_store.search(q_vec, 3)
+        self.assertEqual(hits[0][0], self.lectures[0].id)
+        filtered = pgvector_store.search(q_vec, 3, {"course_ids": [self.other_course.id]}, exact=True)
+        self.assertEqual([lec_id for lec_id, _ in filtered], [self.lectures[2].id])
+
+        def encode(text, model_name=None):
+            return encoder.encode([text])[0]
 
+        with mock.patch.object(SearchEngine, "encode", side_effect=encode), self.settings(
+            SEARCH_VECTOR_BACKEND="pgvector"
+        ):
+            response = search("Лекция\nооооо", top_k=2, mode="vector", course_ids=[self.db_course.id])
+        self.assertEqual(response["stages"][0]["stage"], "pgvector")
+        self.assertEqual(response["results"][0]["id"], self.lectures[1].id)
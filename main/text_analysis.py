@@ -0,0 +1,239 @@
+"""
+Анализ текста для лексического поиска (русский и казахский).
+
+Конвейер: нормализация Unicode (NFKC), нижний регистр, ё → е, разбиение на
+слова, стоп-слова, стемминг. Русские слова стеммятся snowballstemmer, если
+он установлен, иначе — отсечением типичных окончаний; казахские (по буквам
+ә, ғ, қ, ң, ө, ұ, ү, һ, і) — отсечением аффиксов. Один и тот же анализатор
+используется при построении BM25-индекса и для запросов всех лексических
+этапов поиска. Его параметры (signature) сохраняются вместе с индексом,
+чтобы запрос разбирался так же, как документы.
+
+TokenCache хранит разобранные фрагменты лекций по хэшу текста в
+models/analysis_cache.sqlite3: повторная индексация не анализирует
+неизменённые лекции заново.
+"""
+import re
+import sqlite3
+import unicodedata
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+ANALYZER_VERSION = 1
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+KAZAKH_LETTERS = frozenset("әғқңөұүһі")
+
+# Стем короче этого не укорачивается дальше
+MIN_STEM = 3
+
+STOP_WORDS_RU = frozenset(
+    """
+    а без более бы был была были было быть в вам вас весь во вот все всего всех вы где да даже для до
+    его ее ей ему если есть еще же за здесь и из или им их к как ко когда кто ли либо между меня мне
+    мной мы на над наш не него нее нет ни них но ну о об однако он она они оно от очень по под при
+    про с со так также такой там те тем то того тоже той только том ту ты у уже чем что чтобы эта
+    эти это этого этой этом этот я
+    """.split()
+)
+
+STOP_WORDS_KK = frozenset(
+    """
+    және мен бен пен да де та те ма ме ба бе па пе ал бірақ немесе не нені сол осы бұл ол олар біз
+    сіз сен мен үшін туралы дейін кейін арқылы бойынша сияқты ғана тек әр барлық қандай қалай қашан
+    кім қай неге бар жоқ еді екен болып болды болады
+    """.split()
+)
+
+STOP_WORDS = frozenset(w.replace("ё", "е") for w in STOP_WORDS_RU | STOP_WORDS_KK)
+
+# Окончания для запасного стемминга, от длинных к коротким
+RU_ENDINGS = tuple(
+    sorted(
+        """
+        ться ешься ются ется ятся ится ишь ете ите ешь ует уют ала ило ыла ила ена ено ены ать ять
+        ить еть уть ами ями ого его ому ему ыми ими ых их ой ей ий ый ая яя ое ее ые ие ом ем ам ям ую юю
+        ах ях ов ев ия ие ию ья ье ью ся ть а я о е ы и у ю ь й
+        """.split(),
+        key=len,
+        reverse=True,
+    )
+)
+
+KK_SUFFIXES = tuple(
+    sorted(
+        """
+        лар лер дар дер тар тер ның нің дың дің тың тің нда нде дан ден тан тен нан нен мен бен пен
+        ға ге қа ке на не да де та те ны ні ды ді ты ті сы сі ым ім ың ің ы і
+        """.split(),
+        key=len,
+        reverse=True,
+    )
+)
+
+
+@lru_cache(maxsize=1)
+def _snowball():
+    try:
+        import snowballstemmer
+    except ImportError:
+        return None
+    return snowballstemmer.stemmer("russian")
+
+
+def _strip(word: str, endings, rounds: int) -> str:
+    for _ in range(rounds):
+        for ending in endings:
+            if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM:
+                word = word[: -len(ending)]
+                break
+        else:
+            break
+    return word
+
+
+def stem_kazakh(word: str) -> str:
+    # Аффиксы присоединяются цепочкой (мн. число + принадлежность + падеж)
+    return _strip(word, KK_SUFFIXES, rounds=3)
+
+
+def stem_russian_light(word: str) -> str:
+    return _strip(word, RU_ENDINGS, rounds=1)
+
+
+class Analyzer:
+    """
+    Настраиваемый конвейер анализа. Параметры задаются флагами, signature
+    однозначно описывает их для сохранения рядом с индексом.
+    """
+
+    def __init__(self, nfkc: bool = True, fold_yo: bool = True, stop_words: bool = True, stemmer: Optional[str] = None):
+        self.nfkc = nfkc
+        self.fold_yo = fold_yo
+        self.stop_words = STOP_WORDS if stop_words else frozenset()
+        if stemmer is None:
+            stemmer = "snowball" if _snowball() is not None else "suffix"
+        self.stemmer = stemmer
+        self.stem = lru_cache(maxsize=100_000)(self._stem)
+
+    @property
+    def signature(self) -> Dict[str, Any]:
+        return {
+            "version": ANALYZER_VERSION,
+            "nfkc": self.nfkc,
+            "fold_yo": self.fold_yo,
+            "stop_words": bool(self.stop_words),
+            "stemmer": self.stemmer,
+        }
+
+    @classmethod
+    def from_signature(cls, signature: Optional[Dict[str, Any]]) -> "Analyzer":
+        """
+        Анализатор, совместимый с сохранённым индексом. Индекс без signature
+        построен старым токенизатором (нижний регистр + \\w+).
+        """
+        if not signature:
+            return cls(nfkc=False, fold_yo=False, stop_words=False, stemmer="none")
+        stemmer = signature.get("stemmer", "none")
+        if stemmer == "snowball" and _snowball() is None:  # pragma: no cover - пакет удалён после индексации
+            stemmer = "suffix"
+        return cls(
+            nfkc=signature.get("nfkc", True),
+            fold_yo=signature.get("fold_yo", True),
+            stop_words=signature.get("stop_words", True),
+            stemmer=stemmer,
+        )
+
+    def normalize(self, text: str) -> str:
+        text = text or ""
+        if self.nfkc:
+            text = unicodedata.normalize("NFKC", text)
+        text = text.lower()
+        if self.fold_yo:
+            text = text.replace("ё", "е")
+        return text
+
+    def _stem(self, word: str) -> str:
+        if self.stemmer == "none" or len(word) <= MIN_STEM or word.isdigit():
+            return word
+        if KAZAKH_LETTERS.intersection(word):
+            return stem_kazakh(word)
+        if self.stemmer == "snowball":
+            return _snowball().stemWord(word)
+        return stem_russian_light(word)
+
+    def analyze(self, text: str) -> List[str]:
+        stop_words = self.stop_words
+        return [self.stem(word) for word in TOKEN_RE.findall(self.normalize(text)) if word not in stop_words]
+
+
+@lru_cache(maxsize=1)
+def default_analyzer() -> Analyzer:
+    return Analyzer()
+
+
+def analyze(text: str) -> List[str]:
+    return default_analyzer().analyze(text)
+
+
+def normalize_query(query: str) -> str:
+    """
+    Каноническая форма запроса (ключ кэша и вход всех этапов поиска): NFKC,
+    нижний регистр, одиночные пробелы. Ё не заменяется — FTS PostgreSQL и
+    поиск подстроки сравнивают с текстом в базе как есть; стоп-слова и
+    стемминг применяет analyze() там, где индекс строится приложением.
+    """
+    return " ".join(unicodedata.normalize("NFKC", query or "").lower().split())
+
+
+class TokenCache:
+    """
+    Кэш разобранных фрагментов лекций: ключ — хэш текста лекции, значение —
+    токены каждого фрагмента. При смене анализатора или параметров разбиения
+    (key_params) кэш очищается. Записи, к которым не обращались за проход,
+    удаляются в close(prune=True).
+    """
+
+    FILE = "analysis_cache.sqlite3"
+
+    def __init__(self, base: Path, key_params: Dict[str, Any]):
+        self.path = Path(base) / self.FILE
+        self.conn = sqlite3.connect(str(self.path))
+        self.hits = 0
+        self.misses = 0
+        self._pending = []
+        params = repr(sorted(key_params.items()))
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (params TEXT)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS tokens (hash TEXT PRIMARY KEY, passages TEXT)")
+        self.conn.execute("CREATE TEMP TABLE seen (hash TEXT PRIMARY KEY)")
+        row = self.conn.execute("SELECT params FROM meta").fetchone()
+        if row is None or row[0] != params:
+            self.conn.execute("DELETE FROM tokens")
+            self.conn.execute("DELETE FROM meta")
+            self.conn.execute("INSERT INTO meta (params) VALUES (?)", [params])
+
+    def get(self, digest: str) -> Optional[List[List[str]]]:
+        self.conn.execute("INSERT OR IGNORE INTO seen (hash) VALUES (?)", [digest])
+        row = self.conn.execute("SELECT passages FROM tokens WHERE hash = ?", [digest]).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return [part.split(" ") if part else [] for part in row[0].split("\n")]
+
+    def put(self, digest: str, passages: List[List[str]]) -> None:
+        self._pending.append((digest, "\n".join(" ".join(tokens) for tokens in passages)))
+        if len(self._pending) >= 1000:
+            self._flush()
+
+    def _flush(self) -> None:
+        self.conn.executemany("INSERT OR REPLACE INTO tokens (hash, passages) VALUES (?, ?)", self._pending)
+        self._pending = []
+
+    def close(self, prune: bool = True) -> None:
+        self._flush()
+        if prune:
+            self.conn.execute("DELETE FROM tokens WHERE hash NOT IN (SELECT hash FROM seen)")
+        self.conn.commit()
+        self.conn.close()
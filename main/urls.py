@@ -36,6 +36,11 @@ urlpatterns = [
 
     # API для ML
     path('api/predict_grade/', views.api_predict_grade, name='api_predict_grade'),
+    path('api/predict_grades/', views.api_predict_grades, name='api_predict_grades'),
     path('api/search_resources/', views.api_search_resources, name='api_search_resources'),
+    path('api/suggest/', views.api_suggest, name='api_suggest'),
     path('api/retrain_embeddings/', views.api_retrain_embeddings, name='api_retrain_embeddings'),
+    path('api/index_jobs/<int:job_id>/', views.api_index_job_status, name='api_index_job_status'),
+    path('api/search_stats/', views.api_search_stats, name='api_search_stats'),
+    path('api/grade_model_stats/', views.api_grade_model_stats, name='api_grade_model_stats'),
 ]
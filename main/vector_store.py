@@ -0,0 +1,165 @@
+"""
+Матричное хранилище эмбеддингов лекций.
+
+Все векторы упакованы в одну непрерывную матрицу float32 (строки заранее
+нормированы) и лежат в embeddings.npy рядом с FAISS-файлами в каталоге
+поколения models/vectors-<id>, а id лекций — в embedding_ids.npy. Файлы
+открываются через mmap, поэтому воркеры gunicorn делят одни и те же страницы
+через page cache ОС.
+"""
+import os
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+MATRIX_FILE = "embeddings.npy"
+IDS_FILE = "embedding_ids.npy"
+
+
+def normalize(vectors) -> np.ndarray:
+    """
+    Приводит векторы к float32 и L2-нормирует строки (косинус = скалярное произведение).
+    """
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _save_npy(path: Path, array: np.ndarray) -> None:
+    # Пишем во временный файл и подменяем: уже открытые mmap продолжают
+    # ссылаться на старый inode и не видят полузаписанных данных
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as fh:
+        np.save(fh, array)
+    os.replace(tmp, path)
+
+
+class VectorStore:
+    def __init__(self, matrix: np.ndarray, ids: np.ndarray):
+        self.matrix = matrix
+        self.ids = ids
+        self._order = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def dim(self) -> int:
+        return int(self.matrix.shape[1]) if self.matrix.ndim == 2 else 0
+
+    @classmethod
+    def save(cls, base: Path, ids: Sequence[int], vectors) -> "VectorStore":
+        base = Path(base)
+        matrix = np.ascontiguousarray(normalize(vectors))
+        ids = np.asarray(ids, dtype=np.int64)
+        _save_npy(base / MATRIX_FILE, matrix)
+        _save_npy(base / IDS_FILE, ids)
+        return cls(matrix, ids)
+
+    @classmethod
+    def save_chunks(cls, base: Path, ids: Sequence[int], dim: int, chunks) -> "VectorStore":
+        """
+        Записывает матрицу по частям прямо в .npy через open_memmap:
+        в памяти одновременно находится только один чанк векторов.
+        """
+        base = Path(base)
+        ids = np.asarray(ids, dtype=np.int64)
+        tmp = base / (MATRIX_FILE + ".tmp")
+        matrix = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float32, shape=(len(ids), dim))
+        pos = 0
+        for chunk in chunks:
+            if not len(chunk):
+                continue
+            matrix[pos:pos + len(chunk)] = normalize(chunk)
+            pos += len(chunk)
+        if pos != len(ids):
+            raise ValueError(f"Ожидалось {len(ids)} векторов, получено {pos}")
+        matrix.flush()
+        del matrix
+        os.replace(tmp, base / MATRIX_FILE)
+        _save_npy(base / IDS_FILE, ids)
+        return cls.load(base)
+
+    @classmethod
+    def load(cls, base: Path) -> "VectorStore":
+        base = Path(base)
+        matrix = np.load(base / MATRIX_FILE, mmap_mode="r")
+        ids = np.load(base / IDS_FILE, mmap_mode="r")
+        return cls(matrix, ids)
+
+    def positions(self, keys) -> np.ndarray:
+        """
+        Номера строк матрицы для id документов (-1, если id нет в хранилище).
+        """
+        keys = np.asarray(keys, dtype=np.int64)
+        if not len(self.ids):
+            return np.full(len(keys), -1, dtype=np.int64)
+        if self._order is None:
+            order = np.argsort(self.ids, kind="stable")
+            self._order = (order, np.asarray(self.ids)[order])
+        order, sorted_ids = self._order
+        found = np.clip(np.searchsorted(sorted_ids, keys), 0, len(self.ids) - 1)
+        return np.where(sorted_ids[found] == keys, order[found], -1)
+
+    def search(self, q_vec, top_k: int, allowed=None) -> List[Tuple[int, float]]:
+        """
+        Считает косинусную близость запроса со всеми строками одним
+        матрично-векторным произведением и выбирает top_k через argpartition.
+        Если передан allowed (id лекций), умножаются только их строки.
+        """
+        if not len(self) or top_k <= 0:
+            return []
+        q = normalize(q_vec)[0]
+        if allowed is None:
+            rows = None
+            scores = self.matrix @ q
+        else:
+            rows = np.flatnonzero(np.isin(self.ids, np.asarray(allowed, dtype=np.int64)))
+            if not len(rows):
+                return []
+            scores = self.matrix[rows] @ q
+        k = min(top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        positions = top if rows is None else rows[top]
+        return [(int(self.ids[p]), float(scores[i])) for i, p in zip(top, positions)]
+
+    def search_batch(self, q_vecs, top_k: int, chunk: int = 65_536) -> List[List[Tuple[int, float]]]:
+        """
+        Поиск сразу для нескольких запросов: матрица читается один раз, по
+        блокам строк, а для каждого запроса хранятся только текущие top_k.
+        """
+        queries = normalize(q_vecs)
+        if not len(self) or top_k <= 0:
+            return [[] for _ in range(len(queries))]
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        for start in range(0, len(self), chunk):
+            scores = queries @ np.asarray(self.matrix[start:start + chunk]).T
+            best_scores = np.concatenate([best_scores, scores], axis=1)
+            best_rows = np.concatenate(
+                [best_rows, np.broadcast_to(np.arange(start, start + scores.shape[1]), scores.shape)], axis=1
+            )
+            k = min(top_k, best_scores.shape[1])
+            keep = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+            best_scores = np.take_along_axis(best_scores, keep, axis=1)
+            best_rows = np.take_along_axis(best_rows, keep, axis=1)
+        order = np.argsort(-best_scores, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        return [
+            [(int(self.ids[r]), float(s)) for r, s in zip(rows, scores)]
+            for rows, scores in zip(best_rows, best_scores)
+        ]
+
+
+def load_store(base: Path) -> Optional[VectorStore]:
+    base = Path(base)
+    if not (base / MATRIX_FILE).exists() or not (base / IDS_FILE).exists():
+        return None
+    try:
+        return VectorStore.load(base)
+    except Exception:
+        return None
@@ -29,6 +29,7 @@ from .models import (
     Lecture,
     Enrollment,
     Attendance,
+    IndexingJob,
 )
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib.auth.models import User
@@ -36,8 +37,17 @@ from django.db.models import Avg, Count, Q
 from django.utils import timezone
 from datetime import timedelta
 import json
+import time
+from urllib.parse import urlencode
 
-from .search_service import semantic_search
+from django.urls import reverse
+
+from . import grade_features, grade_predictions
+from .autocomplete import record_query
+from .model_registry import get_registry
+from .related_lectures import related_for
+from .search_engine import get_engine
+from .search_service import SEARCH_MODES, search, search_batch, semantic_search
 
 # ===== Главная и авторизация =====
 def index(request):
@@ -765,8 +775,13 @@ def dashboard(request):
                 call_command("train_grade_model", save_path="models/grade_model.pkl")
                 messages.success(request, "Модель прогноза оценок обучена.")
             elif action == "index_lectures":
-                call_command("index_lectures")
-                messages.success(request, "Индексация лекций выполнена.")
+                from .indexing_jobs import enqueue
+
+                job, created = enqueue(user=request.user)
+                if created:
+                    messages.success(request, f"Индексация лекций запущена в фоне (задача #{job.pk}).")
+                else:
+                    messages.info(request, f"Индексация лекций уже выполняется (задача #{job.pk}).")
             return redirect("dashboard")
 
         # Админский дашборд с общей статистикой
@@ -934,45 +949,22 @@ def ai_assistant(request):
         
         if query:
             try:
-                # Семантический поиск по всем лекциям
-                all_results = semantic_search(query, top_k=10)
-                
-                # Загружаем объекты лекций для результатов
-                from .models import Lecture
-                for result in all_results:
-                    lecture_id = result.get('id')
-                    if lecture_id:
-                        try:
-                            lecture = Lecture.objects.select_related('course').get(id=lecture_id)
-                            result['lecture'] = lecture
-                        except Lecture.DoesNotExist:
-                            pass
-                        except Exception:
-                            pass
-                
-                # Фильтруем по курсам студента, если есть
-                if student_courses:
-                    course_ids = [c.id for c in student_courses if c and hasattr(c, 'id')]
-                    filtered_results = []
-                    other_results = []
-                    
-                    for result in all_results:
-                        lecture = result.get('lecture')
-                        if lecture and hasattr(lecture, 'course') and lecture.course:
-                            try:
-                                if lecture.course.id in course_ids:
-                                    filtered_results.append(result)
-                                else:
-                                    other_results.append(result)
-                            except (AttributeError, TypeError):
-                                other_results.append(result)
-                        else:
-                            other_results.append(result)
-                    
-                    # Сначала показываем результаты из курсов студента
-                    search_results = filtered_results + other_results[:5]
+                course_ids = [c.id for c in student_courses if c and hasattr(c, 'id')]
+                if course_ids:
+                    # Сначала ищем только среди лекций курсов студента,
+                    # затем дополняем результатами из остальных лекций
+                    own_results = semantic_search(query, top_k=10, course_ids=course_ids)
+                    seen = {r['id'] for r in own_results}
+                    other_results = [
+                        r for r in semantic_search(query, top_k=10 + len(seen))
+                        if r['id'] not in seen
+                    ]
+                    search_results = own_results + other_results[:5]
                 else:
-                    search_results = all_results[:10]
+                    search_results = semantic_search(query, top_k=10)
+                if search_results:
+                    # Запросы с результатами попадают в подсказки строки поиска
+                    record_query(query)
             except Exception as e:
                 # Если поиск не работает, показываем пустые результаты
                 import logging
@@ -1283,7 +1275,10 @@ def course_lectures(request, pk: int):
 
 def lecture_detail(request, pk: int):
     lecture = get_object_or_404(Lecture, pk=pk)
-    related = semantic_search(lecture.title, top_k=5)
+    related = related_for(lecture, limit=5)
+    if not related:
+        # Граф ещё не построен (index_lectures не запускался) — ищем по заголовку
+        related = [r for r in semantic_search(lecture.title, top_k=6) if r["id"] != lecture.pk][:5]
     return render(
         request,
         "main/lecture_detail.html",
@@ -1464,93 +1459,69 @@ def api_predict_grade(request):
     if not student_id or not course_id:
         return JsonResponse({"detail": "Нужно указать student_id и course_id"}, status=400)
 
-    try:
-        enrollment = Enrollment.objects.get(student_id=student_id, course_id=course_id)
-    except Enrollment.DoesNotExist:
+    # Признаки — одна строка таблицы EnrollmentFeatures (см. main/grade_features.py)
+    features = grade_features.features_for(student_id, course_id)
+    if features is None:
         return JsonResponse({"detail": "Запись студента на курс не найдена"}, status=404)
 
-    # Загружаем модель
-    from pathlib import Path
-
-    model_path = Path("models/grade_model.pkl")
-    if not model_path.exists():
+    # Модель загружена в память воркера и перечитывается, только когда файл заменён
+    preds, loaded = get_registry().predict([features])
+    if loaded is None:
         return JsonResponse({"detail": "Модель ещё не обучена. Запустите train_grade_model."}, status=503)
+    pred = float(preds[0])
 
-    import joblib  # type: ignore
-
-    bundle = joblib.load(model_path)
-    model = bundle["model"]
-    scaler = bundle["scaler"]
-    feature_names = bundle["feature_names"]
-
-    # Формируем признаки по той же логике, что и в train_grade_model
-    grades_qs = Grade.objects.filter(enrollment=enrollment)
-    from django.db.models import Avg
-
-    att_qs = Attendance.objects.filter(enrollment=enrollment)
-    attendance_rate = 1.0
-    if att_qs.exists():
-        total = att_qs.count()
-        present = att_qs.filter(present=True).count()
-        attendance_rate = present / total if total else 1.0
-
-    hw_avg = grades_qs.filter(assignment_name__icontains="Домашнее").aggregate(
-        avg=Avg("value")
-    )["avg"]
-    if hw_avg is None:
-        hw_avg = grades_qs.exclude(assignment_name__icontains="Финал").aggregate(
-            avg=Avg("value")
-        )["avg"] or 0
-
-    midterm = grades_qs.filter(assignment_name__icontains="Midterm").order_by(
-        "-date"
-    ).first()
-    midterm_score = float(midterm.value) if midterm else float(hw_avg)
-
-    previous_grades = Grade.objects.filter(
-        student=enrollment.student.user if enrollment.student.user else None
-    ).exclude(course=enrollment.course)
-    if previous_grades.exists():
-        previous_gpa = float(previous_grades.aggregate(avg=Avg("value"))["avg"] or 0)
-    else:
-        previous_gpa = float(hw_avg)
-
-    features = [
-        float(attendance_rate * 100.0),
-        float(hw_avg),
-        float(midterm_score),
-        float(previous_gpa),
-    ]
-
-    x = scaler.transform([features])
-    pred = float(model.predict(x)[0])
-
-    # Простое объяснение: вклад признаков (для линейной модели)
-    contributions = {}
-    coef = getattr(model, "coef_", None)
-    if coef is not None:
-        for name, c, val in zip(feature_names, coef, features):
-            contributions[name] = float(c * val)
-        confidence = 0.8
+    # Простое объяснение: вклад признаков (для линейной модели) или важность (для деревьев)
+    contributions, confidence = loaded.explain([features])
+    if contributions is not None:
+        contributions = {name: float(v) for name, v in zip(loaded.feature_names, contributions[0])}
     else:
-        # Для деревьев используем feature_importances_
-        importances = getattr(model, "feature_importances_", None)
-        if importances is not None:
-            for name, imp in zip(feature_names, importances):
-                contributions[name] = float(imp)
-            confidence = float(max(importances) if len(importances) else 0.5)
-        else:
-            confidence = 0.5
+        contributions = {}
 
     return JsonResponse(
         {
             "predicted_final_grade": pred,
             "model_confidence": confidence,
             "feature_contributions": contributions,
+            "model_version": loaded.version,
         }
     )
 
 
+@login_required
+@staff_required
+def api_predict_grades(request):
+    """
+    Пакетный прогноз: {"course_id" | "group_id" | "specialty_id", "store"}.
+    Модель вызывается один раз на всю матрицу признаков.
+    """
+    if request.method != "POST":
+        return JsonResponse({"detail": "Только POST"}, status=405)
+    try:
+        payload = json.loads(request.body.decode("utf-8"))
+    except Exception:
+        return JsonResponse({"detail": "Некорректный JSON"}, status=400)
+
+    filters = {
+        "course": payload.get("course_id"),
+        "group": payload.get("group_id"),
+        "specialty": payload.get("specialty_id"),
+    }
+    if all(value is None for value in filters.values()):
+        return JsonResponse({"detail": "Нужно указать course_id, group_id или specialty_id"}, status=400)
+    try:
+        filters = {name: int(value) if value is not None else None for name, value in filters.items()}
+    except (TypeError, ValueError):
+        return JsonResponse({"detail": "course_id, group_id и specialty_id должны быть числами"}, status=400)
+
+    try:
+        result = grade_predictions.predict(
+            grade_predictions.enrollments_for(**filters), store=bool(payload.get("store"))
+        )
+    except grade_predictions.ModelNotTrained as exc:
+        return JsonResponse({"detail": str(exc)}, status=503)
+    return JsonResponse(result)
+
+
 def api_search_resources(request):
     if request.method != "POST":
         return JsonResponse({"detail": "Только POST"}, status=405)
@@ -1559,12 +1530,82 @@ def api_search_resources(request):
     except Exception:
         return JsonResponse({"detail": "Некорректный JSON"}, status=400)
 
-    q = (payload.get("q") or "").strip()
-    top_k = int(payload.get("top_k") or 5)
+    if "queries" in payload:
+        # Пакетная форма: {"queries": [{"q", "top_k", "course_ids", "specialty", "mode"}, ...]}
+        items = payload["queries"]
+        if not isinstance(items, list):
+            return JsonResponse({"detail": "queries должен быть списком"}, status=400)
+        queries = []
+        for i, item in enumerate(items):
+            params, error = _search_params(item if isinstance(item, dict) else {"q": item})
+            if error:
+                return JsonResponse({"detail": f"queries[{i}]: {error}"}, status=400)
+            queries.append(params)
+        try:
+            # Размер пакета ограничен settings.SEARCH_BATCH_MAX
+            return JsonResponse(search_batch(queries))
+        except ValueError as exc:
+            return JsonResponse({"detail": str(exc)}, status=400)
+
+    params, error = _search_params(payload)
+    if error:
+        return JsonResponse({"detail": error}, status=400)
+    response = search(params.pop("q"), **params)
+    return JsonResponse(response)
+
+
+@login_required
+def api_suggest(request):
+    """
+    Подсказки для строки поиска: GET ?q=<префикс>&limit=8. Отвечает из словаря
+    в памяти воркера (main.autocomplete), без обращения к поиску. Только для
+    вошедших пользователей: подсказки включают частые запросы других.
+    """
+    started = time.perf_counter()
+    q = request.GET.get("q", "")
+    try:
+        limit = max(1, min(int(request.GET.get("limit") or 8), 20))
+    except ValueError:
+        return JsonResponse({"detail": "limit должен быть числом"}, status=400)
+
+    suggester = get_engine().state().suggest
+    suggestions = suggester.suggest(q, limit) if suggester is not None else []
+    for item in suggestions:
+        if item["kind"] == "lecture":
+            item["url"] = reverse("lecture_detail", args=[item["id"]])
+        elif item["kind"] == "course":
+            item["url"] = reverse("course_detail", args=[item["id"]])
+        else:
+            item["url"] = f"{reverse('ai_assistant')}?{urlencode({'q': item['text']})}"
+    return JsonResponse(
+        {"q": q, "suggestions": suggestions, "ms": round((time.perf_counter() - started) * 1000.0, 3)}
+    )
+
+
+def _search_params(payload):
+    """
+    Разбирает параметры одного поискового запроса: (параметры, None) или (None, ошибка).
+    """
+    q = str(payload.get("q") or "").strip()
+    try:
+        top_k = int(payload.get("top_k") or 5)
+    except (TypeError, ValueError):
+        return None, "top_k должен быть числом"
     top_k = max(1, min(top_k, 20))
+    course_ids = payload.get("course_ids")
+    specialty = payload.get("specialty")
+    try:
+        if course_ids is not None:
+            course_ids = [int(c) for c in course_ids]
+        if specialty is not None:
+            specialty = int(specialty)
+    except (TypeError, ValueError):
+        return None, "course_ids и specialty должны быть числами"
 
-    results = semantic_search(q, top_k=top_k)
-    return JsonResponse({"results": results})
+    mode = payload.get("mode") or None
+    if mode is not None and mode not in SEARCH_MODES:
+        return None, f"mode: одно из {', '.join(SEARCH_MODES)}"
+    return {"q": q, "top_k": top_k, "course_ids": course_ids, "specialty": specialty, "mode": mode}, None
 
 
 @login_required
@@ -1572,7 +1613,49 @@ def api_search_resources(request):
 def api_retrain_embeddings(request):
     if request.method != "POST":
         return JsonResponse({"detail": "Только POST"}, status=405)
-    from django.core.management import call_command
+    from .indexing_jobs import enqueue, job_status
+
+    # Тело необязательно: {"full": true} — полная переиндексация, иначе только изменённые лекции
+    try:
+        payload = json.loads(request.body.decode("utf-8")) if request.body else {}
+    except Exception:
+        return JsonResponse({"detail": "Некорректный JSON"}, status=400)
+    if not isinstance(payload, dict):
+        return JsonResponse({"detail": "Ожидается JSON-объект"}, status=400)
 
-    call_command("index_lectures")
-    return JsonResponse({"detail": "Индексация лекций запущена."})
+    # index_lectures выполняется отдельным процессом, запрос не ждёт его завершения
+    options = {"full": True} if payload.get("full") is True else None
+    job, created = enqueue(user=request.user, options=options)
+    return JsonResponse(
+        {
+            "detail": "Индексация лекций запущена." if created else "Индексация лекций уже выполняется.",
+            "created": created,
+            "status_url": reverse("api_index_job_status", args=[job.pk]),
+            **job_status(job),
+        },
+        status=202,
+    )
+
+
+@login_required
+@staff_required
+def api_index_job_status(request, job_id):
+    from .indexing_jobs import job_status
+
+    job = get_object_or_404(IndexingJob, pk=job_id)
+    return JsonResponse(job_status(job))
+
+
+@login_required
+@staff_required
+def api_search_stats(request):
+    from . import search_cache
+    from .search_engine import get_engine
+
+    return JsonResponse({"engine": get_engine().stats(), "cache": search_cache.stats()})
+
+
+@login_required
+@staff_required
+def api_grade_model_stats(request):
+    return JsonResponse(get_registry().stats())
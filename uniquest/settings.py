@@ -149,6 +149,51 @@ else:
             'PORT': os.environ.get('DB_PORT', DATABASES['default']['PORT']),
         })
 
+# --- КЭШ ---
+# Кэш результатов поиска: LRU на MAX_ENTRIES записей (CULL_FREQUENCY = MAX_ENTRIES
+# вытесняет ровно одну самую старую запись) с TTL в секундах.
+SEARCH_CACHE_MAX_ENTRIES = int(os.environ.get('SEARCH_CACHE_MAX_ENTRIES', '2000'))
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'search': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'uniquest-search',
+        'TIMEOUT': int(os.environ.get('SEARCH_CACHE_TTL', '600')),
+        'OPTIONS': {
+            'MAX_ENTRIES': SEARCH_CACHE_MAX_ENTRIES,
+            'CULL_FREQUENCY': SEARCH_CACHE_MAX_ENTRIES,
+        },
+    },
+}
+
+# --- ПОИСК ---
+# Режим semantic_search: hybrid (BM25 + векторы, RRF), vector или lexical
+SEARCH_MODE = os.environ.get('SEARCH_MODE', 'hybrid')
+# Лексический этап: bm25, postgres_fts или auto (postgres_fts, если БД — PostgreSQL)
+SEARCH_LEXICAL_BACKEND = os.environ.get('SEARCH_LEXICAL_BACKEND', 'auto')
+# Векторный этап: vector (FAISS/матрица из models/), pgvector или auto
+# (vector, если index_lectures сохранил эмбеддинги в models/, иначе pgvector)
+SEARCH_VECTOR_BACKEND = os.environ.get('SEARCH_VECTOR_BACKEND', 'auto')
+# Размерность колонки pgvector (миграция 0011) — размерность модели эмбеддингов
+# (384 у all-MiniLM-L6-v2). При смене модели колонку нужно пересоздать миграцией.
+SEARCH_PGVECTOR_DIM = int(os.environ.get('SEARCH_PGVECTOR_DIM', '384'))
+# Бюджет времени этапов поиска в миллисекундах
+SEARCH_STAGE_BUDGET_MS = {
+    'bm25': int(os.environ.get('SEARCH_BM25_BUDGET_MS', '100')),
+    'postgres_fts': int(os.environ.get('SEARCH_FTS_BUDGET_MS', '100')),
+    'vector': int(os.environ.get('SEARCH_VECTOR_BUDGET_MS', '300')),
+    'pgvector': int(os.environ.get('SEARCH_PGVECTOR_BUDGET_MS', '300')),
+    'substring': int(os.environ.get('SEARCH_SUBSTRING_BUDGET_MS', '300')),
+}
+# Максимум запросов в одном пакетном запросе api_search_resources
+SEARCH_BATCH_MAX = int(os.environ.get('SEARCH_BATCH_MAX', '50'))
+# Предел числа подсказок строки поиска в памяти воркера (api/suggest/)
+SUGGEST_MAX_ENTRIES = int(os.environ.get('SUGGEST_MAX_ENTRIES', '50000'))
+# Сколько раз запрос должен быть задан, чтобы попасть в подсказки другим пользователям
+SUGGEST_MIN_QUERY_COUNT = int(os.environ.get('SUGGEST_MIN_QUERY_COUNT', '5'))
+
 # --- ПАРОЛИ ---
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
@@ -7,6 +7,7 @@ For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/wsgi/
 """
 
+import logging
 import os
 
 from django.core.wsgi import get_wsgi_application
@@ -14,3 +15,14 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'uniquest.settings')
 
 application = get_wsgi_application()
+
+# Прогрев поискового движка: модель и индекс загружаются при старте воркера,
+# а не на первом пользовательском запросе. Отключается SEARCH_WARMUP=False.
+if os.environ.get('SEARCH_WARMUP', 'True') == 'True':
+    try:
+        from main.search_engine import warm_up
+
+        warm_up()
+    except Exception:
+        # Ошибка прогрева не мешает старту: движок загрузится на первом запросе
+        logging.getLogger(__name__).exception("Search engine warm-up failed")